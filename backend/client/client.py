@@ -4,6 +4,7 @@ from typing import List, Optional, Callable
 from uuid import UUID
 
 import httpx
+from pydantic import TypeAdapter
 
 from core.config import config
 from core.exceptions import (
@@ -24,6 +25,14 @@ from shared.utils import calculate_checksum, split_into_chunks
 
 logger = logging.getLogger(__name__)
 
+# Las respuestas JSON se parsean y validan directamente desde los bytes en
+# pydantic-core: sin decodificar a str ni armar dicts intermedios
+_FILE_LIST = TypeAdapter(List[FileMetadata])
+_NODE_LIST = TypeAdapter(List[NodeInfo])
+# Los bodies JSON se serializan con model_dump_json (pydantic-core) y se envían
+# como bytes, sin pasar por dicts de model_dump ni por el json de la stdlib
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
 
 class DFSClient:
     """Representa al cliente que interactúa con el DFS"""
@@ -90,11 +99,12 @@ class DFSClient:
         try:
             response = await client.post(
                 f"{self.metadata_service_url}/api/v1/files/upload-init",
-                json=init_request.model_dump(mode="json"),
+                content=init_request.model_dump_json(),
+                headers=_JSON_HEADERS,
             )
             response.raise_for_status()
 
-            return UploadInitResponse(**response.json())
+            return UploadInitResponse.model_validate_json(response.content)
 
         except httpx.HTTPStatusError as e:
             raise DFSMetadataError(f"Error en upload-init: {e.response.text}")
@@ -201,7 +211,8 @@ class DFSClient:
         try:
             response = await client.post(
                 f"{self.metadata_service_url}/api/v1/files/commit",
-                json=commit_request.model_dump(mode="json"),
+                content=commit_request.model_dump_json(),
+                headers=_JSON_HEADERS,
             )
             response.raise_for_status()
 
@@ -248,7 +259,7 @@ class DFSClient:
             )
             response.raise_for_status()
 
-            return FileMetadata(**response.json())
+            return FileMetadata.model_validate_json(response.content)
 
         except httpx.HTTPStatusError as e:
             if e.response.status_code == 404:
@@ -311,9 +322,13 @@ class DFSClient:
         raise DFSChunkNotFoundError(f"No se pudo descargar chunk {chunk.chunk_id}")
 
     async def list_files(
-        self, prefix: Optional[str] = None, limit: int = 100
+        self, prefix: Optional[str] = None, limit: int = 100,
+        include_chunks: bool = True,
     ) -> List[FileMetadata]:
-        """Lista archivos en el DFS"""
+        """
+        Lista archivos en el DFS.
+        Con include_chunks=False el servidor no envía los chunks (lista vacía).
+        """
         try:
             async with httpx.AsyncClient(timeout=self.timeout) as client:
                 params = {}
@@ -321,13 +336,15 @@ class DFSClient:
                     params["prefix"] = prefix
                 if limit:
                     params["limit"] = limit
+                if not include_chunks:
+                    params["include_chunks"] = "false"
 
                 response = await client.get(
                     f"{self.metadata_service_url}/api/v1/files", params=params
                 )
                 response.raise_for_status()
 
-                files = [FileMetadata(**f) for f in response.json()]
+                files = _FILE_LIST.validate_json(response.content)
                 return files
 
         except httpx.HTTPStatusError as e:
@@ -365,7 +382,7 @@ class DFSClient:
                 response = await client.get(f"{self.metadata_service_url}/api/v1/nodes")
                 response.raise_for_status()
 
-                nodes = [NodeInfo(**n) for n in response.json()]
+                nodes = _NODE_LIST.validate_json(response.content)
                 return nodes
 
         except httpx.HTTPStatusError as e:
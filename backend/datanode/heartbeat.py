@@ -2,6 +2,9 @@
 
 import asyncio
 import logging
+import os
+import time
+from pathlib import Path
 from typing import List, Optional
 from uuid import UUID
 
@@ -26,6 +29,8 @@ class HeartbeatManager:
         self.task: Optional[asyncio.Task] = None
         self.consecutive_failures = 0
         self.max_failures = 3
+        # Última muestra de /proc/net/dev para calcular bytes/s enviados
+        self._last_net_sample: Optional[tuple] = None
 
     def _get_public_url(self) -> str:
         """
@@ -145,6 +150,14 @@ class HeartbeatManager:
                 "chunk_ids": [str(chunk_id) for chunk_id in chunk_ids],
             }
             
+            # Métricas de carga para la selección de destinos de replicación
+            cpu_pct = self._sample_cpu_pct()
+            if cpu_pct is not None:
+                payload["cpu_pct"] = cpu_pct
+            net_tx_bps = self._sample_net_tx_bps()
+            if net_tx_bps is not None:
+                payload["net_tx_bps"] = net_tx_bps
+
             # Agregar campos de ZeroTier si están disponibles
             if self.zerotier_ip:
                 payload["zerotier_ip"] = self.zerotier_ip
@@ -191,6 +204,44 @@ class HeartbeatManager:
             logger.error(f"Error inesperado enviando heartbeat: {e}", exc_info=True)
             return False
 
+    def _sample_cpu_pct(self) -> Optional[float]:
+        """
+        Aproxima el uso de CPU (0-100) a partir del load average de 1 minuto.
+        Devuelve None en plataformas sin getloadavg (Windows).
+        """
+        try:
+            load_1m = os.getloadavg()[0]
+        except (AttributeError, OSError):
+            return None
+        cpus = os.cpu_count() or 1
+        return min(100.0, load_1m / cpus * 100)
+
+    def _sample_net_tx_bps(self) -> Optional[float]:
+        """
+        Calcula los bytes/s enviados desde el heartbeat anterior leyendo /proc/net/dev.
+        Devuelve None en la primera muestra o si /proc no está disponible.
+        """
+        try:
+            lines = Path("/proc/net/dev").read_text().splitlines()[2:]
+        except OSError:
+            return None
+
+        tx_bytes = 0
+        for line in lines:
+            iface, _, data = line.partition(":")
+            if iface.strip() == "lo":
+                continue
+            fields = data.split()
+            if len(fields) >= 9:
+                tx_bytes += int(fields[8])
+
+        now = time.monotonic()
+        previous = self._last_net_sample
+        self._last_net_sample = (now, tx_bytes)
+        if previous is None or now <= previous[0]:
+            return None
+        return max(0.0, (tx_bytes - previous[1]) / (now - previous[0]))
+
     def _get_stored_chunk_ids(self) -> List[UUID]:
         """
         Obtiene la lista de chunks almacenados de forma segura.
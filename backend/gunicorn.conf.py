@@ -8,16 +8,42 @@ import os
 bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
 backlog = 2048
 
-# Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
+# Worker processes (regla I/O-bound: 2 * CPUs + 1, sobreescribible con WEB_CONCURRENCY)
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
 worker_class = "uvicorn.workers.UvicornWorker"
+
+# Pool de asyncpg por worker: cada worker abre su propio pool, así que el
+# presupuesto total de conexiones a Postgres (DFS_PG_CONNECTION_BUDGET, por
+# debajo de max_connections del servidor) se reparte entre los workers, con
+# tope de 32 por worker. Los workers heredan el entorno del master; valores
+# explícitos de DFS_PG_POOL_MAX / DFS_PG_POOL_MIN tienen precedencia
+if "DFS_PG_POOL_MAX" not in os.environ:
+    _pg_budget = int(os.getenv("DFS_PG_CONNECTION_BUDGET", "90"))
+    os.environ["DFS_PG_POOL_MAX"] = str(max(2, min(32, _pg_budget // workers)))
+os.environ.setdefault(
+    "DFS_PG_POOL_MIN", str(min(8, int(os.environ["DFS_PG_POOL_MAX"])))
+)
+# Los loops de fondo (replicador, barrido de nodos inactivos, limpieza de
+# leases, checkpoint del WAL) corren en un único worker: si cada worker los
+# iniciara, varios replicadores re-replicarían los mismos chunks a la vez.
+# El master designa al primer worker que hace fork (DFS_RUN_BACKGROUND=true
+# solo en ese proceso) y, si ese worker termina (max_requests, caída), al que
+# lo reemplaza.
+# DFS_RUN_BACKGROUND=false en el entorno los desactiva en todos los workers
+_run_background = os.getenv("DFS_RUN_BACKGROUND", "true").lower() == "true"
+_background_worker = None
+
+# El lifespan debe ejecutarse en cada worker para que cada uno tenga su propio
+# ServiceManager/storage; con preload_app el estado asyncio se compartiría entre forks
+preload_app = False
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 50
 timeout = 300  # 5 minutos para chunks grandes
 
 # Logging
-accesslog = "-"
+# Access log deshabilitado por defecto (MetricsMiddleware ya cuenta los requests)
+accesslog = "-" if bool(int(os.getenv("UVICORN_ACCESS_LOG", "0"))) else None
 errorlog = "-"
 loglevel = os.getenv("LOG_LEVEL", "info").lower()
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(D)s'
@@ -49,6 +75,26 @@ def when_ready(server):
 def on_exit(server):
     print("Shutting down DFS Metadata Service")
 
+def pre_fork(server, worker):
+    # En el master, antes del fork: designa el worker de los loops de fondo
+    global _background_worker
+    if _run_background and _background_worker is None:
+        _background_worker = worker
+
+def post_fork(server, worker):
+    # Ya en el worker, antes de cargar la app (y core.config). El entorno del
+    # master no se toca: un reload vuelve a leer el valor original
+    os.environ["DFS_RUN_BACKGROUND"] = "true" if worker is _background_worker else "false"
+
+def child_exit(server, worker):
+    global _background_worker
+    if worker is _background_worker:
+        _background_worker = None
+    # Con PROMETHEUS_MULTIPROC_DIR, descarta los gauges "live" del worker que termina
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
 # Request limits - CRÍTICO para chunks grandes
 limit_request_line = 8190  # Línea de request (URL)
 limit_request_fields = 100  # Número de headers
@@ -61,7 +61,7 @@ async def upload_init(request: UploadInitRequest):
     
     try:
         # Verificar si el archivo ya existe
-        existing_file = await storage.get_file_by_path(request.path)
+        existing_file = await storage.get_file_by_path(request.path, load_chunks=False)
         if existing_file:
             # Si el archivo existe y NO se permite sobrescritura, devolver error indicando que existe
             if not request.overwrite:
@@ -148,17 +148,20 @@ async def commit_upload(request: CommitRequest):
     storage = get_storage()
 
     try:
-        # Validar replicación de chunks
-        under_replicated_chunks = []
-        for chunk_info in request.chunks:
-            if len(chunk_info.nodes) < config.replication_factor:
-                under_replicated_chunks.append(
-                    {
-                        "chunk_id": chunk_info.chunk_id,
-                        "current_replicas": len(chunk_info.nodes),
-                        "expected_replicas": config.replication_factor,
-                    }
-                )
+        # Validar replicación de chunks: una sola pasada calcula el conteo por chunk
+        # y solo se materializan dicts para los (pocos) chunks sub-replicados
+        replication_factor = config.replication_factor
+        replica_counts = [len(chunk_info.nodes) for chunk_info in request.chunks]
+        total_replicas = sum(replica_counts)
+        under_replicated_chunks = [
+            {
+                "chunk_id": chunk_info.chunk_id,
+                "current_replicas": count,
+                "expected_replicas": replication_factor,
+            }
+            for chunk_info, count in zip(request.chunks, replica_counts)
+            if count < replication_factor
+        ]
 
         if under_replicated_chunks:
             logger.warning(
@@ -178,7 +181,6 @@ async def commit_upload(request: CommitRequest):
         record_upload_operation(True)
 
         # Stats
-        total_replicas = sum(len(c.nodes) for c in request.chunks)
         logger.info(
             f"Commit exitoso: {len(request.chunks)} chunks, {total_replicas} réplicas"
         )
@@ -209,7 +211,7 @@ async def get_file_metadata(path: str):
     from urllib.parse import unquote
     decoded_path = unquote(path)
     
-    logger.debug(f"Get file metadata - Original: {path}, Decoded: {decoded_path}")
+    logger.debug("Get file metadata - Original: %s, Decoded: %s", path, decoded_path)
 
     storage = get_storage()
 
@@ -241,13 +243,22 @@ async def list_files(
     prefix: Optional[str] = Query(None, description="Filtrar por prefijo"),
     limit: int = Query(100, description="Límite de resultados", ge=1, le=1000),
     offset: int = Query(0, description="Offset para paginación", ge=0),
+    include_chunks: bool = Query(
+        True, description="Incluir la lista de chunks (false: solo columnas del archivo)"
+    ),
 ):
     """Lista archivos con paginación y filtros"""
-    logger.debug(f"List files: prefix={prefix}, limit={limit}, offset={offset}")
+    logger.debug(
+        "List files: prefix=%s, limit=%s, offset=%s, include_chunks=%s",
+        prefix, limit, offset, include_chunks,
+    )
 
     storage = get_storage()
 
     try:
+        if not include_chunks:
+            # Listado tipo directorio: no se leen chunks ni réplicas
+            return await storage.list_files_summary(prefix=prefix, limit=limit, offset=offset)
         files = await storage.list_files(prefix=prefix, limit=limit, offset=offset)
         return files
     except Exception as e:
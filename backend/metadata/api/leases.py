@@ -33,7 +33,7 @@ async def acquire_lease(request: LeaseRequest):
     Adquiere un lease exclusivo para una operación sobre un archivo.
     Los leases previenen escrituras concurrentes al mismo archivo.
     """
-    logger.debug(f"Acquire lease: {request.path}, operation={request.operation}")
+    logger.debug("Acquire lease: %s, operation=%s", request.path, request.operation)
 
     lease_mgr = get_lease_manager()
 
@@ -50,7 +50,7 @@ async def acquire_lease(request: LeaseRequest):
                 detail=f"No se pudo adquirir lease para {request.path}",
             )
 
-        logger.debug(f"Lease adquirido: {lease.lease_id} para {request.path}")
+        logger.debug("Lease adquirido: %s para %s", lease.lease_id, request.path)
         return lease
 
     except HTTPException:
@@ -69,7 +69,7 @@ async def release_lease(lease_id: UUID, path: Optional[str] = None):
     Libera un lease previamente adquirido.
     Permite que otros clientes adquieran leases sobre el mismo archivo.
     """
-    logger.debug(f"Release lease: {lease_id}")
+    logger.debug("Release lease: %s", lease_id)
 
     lease_mgr = get_lease_manager()
 
@@ -81,7 +81,7 @@ async def release_lease(lease_id: UUID, path: Optional[str] = None):
                 detail=f"Lease no encontrado: {lease_id}",
             )
 
-        logger.debug(f"Lease liberado: {lease_id}")
+        logger.debug("Lease liberado: %s", lease_id)
         return {"status": "released", "lease_id": str(lease_id)}
 
     except HTTPException:
@@ -104,7 +104,7 @@ async def renew_lease(
     Renueva un lease existente, extendiendo su tiempo de vida.
     Útil para operaciones de larga duración.
     """
-    logger.debug(f"Renew lease: {lease_id}, extension={extension_seconds}s")
+    logger.debug("Renew lease: %s, extension=%ss", lease_id, extension_seconds)
 
     lease_mgr = get_lease_manager()
 
@@ -116,7 +116,7 @@ async def renew_lease(
                 detail=f"Lease no encontrado o expirado: {lease_id}",
             )
 
-        logger.debug(f"Lease renovado: {lease_id}")
+        logger.debug("Lease renovado: %s", lease_id)
         return {
             "status": "renewed",
             "lease_id": str(lease_id),
@@ -5,27 +5,23 @@ API Router para operaciones de nodos
 import logging
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, status, Request, Header
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Header
+from pydantic import TypeAdapter
 
 from shared import HeartbeatRequest, NodeInfo, RegisterRequest
+from shared.protocols import MetadataStorageBase
 
 from core.config import config
+from metadata import context
+from metadata.context import Storage, require_storage
+from metadata.cache import etag_response, node_list_cache, system_stats_cache
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-
-def get_storage():
-    """Dependency para obtener storage instance"""
-    from metadata import context
-
-    if not context.storage:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Storage no inicializado",
-        )
-    return context.storage
+# Serializa el listado con el esquema de NodeInfo, para calcular el ETag del cuerpo
+_NODE_LIST = TypeAdapter(List[NodeInfo])
 
 
 @router.post("/nodes/heartbeat")
@@ -34,89 +30,81 @@ async def node_heartbeat(request: HeartbeatRequest):
     Recibe heartbeat de un DataNode.
     Actualiza el estado del nodo y su inventario de chunks.
     """
-    logger.debug(f"Heartbeat: {request.node_id}, chunks={len(request.chunk_ids)}")
+    logger.debug("Heartbeat: %s, chunks=%d", request.node_id, len(request.chunk_ids))
     
     # Log adicional para depuración de ZeroTier
     if request.zerotier_ip:
-        logger.info(f"Heartbeat con ZeroTier IP: {request.zerotier_ip} (node: {request.node_id})")
+        logger.info("Heartbeat con ZeroTier IP: %s (node: %s)", request.zerotier_ip, request.node_id)
     if request.url:
-        logger.debug(f"URL pública: {request.url}")
-
-    storage = get_storage()
-
-    try:
-        # Actualizar heartbeat con información adicional
-        await storage.update_node_heartbeat(
-            node_id=request.node_id,
-            free_space=request.free_space,
-            total_space=request.total_space,
-            chunk_ids=request.chunk_ids,
-            zerotier_ip=request.zerotier_ip,
-            zerotier_node_id=request.zerotier_node_id,
-            url=request.url,
-        )
+        logger.debug("URL pública: %s", request.url)
 
+    # Camino rápido: el heartbeat se coalesce en el buffer y el ServiceManager
+    # lo vuelca al storage en lote (last-write-wins por nodo)
+    heartbeat_buffer = context.get_heartbeat_buffer()
+    if heartbeat_buffer is not None:
+        heartbeat_buffer[request.node_id] = request
         return {"status": "ok", "node_id": request.node_id}
 
-    except Exception as e:
-        logger.error(f"Error procesando heartbeat: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error interno del servidor: {str(e)}",
-        )
-
-
-@router.get("/nodes", response_model=List[NodeInfo])
-async def list_nodes():
+    storage = require_storage()
+
+    # Errores inesperados los atiende el exception handler global (500)
+    await storage.update_node_heartbeat(
+        node_id=request.node_id,
+        free_space=request.free_space,
+        total_space=request.total_space,
+        chunk_ids=request.chunk_ids,
+        zerotier_ip=request.zerotier_ip,
+        zerotier_node_id=request.zerotier_node_id,
+        url=request.url,
+        cpu_pct=request.cpu_pct,
+        net_tx_bps=request.net_tx_bps,
+    )
+    node_list_cache.invalidate()
+
+    return {"status": "ok", "node_id": request.node_id}
+
+
+# Sin response_model: devuelve el cuerpo ya serializado (o un 304); el esquema
+# queda documentado en responses
+@router.get(
+    "/nodes",
+    responses={
+        200: {"model": List[NodeInfo]},
+        304: {"description": "El listado no cambió desde el ETag del cliente"},
+    },
+)
+async def list_nodes(
+    request: Request,
+    storage: MetadataStorageBase = Depends(Storage),
+):
     """
     Lista todos los nodos registrados.
     Incluye nodos activos, inactivos y en cuarentena.
+    Responde 304 si el ETag del cliente coincide con el del listado actual.
     """
     logger.debug("List nodes")
 
-    storage = get_storage()
-
-    try:
-        nodes = await storage.list_nodes()
-        return nodes
-
-    except Exception as e:
-        logger.error(f"Error listando nodos: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error interno del servidor: {str(e)}",
-        )
+    nodes = await node_list_cache.get_or_refresh(storage.list_nodes)
+    return etag_response(request, _NODE_LIST.dump_json(nodes))
 
 
 @router.get("/nodes/{node_id}", response_model=NodeInfo)
-async def get_node(node_id: str):
+async def get_node(node_id: str, storage: MetadataStorageBase = Depends(Storage)):
     """
     Obtiene información detallada de un nodo específico.
     Incluye estado, capacidad y chunks almacenados.
     """
-    logger.debug(f"Get node: {node_id}")
-
-    storage = get_storage()
+    logger.debug("Get node: %s", node_id)
 
-    try:
-        node = await storage.get_node(node_id)
-        if not node:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Nodo no encontrado: {node_id}",
-            )
-
-        return node
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error obteniendo nodo: {e}")
+    node = await storage.get_node(node_id)
+    if not node:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error interno del servidor: {str(e)}",
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Nodo no encontrado: {node_id}",
         )
 
+    return node
+
 
 @router.delete("/nodes/{node_id}")
 async def deactivate_node(node_id: str):
@@ -126,7 +114,7 @@ async def deactivate_node(node_id: str):
     """
     logger.info(f"Deactivate node: {node_id}")
 
-    storage = get_storage()
+    storage = require_storage()
 
     try:
         node = await storage.get_node(node_id)
@@ -181,7 +169,7 @@ async def register_node(request: RegisterRequest, http_request: Request, authori
             logger.warning("Registro rechazado por token inválido: %s", request.node_id)
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid bootstrap token")
 
-    storage = get_storage()
+    storage = require_storage()
     try:
         # Preparar listening_ports incluyendo data_port si se proporciona
         listening_ports = request.listening_ports or {}
@@ -209,6 +197,9 @@ async def register_node(request: RegisterRequest, http_request: Request, authori
             lease_ttl=request.lease_ttl,
             boot_token=token,
         )
+        node_list_cache.invalidate()
+        # Un nodo nuevo cambia los totales de nodos/capacidad
+        system_stats_cache.invalidate()
 
         # Auto-authorize en ZeroTier (opcional) - usar httpx async en lugar de requests
         if getattr(config, "zerotier_api_token", None) and request.zerotier_node_id:
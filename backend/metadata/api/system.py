@@ -4,71 +4,78 @@ API Router para operaciones del sistema
 
 import asyncio
 import logging
+import time
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, HTTPException, status
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 
 from core.config import config
-from monitoring.metrics import metrics_endpoint
-from shared import HealthResponse, SystemStats
+from metadata import context
+from metadata.context import Storage, require_storage
+from metadata.cache import etag_response, node_list_cache, system_stats_cache
+from shared import HealthResponse, NodeState, SystemStats
+from shared.protocols import MetadataStorageBase
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
-def get_storage():
-    """Dependency para obtener storage instance"""
-    from metadata import context
-
-    if not context.storage:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Storage no inicializado",
-        )
-    return context.storage
-
-
 def get_replicator():
     """Dependency para obtener replicator instance"""
-    from metadata import context
-
     return context.replicator
 
 
 def get_lease_manager():
     """Dependency para obtener lease manager instance"""
-    from metadata import context
-
     return context.lease_manager
 
 
+def build_root_payload() -> bytes:
+    """
+    Serializa el payload del endpoint raíz.
+    Se llama una vez en el lifespan (tras inicializar servicios); el timestamp
+    corresponde al momento del arranque.
+    """
+    return orjson.dumps(
+        {
+            "service": "DFS Metadata Service",
+            "version": "1.0.0",
+            "status": "running",
+            "storage_initialized": context.storage is not None,
+            "replicator_initialized": context.replicator is not None,
+            "lease_manager_initialized": context.lease_manager is not None,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "endpoints": {
+                "api_docs": "/docs",
+                "health": "/api/v1/health",
+                "metrics": "/metrics",
+                "files": "/api/v1/files",
+                "nodes": "/api/v1/nodes",
+                "leases": "/api/v1/leases",
+                "stats": "/api/v1/stats",
+            },
+        }
+    )
+
+
 @router.get("/")
-async def root():
+async def root(request: Request):
     """
     Endpoint raíz del servicio.
     Proporciona información básica y enlaces a recursos principales.
     """
-    from metadata import context
+    root_bytes = getattr(request.app.state, "root_bytes", None)
+    if root_bytes is None:
+        # Aún no se ejecutó el lifespan: se construye al vuelo
+        root_bytes = build_root_payload()
+    return Response(content=root_bytes, media_type="application/json")
 
-    return {
-        "service": "DFS Metadata Service",
-        "version": "1.0.0",
-        "status": "running",
-        "storage_initialized": context.storage is not None,
-        "replicator_initialized": context.replicator is not None,
-        "lease_manager_initialized": context.lease_manager is not None,
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "endpoints": {
-            "api_docs": "/docs",
-            "health": "/api/v1/health",
-            "metrics": "/metrics",
-            "files": "/api/v1/files",
-            "nodes": "/api/v1/nodes",
-            "leases": "/api/v1/leases",
-            "stats": "/api/v1/stats",
-        },
-    }
+
+# Resultado compartido del health check profundo (singleflight con TTL corto)
+_health_cache = {"ts": 0.0, "resp": None}
+_health_lock = asyncio.Lock()
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -76,14 +83,38 @@ async def health_check():
     """
     Health check completo del servicio.
     Verifica estado de nodos, replicación y servicios críticos.
+    Los probes concurrentes dentro de health_cache_ttl_s comparten un único cálculo.
     """
+    ttl = config.health_cache_ttl_s
+    if time.monotonic() - _health_cache["ts"] < ttl:
+        return _health_cache["resp"]
+
+    async with _health_lock:
+        # Otro probe pudo haberlo calculado mientras esperábamos el lock
+        if time.monotonic() - _health_cache["ts"] < ttl:
+            return _health_cache["resp"]
+
+        response = await _compute_health()
+        _health_cache["resp"] = response
+        _health_cache["ts"] = time.monotonic()
+        return response
+
+
+async def _compute_health() -> HealthResponse:
+    """Calcula el estado de salud consultando el storage"""
     try:
-        storage = get_storage()
+        storage = require_storage()
 
         # Verificar estado de nodos (sin await para evitar bloqueos)
         try:
-            nodes = await asyncio.wait_for(storage.list_nodes(), timeout=2.0)
-            active_nodes = [n for n in nodes if n.state.value == "active"]
+            nodes = await asyncio.wait_for(
+                node_list_cache.get_or_refresh(storage.list_nodes), timeout=2.0
+            )
+            # Solo se necesita el conteo: no se materializa una lista intermedia
+            active_count = 0
+            for n in nodes:
+                if n.state == NodeState.ACTIVE:
+                    active_count += 1
         except asyncio.TimeoutError:
             logger.warning("Timeout obteniendo lista de nodos en health check")
             return HealthResponse(
@@ -95,14 +126,14 @@ async def health_check():
             )
 
         status_value = "healthy"
-        if len(active_nodes) < config.replication_factor:
+        if active_count < config.replication_factor:
             status_value = "degraded"
-        elif len(active_nodes) == 0:
+        elif active_count == 0:
             status_value = "unhealthy"
 
         details = {
             "total_nodes": len(nodes),
-            "active_nodes": len(active_nodes),
+            "active_nodes": active_count,
             "replication_factor": config.replication_factor,
             "timestamp": datetime.now(timezone.utc).isoformat(),
         }
@@ -119,52 +150,37 @@ async def health_check():
         return HealthResponse(status="unhealthy", details={"error": str(e)})
 
 
-@router.get("/stats")
-async def get_system_stats():
+@router.get(
+    "/stats",
+    responses={
+        200: {"model": SystemStats},
+        304: {"description": "Las estadísticas no cambiaron desde el ETag del cliente"},
+    },
+)
+async def get_system_stats(
+    request: Request,
+    storage: MetadataStorageBase = Depends(Storage),
+):
     """
     Obtiene estadísticas detalladas del sistema.
     Incluye métricas de archivos, nodos, replicación y leases.
+    Responde 304 si el ETag del cliente coincide con el de las estadísticas actuales.
     """
-    storage = get_storage()
-
-    if not storage:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Storage no inicializado",
-        )
-
-    try:
-        stats = await storage.get_system_stats()
+    # Copia: el dict cacheado se comparte entre requests y aquí se le agregan claves
+    stats = dict(await system_stats_cache.get_or_refresh(storage.get_system_stats))
 
-        # Agregar información de replicación
-        replicator = get_replicator()
-        if replicator:
-            replication_stats = replicator.get_stats()
-            stats["replication"] = replication_stats
+    # Agregar información de replicación
+    replicator = get_replicator()
+    if replicator:
+        stats["replication"] = replicator.get_stats()
 
-        # Agregar información de leases
-        lease_mgr = get_lease_manager()
-        if lease_mgr:
-            lease_stats = lease_mgr.get_lease_stats()
-            stats["leases"] = lease_stats
+    # Agregar información de leases
+    lease_mgr = get_lease_manager()
+    if lease_mgr:
+        stats["leases"] = lease_mgr.get_lease_stats()
 
-        return SystemStats(**stats)
-
-    except Exception as e:
-        logger.error(f"Error obteniendo stats del sistema: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error interno del servidor: {str(e)}",
-        )
-
-
-@router.get("/metrics")
-async def metrics():
-    """
-    Endpoint de métricas en formato Prometheus.
-    Expone métricas de rendimiento, uso de recursos y operaciones.
-    """
-    return metrics_endpoint()
+    # El ETag se calcula sobre el cuerpo serializado: cubre todo lo que se devuelve
+    return etag_response(request, SystemStats(**stats).model_dump_json().encode())
 
 
 @router.get("/config")
@@ -194,7 +210,7 @@ async def cleanup_orphaned_data():
     """
     logger.info("Cleanup de datos huérfanos iniciado")
 
-    storage = get_storage()
+    storage = require_storage()
 
     if not storage:
         raise HTTPException(
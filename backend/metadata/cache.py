@@ -0,0 +1,77 @@
+"""
+Caches en memoria (por worker) para lecturas frecuentes del Metadata Service
+"""
+
+import asyncio
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, TypeVar
+
+from fastapi import Request, Response
+
+from core.config import config
+from shared.models import NodeInfo
+
+# Ventana corta: los dashboards que sondean cada segundo reutilizan la respuesta
+CACHE_CONTROL = "public, max-age=1"
+
+
+T = TypeVar("T")
+
+
+class TTLCache(Generic[T]):
+    """
+    Cache de un único valor con TTL corto.
+    Las ráfagas de lecturas dentro de la ventana del TTL comparten una sola
+    consulta al storage; el lock evita refrescos duplicados.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._expiry: float = 0.0
+        self._value: Optional[T] = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._value is not None and time.monotonic() < self._expiry
+
+    async def get_or_refresh(self, loader: Callable[[], Awaitable[T]]) -> T:
+        """Devuelve el valor cacheado o lo recarga con `loader` si expiró"""
+        if self._fresh():
+            return self._value  # type: ignore[return-value]
+
+        async with self._lock:
+            # Otro caller pudo haber refrescado mientras esperábamos el lock
+            if self._fresh():
+                return self._value  # type: ignore[return-value]
+
+            value = await loader()
+            self._value = value
+            self._expiry = time.monotonic() + self.ttl_seconds
+            return value
+
+    def invalidate(self) -> None:
+        """Fuerza la recarga en la próxima lectura (p. ej. tras un heartbeat)"""
+        self._expiry = 0.0
+
+
+# Instancias globales (una por worker)
+# Listado de nodos de /api/v1/nodes y del health check
+node_list_cache: TTLCache[List[NodeInfo]] = TTLCache(config.node_list_cache_ttl_ms / 1000)
+# Agregados de get_system_stats para /api/v1/stats (dashboards que sondean seguido)
+system_stats_cache: TTLCache[Dict[str, Any]] = TTLCache(config.stats_cache_ttl_ms / 1000)
+
+
+def etag_response(request: Request, body: bytes) -> Response:
+    """
+    Respuesta JSON con un ETag débil derivado del hash del cuerpo ya serializado.
+    Así el ETag es el mismo en todos los workers y cambia con cualquier campo de
+    la respuesta; si coincide con If-None-Match se devuelve un 304 sin cuerpo.
+    """
+    etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -3,9 +3,11 @@ Contexto compartido para servicios del Metadata Service
 Este módulo mantiene referencias globales a los servicios inicializados
 """
 
-from typing import Optional
+from typing import Dict, Optional
 import httpx
+from fastapi import HTTPException, status
 
+from shared.models import HeartbeatRequest
 from shared.protocols import MetadataStorageBase
 from metadata.replicator import ReplicationManager
 from metadata.leases import LeaseManager
@@ -14,6 +16,8 @@ from metadata.leases import LeaseManager
 storage: Optional[MetadataStorageBase] = None
 replicator: Optional[ReplicationManager] = None
 lease_manager: Optional[LeaseManager] = None
+# Buffer de heartbeats pendientes de volcar (node_id -> último heartbeat)
+heartbeat_buffer: Optional[Dict[str, HeartbeatRequest]] = None
 
 # Cliente HTTP compartido con connection pooling
 _http_client: Optional[httpx.AsyncClient] = None
@@ -37,11 +41,35 @@ def set_lease_manager(instance: Optional[LeaseManager]) -> None:
     lease_manager = instance
 
 
+def set_heartbeat_buffer(buffer: Optional[Dict[str, HeartbeatRequest]]) -> None:
+    """Establece el buffer de heartbeats"""
+    global heartbeat_buffer
+    heartbeat_buffer = buffer
+
+
 def get_storage() -> Optional[MetadataStorageBase]:
     """Obtiene la instancia de storage"""
     return storage
 
 
+def require_storage() -> MetadataStorageBase:
+    """Obtiene la instancia de storage o responde 503 si aún no se inicializó"""
+    if storage is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Storage no inicializado",
+        )
+    return storage
+
+
+async def Storage() -> MetadataStorageBase:
+    """
+    Dependency de FastAPI para los routers (async: se resuelve en el event
+    loop, sin threadpool). FastAPI la evalúa una sola vez por request.
+    """
+    return require_storage()
+
+
 def get_replicator() -> Optional[ReplicationManager]:
     """Obtiene la instancia de replicator"""
     return replicator
@@ -52,6 +80,11 @@ def get_lease_manager() -> Optional[LeaseManager]:
     return lease_manager
 
 
+def get_heartbeat_buffer() -> Optional[Dict[str, HeartbeatRequest]]:
+    """Obtiene el buffer de heartbeats"""
+    return heartbeat_buffer
+
+
 def get_http_client() -> httpx.AsyncClient:
     """Obtiene el cliente HTTP compartido con connection pooling"""
     global _http_client
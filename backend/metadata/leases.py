@@ -2,11 +2,13 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, List
 from uuid import UUID
 
 from core.exceptions import DFSLeaseConflictError
+from monitoring.metrics import update_lease_metrics
 from shared.models import (
     LeaseResponse,
 )
@@ -25,6 +27,19 @@ class LeaseManager:
         # `LeaseInfo` es una forward reference pero `from __future__ import annotations` permite usarla directamente aquí.
         self.local_leases: Dict[str, LeaseInfo] = {}
         self.lock = asyncio.Lock()
+        # Contador mantenido en cada alta/baja de lease local (O(1) para métricas)
+        self._active_leases = 0
+
+    @property
+    def active_lease_count(self) -> int:
+        """Número de leases locales registrados (sin recorrer el diccionario)"""
+        return self._active_leases
+
+    def _adjust_active_leases(self, delta: int) -> None:
+        """Actualiza el contador y el gauge de Prometheus en el mismo evento"""
+        if delta:
+            self._active_leases += delta
+            update_lease_metrics(self._active_leases)
 
     async def acquire_lease(
         self,
@@ -47,6 +62,7 @@ class LeaseManager:
                 else:
                     # Elimina el lease expirado
                     del self.local_leases[path]
+                    self._adjust_active_leases(-1)
 
             # Intenta adquirir lease en el storage
             lease_response = await self.storage.acquire_lease(
@@ -66,6 +82,7 @@ class LeaseManager:
             )
 
             self.local_leases[path] = lease_info
+            self._adjust_active_leases(1)
             logger.info(f"Lease adquirido: {path} (ID: {lease_response.lease_id})")
 
             return lease_response
@@ -82,6 +99,7 @@ class LeaseManager:
             if path and path in self.local_leases:
                 if self.local_leases[path].lease_id == lease_id:
                     del self.local_leases[path]
+                    self._adjust_active_leases(-1)
                     logger.info(f"Lease local liberado: {path}")
 
             if success:
@@ -145,7 +163,7 @@ class LeaseManager:
         Obtiene la lista de leases activos.
         """
         async with self.lock:
-            now = datetime.now(timezone.utc)
+            now = time.time()
             active_leases: List[LeaseInfo] = []
             expired_paths: List[str] = []
 
@@ -158,24 +176,26 @@ class LeaseManager:
 
             for p in expired_paths:
                 del self.local_leases[p]
+            self._adjust_active_leases(-len(expired_paths))
 
             return active_leases
 
     async def cleanup_expired_leases(self):
         """Limpia leases expirados localmente"""
         async with self.lock:
-            now = datetime.now(timezone.utc)
+            now = time.time()
             expired_paths = [
                 p for p, li in self.local_leases.items() if li.is_expired(now)
             ]
 
             for path in expired_paths:
                 del self.local_leases[path]
-                logger.debug(f"Lease local expirado limpiado: {path}")
+                logger.debug("Lease local expirado limpiado: %s", path)
+            self._adjust_active_leases(-len(expired_paths))
 
     def get_lease_stats(self) -> Dict:
         """Obtiene estadísticas de leases."""
-        now = datetime.now(timezone.utc)
+        now = time.time()
         total_leases = len(self.local_leases)
         active_leases = sum(
             1
@@ -194,6 +214,17 @@ class LeaseManager:
 class LeaseInfo:
     """Información de un lease local"""
 
+    # Una instancia por lease vivo: sin __dict__ por objeto
+    __slots__ = (
+        "lease_id",
+        "path",
+        "operation",
+        "client_id",
+        "expires_at",
+        "created_at",
+        "_expires_ts",
+    )
+
     def __init__(
         self,
         lease_id: UUID,
@@ -212,23 +243,23 @@ class LeaseInfo:
             datetime.now(timezone.utc) + timedelta(seconds=timeout_seconds)
         )
         self.created_at: datetime = datetime.now(timezone.utc)
+        # Vencimiento como epoch (segundos): las verificaciones de expiración
+        # son una comparación de floats contra time.time(), sin crear datetimes
+        self._expires_ts: float = self.expires_at.timestamp()
 
     def is_valid(self) -> bool:
         """Verifica si el lease es válido."""
-        return self.expires_at > datetime.now(timezone.utc)
+        return self._expires_ts > time.time()
 
-    def is_expired(self, now: Optional[datetime] = None) -> bool:
-        """Verifica si el lease ha expirado"""
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        """Verifica si el lease ha expirado (`now` en segundos epoch, time.time())"""
         if now is None:
-            now = datetime.now(timezone.utc)
-        return self.expires_at <= now
+            now = time.time()
+        return self._expires_ts <= now
 
     def time_remaining(self) -> float:
         """Obtiene el tiempo restante del lease en segundos."""
-        now = datetime.now(timezone.utc)
-        if self.is_expired(now):
-            return 0.0
-        return (self.expires_at - now).total_seconds()
+        return max(0.0, self._expires_ts - time.time())
 
     def to_dict(self) -> Dict:
         """Convierte a diccionario"""
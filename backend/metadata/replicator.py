@@ -1,7 +1,8 @@
 import asyncio
 import logging
 from collections import defaultdict
-from typing import List, Dict, Set, Optional
+from contextlib import aclosing
+from typing import AsyncIterable, List, Dict, Set, Optional
 from uuid import UUID
 
 import httpx
@@ -57,11 +58,12 @@ class ReplicationManager(ReplicationProtocol):
         self.storage = storage
         self.replication_factor = replication_factor or config.replication_factor
         self.running = False
-        self.task: asyncio.Task
+        self.task: Optional[asyncio.Task] = None
         self.check_interval = 30  # segundos
         self.rebalancing_strategy = "hybrid"  # Estrategia de rebalanceo: "variance", "load", "rack_aware", "hybrid"
         self.variance_threshold = 0.3  # Umbral para rebalanceo basado en varianza
         self.max_rebalance_per_cycle = 50  # Limitar rebalanceos por ciclo
+        self.max_target_cpu_pct = 85.0  # Nodos por encima de este % de CPU no reciben réplicas en este ciclo
         
         # Configuración de rebalanceo
         self.enable_rebalancing = enable_rebalancing
@@ -91,15 +93,21 @@ class ReplicationManager(ReplicationProtocol):
 
     async def _replication_loop(self):
         """Loop principal de replicación"""
+        loop = asyncio.get_running_loop()
+        # Ancla los ciclos a loop.time(): el período es check_interval, no sleep + trabajo
+        next_tick = loop.time()
+
         while self.running:
             try:
                 await self.check_and_replicate()
-                await asyncio.sleep(self.check_interval)
+                next_tick += self.check_interval
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error en replication loop: {e}")
                 await asyncio.sleep(5)  # Esperar antes de reintentar
+                next_tick = loop.time()
 
     async def check_and_replicate(self):
         """
@@ -108,25 +116,35 @@ class ReplicationManager(ReplicationProtocol):
         logger.info("Verificando estado de replicación...")
 
         try:
-            # Obtener todos los archivos
-            files = await self.storage.list_files(limit=1000)
-
             # Obtener nodos activos
             active_nodes = await self.storage.get_active_nodes()
             active_node_ids = {node.node_id for node in active_nodes}
 
-            logger.info(f"Archivos: {len(files)}, Nodos activos: {len(active_nodes)}")
-
-            # Encontrar chunks que necesitan replicación
-            chunks_to_replicate = await self._find_chunks_needing_replication(
-                files, active_node_ids, active_nodes
-            )
+            # Encontrar chunks que necesitan replicación; los archivos se recorren
+            # en streaming y solo quedan en memoria los que tienen chunks a replicar.
+            # aclosing cierra el iterador aunque el recorrido termine antes o falle:
+            # en Postgres libera en el acto la conexión del pool que tiene el cursor
+            async with aclosing(self.storage.iter_files(limit=1000)) as files:
+                chunks_to_replicate = await self._find_chunks_needing_replication(
+                    files, active_node_ids, active_nodes
+                )
 
             if chunks_to_replicate:
                 logger.warning(
                     f"Encontrados {len(chunks_to_replicate)} chunks que necesitan replicación"
                 )
-                await self._replicate_chunks(chunks_to_replicate, active_nodes)
+                # Los nodos saturados siguen contando como réplicas sanas, pero no
+                # reciben copias nuevas en este ciclo (se reconsideran en el siguiente)
+                target_nodes = [
+                    node for node in active_nodes
+                    if node.cpu_pct <= self.max_target_cpu_pct
+                ]
+                skipped = len(active_nodes) - len(target_nodes)
+                if skipped:
+                    logger.info(
+                        f"Omitiendo {skipped} nodos con CPU > {self.max_target_cpu_pct}% como destino"
+                    )
+                await self._replicate_chunks(chunks_to_replicate, target_nodes)
             else:
                 logger.info("No se encontraron chunks que necesiten replicación")
 
@@ -134,24 +152,39 @@ class ReplicationManager(ReplicationProtocol):
             logger.error(f"Error verificando replicación: {e}")
 
     async def _find_chunks_needing_replication(
-        self, files: List, active_node_ids: Set[str], active_nodes: List
+        self, files: AsyncIterable, active_node_ids: Set[str], active_nodes: List
     ) -> List[Dict]:
         """
         Encuentra chunks que necesitan replicación o rebalanceo.
         """
         chunks_to_replicate = []
+        needed_replicas = self.replication_factor
 
-        for file_metadata in files:
+        # Asigna a cada nodo activo un bit (índice denso 0..N) para contar réplicas
+        # sanas con operaciones sobre enteros en lugar de sets de strings por chunk
+        node_bits = {node_id: 1 << i for i, node_id in enumerate(active_node_ids)}
+
+        file_count = 0
+        async for file_metadata in files:
+            file_count += 1
             for chunk in file_metadata.chunks:
+                replica_mask = 0
+                for r in chunk.replicas:
+                    if r.state == ChunkState.COMMITTED:
+                        replica_mask |= node_bits.get(r.node_id, 0)
+
+                current_replicas = replica_mask.bit_count()
+
+                # Chunk sano y sin rebalanceo: no hace falta materializar réplicas
+                if current_replicas >= needed_replicas and not self.enable_rebalancing:
+                    continue
+
                 healthy_replicas = [
                     r
                     for r in chunk.replicas
-                    if r.state == ChunkState.COMMITTED and r.node_id in active_node_ids
+                    if r.state == ChunkState.COMMITTED and r.node_id in node_bits
                 ]
 
-                current_replicas = len(healthy_replicas)
-                needed_replicas = self.replication_factor
-
                 # Caso 1: Replicación insuficiente (prioridad alta)
                 if current_replicas < needed_replicas:
                     chunks_to_replicate.append(
@@ -210,6 +243,8 @@ class ReplicationManager(ReplicationProtocol):
                             }
                         )
 
+        logger.info(f"Archivos: {file_count}, Nodos activos: {len(active_nodes)}")
+
         # Ordenar por prioridad (replicación antes que rebalanceo)
         chunks_to_replicate.sort(key=lambda x: x["priority"])
         
@@ -344,31 +379,33 @@ class ReplicationManager(ReplicationProtocol):
         if len(active_nodes) <= len(healthy_replicas):
             return False, None
         
-        # Agrupar nodos por rack
-        racks = defaultdict(list)
+        # Un bit por rack y, por nodo, el bit de su rack: la distribución de
+        # réplicas por rack se resuelve con máscaras en vez de recorrer listas
+        rack_bits: Dict[str, int] = {}
+        node_rack_bit: Dict[str, int] = {}
         for node in active_nodes:
             rack = node.rack or "default"
-            racks[rack].append(node.node_id)
-        
-        if len(racks) <= 1:
+            bit = rack_bits.setdefault(rack, 1 << len(rack_bits))
+            node_rack_bit[node.node_id] = bit
+
+        if len(rack_bits) <= 1:
             return False, None  # No hay múltiples racks
-        
-        # Verificar distribución de réplicas por rack
-        replica_racks = defaultdict(int)
+
+        # seen: racks con alguna réplica; repeated: racks con más de una
+        seen = 0
+        repeated = 0
         for replica in healthy_replicas:
-            for rack, nodes in racks.items():
-                if replica.node_id in nodes:
-                    replica_racks[rack] += 1
-                    break
-        
+            bit = node_rack_bit.get(replica.node_id, 0)
+            repeated |= seen & bit
+            seen |= bit
+
+        all_racks = (1 << len(rack_bits)) - 1
         # Verificar si hay racks sin réplicas
-        empty_racks = [rack for rack in racks.keys() if rack not in replica_racks]
-        
+        empty_racks = all_racks & ~seen
+
         # Verificar si hay racks con múltiples réplicas
-        overloaded_racks = [
-            rack for rack, count in replica_racks.items() if count > 1
-        ]
-        
+        overloaded_racks = repeated
+
         if empty_racks and overloaded_racks:
             return True, f"rack_distribution"
         
@@ -632,12 +669,22 @@ class ReplicationManager(ReplicationProtocol):
             node for node in available_nodes if node.node_id not in existing_node_ids
         ]
 
-        # Ordena por espacio libre (descendente)
-        candidate_nodes.sort(key=lambda node: node.free_space, reverse=True)
+        # Ordena por score de carga (descendente): espacio libre penalizado por
+        # uso de CPU y número de chunks, para no concentrar tráfico en un nodo
+        candidate_nodes.sort(key=self._target_score, reverse=True)
 
         # Selecciona los mejores candidatos
         return candidate_nodes[:num_needed]
 
+    @staticmethod
+    def _target_score(node) -> float:
+        """
+        Score de un nodo como destino de réplica.
+        score = free_space * max(0.1, 1 - cpu_pct/100) / (1 + chunk_count)
+        """
+        load_factor = max(0.1, 1 - node.cpu_pct / 100)
+        return node.free_space * load_factor / (1 + node.chunk_count)
+
     def _select_source_replica(self, healthy_replicas: List):
         """
         Selecciona la réplica origen más confiable.
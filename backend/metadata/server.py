@@ -1,19 +1,24 @@
 import asyncio
 import logging
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Dict, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
+from starlette.routing import Route
 
 from core.config import config
+from shared.models import HeartbeatRequest
 from shared.protocols import MetadataStorageBase
 from metadata.replicator import ReplicationManager
 from metadata.leases import LeaseManager
 from metadata import context
 from metadata.api import file_router, node_router, lease_router, system_router
 from metadata.api.proxy import router as proxy_router
-from monitoring.metrics import MetricsMiddleware
+from metadata.api.system import build_root_payload
+from metadata.cache import node_list_cache, system_stats_cache
+from monitoring.metrics import MetricsMiddleware, make_metrics_app
 from metadata.init_storage import create_metadata_storage
 
 # Configura logging
@@ -27,11 +32,25 @@ logger = logging.getLogger(__name__)
 class ServiceManager:
     """Servicio principal de metadatos del DFS. Gestor centralizado de servicios del Metadata Service"""
 
+    # Atributos fijos: un typo al asignar falla en vez de crear estado silencioso
+    __slots__ = (
+        "storage",
+        "replicator",
+        "lease_manager",
+        "_hb_buffer",
+        "_hb_flush_task",
+        "_stop_event",
+    )
+
     def __init__(self):
         self.storage: Optional[MetadataStorageBase] = None
         self.replicator: Optional[ReplicationManager] = None
         self.lease_manager: Optional[LeaseManager] = None
-        self.metrics_task: Optional[asyncio.Task] = None
+        # Heartbeats coalescidos por node_id (last-write-wins) y su task de volcado
+        self._hb_buffer: Dict[str, HeartbeatRequest] = {}
+        self._hb_flush_task: Optional[asyncio.Task] = None
+        # Despierta al flusher de inmediato en el shutdown (sin cancelar la task)
+        self._stop_event = asyncio.Event()
 
     async def initialize(self):
         """Inicializa todos los servicios"""
@@ -41,6 +60,8 @@ class ServiceManager:
             # Inicializar storage
             self.storage = create_metadata_storage()
             await self.storage.initialize()
+            # Escrituras de cualquier worker invalidan la cache de /stats al instante
+            self.storage.add_stats_listener(system_stats_cache.invalidate)
             logger.info("Storage inicializado correctamente")
 
             # Inicializar replication manager
@@ -58,13 +79,17 @@ class ServiceManager:
             self.lease_manager = LeaseManager(self.storage)
             logger.info("Lease Manager inicializado")
 
-            # Iniciar background tasks
-            await self.replicator.start()
-            logger.info("Replication Manager iniciado")
+            # Iniciar background tasks (solo en el worker designado)
+            if config.run_background:
+                await self.replicator.start()
+                logger.info("Replication Manager iniciado")
+            else:
+                logger.info("Replication Manager no iniciado: lo corre otro worker")
 
-            # Iniciar metrics updater
-            self.metrics_task = asyncio.create_task(self._metrics_updater())
-            logger.info("Metrics updater iniciado")
+            # Iniciar volcado periódico de heartbeats
+            self._stop_event.clear()
+            self._hb_flush_task = asyncio.create_task(self._heartbeat_flusher())
+            logger.info("Heartbeat flusher iniciado")
 
             logger.info("Metadata Service iniciado correctamente")
 
@@ -77,13 +102,11 @@ class ServiceManager:
         """Limpia y cierra todos los servicios"""
         logger.info("Deteniendo Metadata Service...")
 
-        # Cancela metrics task
-        if self.metrics_task and not self.metrics_task.done():
-            self.metrics_task.cancel()
-            try:
-                await self.metrics_task
-            except asyncio.CancelledError:
-                pass
+        # Detiene el flusher y vuelca los heartbeats pendientes
+        self._stop_event.set()
+        if self._hb_flush_task and not self._hb_flush_task.done():
+            await self._hb_flush_task
+        await self._flush_heartbeats()
 
         # Detiene replicator
         if self.replicator:
@@ -111,26 +134,44 @@ class ServiceManager:
 
         logger.info("Metadata Service detenido correctamente")
 
-    async def _metrics_updater(self):
-        """Task en background para actualizar métricas del sistema"""
-        from monitoring.metrics import update_lease_metrics
+    async def _heartbeat_flusher(self):
+        """Task en background que vuelca los heartbeats acumulados cada heartbeat_flush_ms"""
+        interval = config.heartbeat_flush_ms / 1000
 
         while True:
             try:
-                # Solo actualiza las métricas de leases para no bloquear el lock de storage
-                if self.lease_manager:
-                    lease_stats = self.lease_manager.get_lease_stats()
-                    update_lease_metrics(lease_stats["active_leases"])
-
-                # Reduce frecuencia de actualización
-                await asyncio.sleep(30)  # Actualiza cada 30 segundos en lugar de 10
-
-            except asyncio.CancelledError:
-                logger.info("Metrics updater cancelado")
+                await asyncio.wait_for(self._stop_event.wait(), timeout=interval)
+                logger.info("Heartbeat flusher detenido")
                 break
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self._flush_heartbeats()
             except Exception as e:
-                logger.error(f"Error en metrics updater: {e}")
-                await asyncio.sleep(60)  # Espera más en caso de error
+                logger.error(f"Error en heartbeat flusher: {e}")
+
+    async def _flush_heartbeats(self):
+        """
+        Toma una instantánea del buffer, lo vacía y la aplica en un solo lote.
+        Si la escritura falla (o se cancela en el shutdown) el lote vuelve al
+        buffer para el próximo volcado, sin pisar heartbeats más nuevos que
+        hayan llegado mientras tanto.
+        """
+        if not self._hb_buffer or not self.storage:
+            return
+
+        batch = list(self._hb_buffer.values())
+        self._hb_buffer.clear()
+
+        try:
+            await self.storage.bulk_update_node_heartbeats(batch)
+        except BaseException:
+            for hb in batch:
+                self._hb_buffer.setdefault(hb.node_id, hb)
+            raise
+        node_list_cache.invalidate()
+        logger.debug("Volcados %s heartbeats al storage", len(batch))
 
 
 # Instancia global del service manager
@@ -148,6 +189,10 @@ async def lifespan(app: FastAPI):
     context.set_storage(service_manager.storage)
     context.set_replicator(service_manager.replicator)
     context.set_lease_manager(service_manager.lease_manager)
+    context.set_heartbeat_buffer(service_manager._hb_buffer)
+
+    # El payload de "/" es estático una vez inicializados los servicios
+    app.state.root_bytes = build_root_payload()
 
     logger.info("Variables globales actualizadas en contexto")
     logger.info(f"Storage: {context.get_storage() is not None}")
@@ -164,7 +209,8 @@ async def lifespan(app: FastAPI):
         yield
 
     finally:
-        # Hace limpieza
+        # Deja de aceptar heartbeats en buffer y hace limpieza
+        context.set_heartbeat_buffer(None)
         await service_manager.cleanup()
 
 
@@ -176,6 +222,8 @@ def create_app() -> FastAPI:
         description="Servicio de metadatos para Sistema de Archivos Distribuido",
         version="1.0.0",
         lifespan=lifespan,
+        # Serialización JSON en C (orjson) para listados de nodos/archivos y stats
+        default_response_class=ORJSONResponse,
         docs_url="/docs",
         redoc_url="/redoc",
     )
@@ -199,28 +247,88 @@ def create_app() -> FastAPI:
     app.include_router(system_router, prefix="/api/v1", tags=["System"])
     app.include_router(proxy_router, prefix="/api/v1/proxy", tags=["Proxy"])
 
+    @app.exception_handler(Exception)
+    async def unhandled_exception_handler(request: Request, exc: Exception):
+        """
+        Respuesta 500 común para errores no controlados.
+        Los endpoints de lectura y heartbeat no envuelven su cuerpo en try/except;
+        los 404/503 siguen saliendo como HTTPException explícitas.
+        """
+        logger.exception("Error no controlado en %s %s", request.method, request.url.path)
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": "Error interno del servidor"},
+        )
+
+    # Métricas Prometheus como app ASGI (el scrape no pasa por un handler de FastAPI).
+    # Route exacta y no mount: un mount solo atiende /metrics/ y GET /metrics
+    # respondería con un redirect 307
+    app.router.routes.append(Route("/metrics", make_metrics_app(), include_in_schema=False))
+
+    @app.get("/health")
+    async def health_check():
+        """
+        Liveness probe: responde 200 mientras el proceso esté vivo, sin tocar storage.
+        El chequeo profundo (nodos, replicación) está en /api/v1/health.
+        """
+        return {"status": "ok"}
+
+    @app.get("/ready")
+    async def readiness_check():
+        """Readiness probe: 503 hasta que el storage esté inicializado"""
+        if context.get_storage() is None:
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"status": "starting"},
+            )
+        return {"status": "ready"}
+
     return app
 
+
 app = create_app()
 
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
 
 def main():
-    """Función principal para ejecutar el servidor"""
+    """
+    Función principal para ejecutar el servidor.
+    En sistemas POSIX con gunicorn instalado se lanza con varios workers Uvicorn
+    (ver gunicorn.conf.py); en Windows o sin gunicorn se usa un único proceso Uvicorn.
+    """
+    import os
+    import shutil
+
+    gunicorn_bin = shutil.which("gunicorn")
+    if os.name != "nt" and gunicorn_bin:
+        conf_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn.conf.py")
+        os.environ.setdefault("PORT", str(config.metadata_port))
+        os.execvp(gunicorn_bin, [gunicorn_bin, "metadata.server:app", "-c", conf_path])
+
     import uvicorn
 
+    # Event loop y parser HTTP en C; uvloop no existe en Windows, se usa asyncio.
+    # Ambos se pueden forzar con UVICORN_LOOP / UVICORN_HTTP.
+    loop_impl = os.getenv("UVICORN_LOOP", "asyncio" if os.name == "nt" else "uvloop")
+    http_impl = os.getenv("UVICORN_HTTP", "httptools")
+
     uvicorn.run(
         app,
         host="0.0.0.0",  # Escuchar en todas las interfaces
         port=config.metadata_port,
+        loop=loop_impl,
+        http=http_impl,
         log_level=config.log_level.lower(),
-        access_log=True,
-        limit_max_requests=1000,
+        # Una línea de log por request en el event loop penaliza el throughput;
+        # se habilita explícitamente con UVICORN_ACCESS_LOG=1
+        access_log=bool(int(os.getenv("UVICORN_ACCESS_LOG", "0"))),
+        backlog=int(os.getenv("BACKLOG", "2048")),
+        # Tope de conexiones/tareas simultáneas antes de responder 503; holgado
+        # respecto a los heartbeats y uploads en vuelo esperados.
+        # Sin limit_max_requests: reiniciar el proceso recrearía el ServiceManager
+        # (reconexión de storage). El reciclado de workers es cosa de gunicorn
+        # (max_requests + max_requests_jitter en gunicorn.conf.py).
+        limit_concurrency=int(os.getenv("CONCURRENCY", "4096")),
         timeout_keep_alive=65,
-        # Aumentar límites para chunks grandes (64MB + overhead)
-        limit_concurrency=1000,
     )
 
 
@@ -1,8 +1,8 @@
 import asyncio
-import json
 import logging
+from contextlib import aclosing
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional, Tuple
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
 from uuid import UUID, uuid4
 
 import asyncpg
@@ -15,6 +15,7 @@ from shared.models import (
     ChunkTarget,
     ChunkCommitInfo,
     FileMetadata,
+    HeartbeatRequest,
     LeaseResponse,
     NodeInfo,
     NodeState,
@@ -30,6 +31,409 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# Columnas de chunk/réplica en las lecturas con JOIN (alias para no chocar con
+# files.size). Van después de las 9 de _FILE_COLUMNS y se leen por posición
+_SQL_CHUNK_COLUMNS = """
+    c.chunk_id, c.seq_index, c.size AS chunk_size, c.checksum,
+    r.node_id, r.url, r.state, r.last_heartbeat AS replica_heartbeat,
+    r.checksum_verified
+"""
+
+
+def _chunk_entry(row) -> ChunkEntry:
+    """ChunkEntry (sin réplicas) de las columnas 9-12 de una fila con JOIN"""
+    # asyncpg ya entrega UUID e int: se construye sin validar
+    return ChunkEntry.model_construct(
+        chunk_id=row[9],
+        seq_index=row[10],
+        size=row[11],
+        checksum=row[12],
+        replicas=[],
+    )
+
+
+def _replica_info(row) -> ReplicaInfo:
+    """ReplicaInfo de las columnas 13-17 de una fila con JOIN"""
+    return ReplicaInfo.model_construct(
+        node_id=row[13],
+        url=row[14],
+        state=ChunkState(row[15]),
+        last_heartbeat=row[16],
+        checksum_verified=bool(row[17]),
+    )
+
+
+def _append_chunk_row(
+    chunks: List[ChunkEntry], chunk: Optional[ChunkEntry], row
+) -> Optional[ChunkEntry]:
+    """
+    Agrega a `chunks` el chunk y la réplica de una fila con JOIN (filas en orden
+    de seq_index). Devuelve el chunk en curso para la fila siguiente.
+    """
+    if row[9] is None:
+        # Archivo sin chunks (LEFT JOIN)
+        return chunk
+    if chunk is None or row[9] != chunk.chunk_id:
+        chunk = _chunk_entry(row)
+        chunks.append(chunk)
+    if row[13] is not None:
+        chunk.replicas.append(_replica_info(row))
+    return chunk
+
+
+# Filas por ida y vuelta del cursor de list_files (y límite hasta el que se usa fetch)
+_LIST_PREFETCH = 500
+
+# Columnas de files. El orden es fijo: _row_to_file_metadata lee la fila por
+# posición y las columnas de chunk/réplica de los JOIN van a continuación.
+# Los booleanos admiten NULL en la tabla: el COALESCE los entrega ya como bool
+_FILE_COLUMNS = (
+    "file_id, path, size, created_at, modified_at, "
+    "COALESCE(is_deleted, FALSE) AS is_deleted, deleted_at, "
+    "COALESCE(compressed, FALSE) AS compressed, original_size"
+)
+
+# Consultas de los caminos calientes como constantes: el texto idéntico en
+# cada llamada reutiliza el statement ya preparado en la caché de asyncpg
+# de la conexión (sin Parse en el servidor)
+_SQL_GET_FILE_BY_PATH = f"""
+    SELECT f.*, {_SQL_CHUNK_COLUMNS}
+    FROM (
+        SELECT {_FILE_COLUMNS} FROM files WHERE path = $1 AND is_deleted = FALSE
+    ) f
+    LEFT JOIN chunks c ON c.file_id = f.file_id
+    LEFT JOIN replicas r ON r.chunk_id = c.chunk_id
+    ORDER BY c.seq_index
+"""
+_SQL_GET_FILE_SUMMARY_BY_PATH = (
+    f"SELECT {_FILE_COLUMNS} FROM files WHERE path = $1 AND is_deleted = FALSE"
+)
+# Página de archivos ($1 limit, $2 offset) con sus chunks y réplicas en una
+# consulta: las filas de un mismo archivo y chunk llegan contiguas
+_SQL_LIST_FILES = f"""
+    SELECT f.*, {_SQL_CHUNK_COLUMNS}
+    FROM (
+        SELECT {_FILE_COLUMNS} FROM files
+        WHERE is_deleted = FALSE
+        ORDER BY path LIMIT $1 OFFSET $2
+    ) f
+    LEFT JOIN chunks c ON c.file_id = f.file_id
+    LEFT JOIN replicas r ON r.chunk_id = c.chunk_id
+    ORDER BY f.path, c.seq_index
+"""
+_SQL_LIST_FILES_PREFIX = f"""
+    SELECT f.*, {_SQL_CHUNK_COLUMNS}
+    FROM (
+        SELECT {_FILE_COLUMNS} FROM files
+        WHERE is_deleted = FALSE AND path LIKE $1
+        ORDER BY path LIMIT $2 OFFSET $3
+    ) f
+    LEFT JOIN chunks c ON c.file_id = f.file_id
+    LEFT JOIN replicas r ON r.chunk_id = c.chunk_id
+    ORDER BY f.path, c.seq_index
+"""
+
+# Alta de un archivo y sus chunks en un solo statement ($7..$9 arrays paralelos
+# de seq_index, chunk_id y size)
+_SQL_INSERT_FILE = """
+    WITH f AS (
+        INSERT INTO files
+        (file_id, path, size, created_at, modified_at, compressed, original_size)
+        VALUES ($1, $2, $3, $4, $4, $5, $6)
+        RETURNING file_id
+    )
+    INSERT INTO chunks (file_id, seq_index, chunk_id, size)
+    SELECT f.file_id, u.seq_index, u.chunk_id, u.size
+    FROM f, unnest($7::int[], $8::uuid[], $9::bigint[]) AS u(seq_index, chunk_id, size)
+"""
+
+# Commit en un solo statement: $1 file_id, $2 ahora, $3/$4 checksum por
+# chunk_id, $5..$7 réplicas (chunk_id, node_id, url). Solo se tocan chunks del
+# archivo y sus réplicas quedan exactamente las del commit. Devuelve file_id
+# si el archivo existe
+_SQL_COMMIT_FILE = f"""
+    WITH touched AS (
+        UPDATE files SET modified_at = $2 WHERE file_id = $1
+        RETURNING file_id
+    ),
+    patched AS (
+        UPDATE chunks AS c SET checksum = u.checksum
+        FROM unnest($3::uuid[], $4::text[]) AS u(chunk_id, checksum)
+        WHERE c.file_id = $1 AND c.chunk_id = u.chunk_id
+        RETURNING c.chunk_id
+    ),
+    new_replicas AS (
+        SELECT u.chunk_id, u.node_id, u.url
+        FROM unnest($5::uuid[], $6::text[], $7::text[]) AS u(chunk_id, node_id, url)
+        JOIN patched p ON p.chunk_id = u.chunk_id
+    ),
+    dropped AS (
+        DELETE FROM replicas AS r
+        USING patched p
+        WHERE r.chunk_id = p.chunk_id
+          AND NOT EXISTS (
+              SELECT 1 FROM new_replicas n
+              WHERE n.chunk_id = r.chunk_id AND n.node_id = r.node_id
+          )
+    ),
+    upserted AS (
+        INSERT INTO replicas
+        (chunk_id, node_id, url, state, last_heartbeat, checksum_verified)
+        SELECT chunk_id, node_id, url, '{ChunkState.COMMITTED.value}', $2, TRUE
+        FROM new_replicas
+        ON CONFLICT (chunk_id, node_id) DO UPDATE SET
+            url = EXCLUDED.url,
+            state = EXCLUDED.state,
+            last_heartbeat = EXCLUDED.last_heartbeat,
+            checksum_verified = EXCLUDED.checksum_verified
+    )
+    SELECT file_id FROM touched
+"""
+
+# Sincroniza replicas con uno o más heartbeats: $1/$2 pares (node_id, chunk_id)
+# reportados, $3/$4 (node_id, url) de cada nodo del lote. Por nodo, y solo
+# sobre chunks de archivos no eliminados:
+# - réplicas de chunks reportados: se crean o pasan a committed con la URL actual
+# - réplicas de chunks no reportados: se eliminan
+# Las réplicas ya al día no se reescriben. Devuelve una fila por nodo con las
+# réplicas agregadas/actualizadas y las eliminadas
+_SQL_SYNC_REPLICAS = f"""
+    WITH reported AS (
+        SELECT * FROM unnest($1::text[], $2::uuid[]) AS u(node_id, chunk_id)
+    ),
+    batch AS (
+        SELECT * FROM unnest($3::text[], $4::text[]) AS b(node_id, url)
+    ),
+    upserted AS (
+        INSERT INTO replicas
+        (chunk_id, node_id, url, state, last_heartbeat, checksum_verified)
+        SELECT c.chunk_id, b.node_id, b.url, '{ChunkState.COMMITTED.value}', NULL, FALSE
+        FROM reported rp
+        JOIN batch b ON b.node_id = rp.node_id
+        JOIN chunks c ON c.chunk_id = rp.chunk_id
+        JOIN files f ON f.file_id = c.file_id
+        WHERE f.is_deleted = FALSE
+        ON CONFLICT (chunk_id, node_id) DO UPDATE SET
+            state = EXCLUDED.state,
+            url = EXCLUDED.url
+        WHERE replicas.state IS DISTINCT FROM EXCLUDED.state
+           OR replicas.url IS DISTINCT FROM EXCLUDED.url
+        RETURNING node_id
+    ),
+    removed AS (
+        DELETE FROM replicas AS r
+        USING batch b, chunks c, files f
+        WHERE r.node_id = b.node_id
+          AND c.chunk_id = r.chunk_id
+          AND f.file_id = c.file_id
+          AND f.is_deleted = FALSE
+          AND NOT EXISTS (
+              SELECT 1 FROM reported rp
+              WHERE rp.node_id = r.node_id AND rp.chunk_id = r.chunk_id
+          )
+        RETURNING r.node_id
+    )
+    SELECT b.node_id,
+           (SELECT count(*) FROM upserted u WHERE u.node_id = b.node_id) AS synced,
+           (SELECT count(*) FROM removed d WHERE d.node_id = b.node_id) AS removed
+    FROM batch b
+"""
+
+# Migración desde el esquema con chunks_json: pasa chunks y réplicas de las
+# filas aún no migradas (chunks_json distinto de '[]') a sus tablas. Cada
+# statement devuelve cuántas filas insertó, para compararlas con las esperadas
+_SQL_LEGACY_PENDING = "SELECT EXISTS (SELECT 1 FROM files WHERE chunks_json <> '[]'::jsonb)"
+_SQL_LEGACY_COUNTS = """
+    SELECT count(*) AS chunks,
+           COALESCE(sum(jsonb_array_length(COALESCE(e.chunk->'replicas', '[]'::jsonb))), 0)
+               AS replicas
+    FROM files f
+    CROSS JOIN LATERAL jsonb_array_elements(f.chunks_json) AS e(chunk)
+    WHERE f.chunks_json <> '[]'::jsonb
+"""
+_SQL_MIGRATE_CHUNKS = """
+    WITH inserted AS (
+        INSERT INTO chunks (file_id, seq_index, chunk_id, size, checksum)
+        SELECT f.file_id,
+               COALESCE((e.chunk->>'seq_index')::int, e.ord::int - 1),
+               (e.chunk->>'chunk_id')::uuid,
+               (e.chunk->>'size')::bigint,
+               e.chunk->>'checksum'
+        FROM files f
+        CROSS JOIN LATERAL jsonb_array_elements(f.chunks_json)
+            WITH ORDINALITY AS e(chunk, ord)
+        WHERE f.chunks_json <> '[]'::jsonb
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    SELECT count(*) FROM inserted
+"""
+_SQL_MIGRATE_REPLICAS = f"""
+    WITH inserted AS (
+        INSERT INTO replicas
+        (chunk_id, node_id, url, state, last_heartbeat, checksum_verified)
+        SELECT c.chunk_id,
+               x.r->>'node_id',
+               x.r->>'url',
+               COALESCE(x.r->>'state', '{ChunkState.PENDING.value}'),
+               (x.r->>'last_heartbeat')::timestamptz,
+               COALESCE((x.r->>'checksum_verified')::boolean, FALSE)
+        FROM files f
+        CROSS JOIN LATERAL jsonb_array_elements(f.chunks_json) AS e(chunk)
+        CROSS JOIN LATERAL jsonb_array_elements(
+            COALESCE(e.chunk->'replicas', '[]'::jsonb)
+        ) AS x(r)
+        JOIN chunks c
+          ON c.chunk_id = (e.chunk->>'chunk_id')::uuid AND c.file_id = f.file_id
+        WHERE f.chunks_json <> '[]'::jsonb
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    SELECT count(*) FROM inserted
+"""
+# Canal de LISTEN/NOTIFY por el que los writers avisan a todos los workers que
+# cambiaron los agregados de stats (alta/baja de archivos y de nodos)
+_STATS_CHANNEL = "dfs_stats_changed"
+_SQL_NOTIFY_STATS = f"NOTIFY {_STATS_CHANNEL}"
+
+# Estados literales (no parámetros) para que el planner use idx_nodes_active_hb
+# Los barridos devuelven el número de filas tocadas como un único valor
+# (fetchval), sin parsear el command tag ("UPDATE n") de execute
+_SQL_MARK_STALE_NODES = f"""
+    WITH marked AS (
+        UPDATE nodes SET state = '{NodeState.INACTIVE.value}'
+        WHERE state = '{NodeState.ACTIVE.value}' AND last_heartbeat < $1
+        RETURNING 1
+    )
+    SELECT count(*) FROM marked
+"""
+_SQL_DELETE_EXPIRED_LEASES = """
+    WITH purged AS (DELETE FROM leases WHERE expires_at <= $1 RETURNING 1)
+    SELECT count(*) FROM purged
+"""
+# Inserta el lease salvo que haya uno activo sobre el path ($5 = ahora): el
+# conflicto con un lease expirado del mismo path lo reemplaza. Devuelve
+# lease_id si se adquirió.
+_SQL_INSERT_LEASE = """
+    INSERT INTO leases (lease_id, path, operation, expires_at)
+    VALUES ($1, $2, $3, $4)
+    ON CONFLICT (path) DO UPDATE SET
+        lease_id = EXCLUDED.lease_id,
+        operation = EXCLUDED.operation,
+        client_id = NULL,
+        expires_at = EXCLUDED.expires_at
+    WHERE leases.expires_at <= $5
+    RETURNING lease_id
+"""
+
+# Alta o actualización del nodo de un heartbeat con texto fijo (un único
+# statement preparado): al actualizar, los opcionales NULL ($3 puerto,
+# $11 cpu, $12 red, $13 IP válida, $14 id ZeroTier) conservan el valor actual
+_SQL_UPSERT_HEARTBEAT_NODE = """
+    INSERT INTO nodes
+    (node_id, host, port, zerotier_ip, zerotier_node_id,
+     free_space, total_space, chunk_count, last_heartbeat, state,
+     cpu_pct, net_tx_bps)
+    VALUES ($1, $2, COALESCE($3::int, 8001), $4, $5, $6, $7, $8, $9, $10,
+            COALESCE($11::float8, 0), COALESCE($12::float8, 0))
+    ON CONFLICT (node_id) DO UPDATE SET
+        free_space = EXCLUDED.free_space,
+        total_space = EXCLUDED.total_space,
+        chunk_count = EXCLUDED.chunk_count,
+        last_heartbeat = EXCLUDED.last_heartbeat,
+        state = EXCLUDED.state,
+        zerotier_ip = COALESCE($13::text, nodes.zerotier_ip),
+        host = COALESCE($13::text, nodes.host),
+        zerotier_node_id = COALESCE($14::text, nodes.zerotier_node_id),
+        cpu_pct = COALESCE($11::float8, nodes.cpu_pct),
+        net_tx_bps = COALESCE($12::float8, nodes.net_tx_bps),
+        port = COALESCE($3::int, nodes.port)
+"""
+
+# Columnas que usa _row_to_node_info (sin boot_token, version, lease_ttl...),
+# en el orden en que las lee por posición
+_NODE_COLUMNS = """
+    node_id, host, port, rack, free_space, total_space, chunk_count,
+    last_heartbeat, state, zerotier_ip, cpu_pct, net_tx_bps
+"""
+
+# Lecturas de nodos y agregados de stats: el texto se arma una vez al importar
+# en lugar de un f-string por llamada, y es la misma clave en la caché de
+# statements de cada conexión
+_SQL_GET_NODE = f"SELECT {_NODE_COLUMNS} FROM nodes WHERE node_id = $1"
+_SQL_LIST_NODES = f"SELECT {_NODE_COLUMNS} FROM nodes ORDER BY last_heartbeat DESC"
+_SQL_GET_ACTIVE_NODES = f"""
+    SELECT {_NODE_COLUMNS} FROM nodes
+    WHERE state = '{NodeState.ACTIVE.value}' AND last_heartbeat > $1
+    ORDER BY free_space DESC
+"""
+# Las dos filas de stats ya traen las claves finales de get_system_stats
+# (COALESCE y used_space incluidos): Python solo las combina
+_SQL_FILE_STATS = """
+    SELECT COUNT(*) AS total_files,
+           (SELECT COUNT(*) FROM chunks c
+            JOIN files cf ON cf.file_id = c.file_id
+            WHERE cf.is_deleted = FALSE) AS total_chunks,
+           COALESCE(SUM(size), 0)::BIGINT AS total_size
+    FROM files WHERE is_deleted = FALSE
+"""
+_SQL_NODE_STATS = """
+    SELECT
+        COUNT(*) AS total_nodes,
+        COUNT(*) FILTER (WHERE state = $1) AS active_nodes,
+        COALESCE(SUM(total_space) FILTER (WHERE state = $1), 0)::BIGINT AS total_space,
+        COALESCE(SUM(total_space - free_space) FILTER (WHERE state = $1), 0)::BIGINT
+            AS used_space,
+        COALESCE(SUM(free_space) FILTER (WHERE state = $1), 0)::BIGINT AS free_space
+    FROM nodes
+"""
+
+# Lote de heartbeats en un solo upsert atómico ($1..$13 arrays paralelos, $14
+# last_heartbeat, $15 estado). EXCLUDED trae los valores de alta (puerto 8001,
+# cpu 0...), así que en el UPDATE los campos que conservan el valor actual si
+# llegan NULL se leen de los arrays por la posición del node_id en $1
+_SQL_BULK_UPSERT_NODES = """
+    INSERT INTO nodes
+    (node_id, host, port, zerotier_ip, zerotier_node_id,
+     free_space, total_space, chunk_count, last_heartbeat, state,
+     cpu_pct, net_tx_bps)
+    SELECT u.node_id, u.host, u.insert_port, u.zerotier_ip, u.zerotier_node_id,
+           u.free_space, u.total_space, u.chunk_count, $14, $15,
+           COALESCE(u.cpu_pct, 0), COALESCE(u.net_tx_bps, 0)
+    FROM unnest(
+        $1::text[], $2::bigint[], $3::bigint[], $4::int[],
+        $7::float8[], $8::float8[],
+        $10::text[], $11::int[], $12::text[], $13::text[]
+    ) AS u(node_id, free_space, total_space, chunk_count, cpu_pct, net_tx_bps,
+           host, insert_port, zerotier_ip, zerotier_node_id)
+    ON CONFLICT (node_id) DO UPDATE SET
+        free_space = EXCLUDED.free_space,
+        total_space = EXCLUDED.total_space,
+        chunk_count = EXCLUDED.chunk_count,
+        last_heartbeat = EXCLUDED.last_heartbeat,
+        state = EXCLUDED.state,
+        (zerotier_ip, host, zerotier_node_id, cpu_pct, net_tx_bps, port) = (
+            SELECT COALESCE(($5::text[])[i], nodes.zerotier_ip),
+                   COALESCE(($5::text[])[i], nodes.host),
+                   COALESCE(($6::text[])[i], nodes.zerotier_node_id),
+                   COALESCE(($7::float8[])[i], nodes.cpu_pct),
+                   COALESCE(($8::float8[])[i], nodes.net_tx_bps),
+                   COALESCE(($9::int[])[i], nodes.port)
+            FROM array_position($1::text[], EXCLUDED.node_id) AS i
+        )
+"""
+
+
+def _port_from_url(url: Optional[str]) -> Optional[int]:
+    """Extrae el puerto de una URL tipo http://host:port/...; None si no se puede"""
+    if not url:
+        return None
+    try:
+        return int(url.split(":")[-1].split("/")[0])
+    except (ValueError, IndexError):
+        return None
+
+
 class PostgresMetadataStorage(MetadataStorageBase):
     """
     Storage backend para metadata usando PostgreSQL (Neon)
@@ -45,7 +449,18 @@ class PostgresMetadataStorage(MetadataStorageBase):
             )
         
         self._pool: Optional[asyncpg.Pool] = None
-        self.lock = asyncio.Lock()
+        # Las escrituras no se serializan en Python: son statements atómicos
+        # que solo tocan las filas de replicas del propio nodo. El semáforo
+        # solo acota los heartbeats en vuelo (una conexión cada uno) a la mitad
+        # del pool, para que no lo acaparen frente a las lecturas
+        self._heartbeat_sem = asyncio.Semaphore(max(1, config.postgres_pool_max // 2))
+        # Barridos periódicos (nodos sin heartbeat, leases expirados) fuera de
+        # los caminos calientes
+        self._sweep_tasks: List[asyncio.Task] = []
+        self._stop_event = asyncio.Event()
+        # Conexión dedicada (fuera del pool) que escucha _STATS_CHANNEL
+        self._listen_conn: Optional[asyncpg.Connection] = None
+        self._stats_listeners: List[Callable[[], None]] = []
         
     @property
     def pool(self) -> asyncpg.Pool:
@@ -61,11 +476,35 @@ class PostgresMetadataStorage(MetadataStorageBase):
         try:
             self._pool = await asyncpg.create_pool(
                 self.connection_string,
-                min_size=2,
-                max_size=10,
-                command_timeout=60,
+                min_size=config.postgres_pool_min,
+                max_size=config.postgres_pool_max,
+                # Conexiones ociosas se cierran a los 5 min (Neon escala a cero)
+                max_inactive_connection_lifetime=300,
+                command_timeout=30,
+                # Los statements preparados no caducan por antigüedad; con
+                # PgBouncer en modo transaction se desactiva con tamaño 0
+                statement_cache_size=config.postgres_statement_cache_size,
+                max_cached_statement_lifetime=0,
+                # Las consultas de metadata duran < 1 ms: el JIT solo suma latencia.
+                # Los parámetros de sesión van en el startup, sin round trips extra
+                server_settings={
+                    "jit": "off",
+                    "application_name": "dfs-metadata",
+                    "synchronous_commit": config.postgres_synchronous_commit,
+                },
             )
             await self._create_tables()
+            await self._start_stats_listener()
+            self._stop_event.clear()
+            if config.run_background:
+                self._sweep_tasks = [
+                    asyncio.create_task(
+                        self._periodic(config.node_timeout / 4, self._mark_stale_nodes)
+                    ),
+                    asyncio.create_task(
+                        self._periodic(config.lease_ttl, self._cleanup_expired_leases_internal)
+                    ),
+                ]
             logger.info("Metadata storage (PostgreSQL) inicializado")
         except Exception as e:
             raise DFSMetadataError(f"Error inicializando storage: {e}")
@@ -83,13 +522,43 @@ class PostgresMetadataStorage(MetadataStorageBase):
                     modified_at TIMESTAMPTZ NOT NULL,
                     is_deleted BOOLEAN DEFAULT FALSE,
                     deleted_at TIMESTAMPTZ,
-                    chunks_json JSONB NOT NULL,
                     compressed BOOLEAN DEFAULT FALSE,
                     original_size BIGINT
                 )
                 """
             )
 
+            # Chunks y réplicas normalizados: las lecturas no parsean JSON y el
+            # heartbeat de un nodo solo toca sus filas de replicas
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    file_id UUID NOT NULL REFERENCES files(file_id) ON DELETE CASCADE,
+                    seq_index INTEGER NOT NULL,
+                    chunk_id UUID NOT NULL UNIQUE,
+                    size BIGINT NOT NULL,
+                    checksum TEXT,
+                    PRIMARY KEY (file_id, seq_index)
+                )
+                """
+            )
+
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS replicas (
+                    chunk_id UUID NOT NULL REFERENCES chunks(chunk_id) ON DELETE CASCADE,
+                    node_id TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    last_heartbeat TIMESTAMPTZ,
+                    checksum_verified BOOLEAN DEFAULT FALSE,
+                    PRIMARY KEY (chunk_id, node_id)
+                )
+                """
+            )
+
+            await self._migrate_chunks_json_if_needed(conn)
+
             await conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS nodes (
@@ -106,7 +575,9 @@ class PostgresMetadataStorage(MetadataStorageBase):
                     zerotier_ip TEXT,
                     lease_ttl INTEGER DEFAULT 60,
                     boot_token TEXT,
-                    version TEXT
+                    version TEXT,
+                    cpu_pct DOUBLE PRECISION DEFAULT 0,
+                    net_tx_bps DOUBLE PRECISION DEFAULT 0
                 )
                 """
             )
@@ -123,89 +594,250 @@ class PostgresMetadataStorage(MetadataStorageBase):
                 """
             )
 
+            # Migración ligera para tablas existentes sin métricas de carga
+            await conn.execute(
+                "ALTER TABLE nodes ADD COLUMN IF NOT EXISTS cpu_pct DOUBLE PRECISION DEFAULT 0"
+            )
+            await conn.execute(
+                "ALTER TABLE nodes ADD COLUMN IF NOT EXISTS net_tx_bps DOUBLE PRECISION DEFAULT 0"
+            )
+
             # Crear índices
+            # Índices parciales sobre las filas vivas: todas las lecturas filtran
+            # is_deleted = FALSE. El de path sirve igualdad y el ORDER BY path de
+            # list_files; el de text_pattern_ops el prefijo (path LIKE 'x%')
+            # independientemente del collation de la base
             await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_files_path ON files(path)"
+                "CREATE INDEX IF NOT EXISTS idx_files_path_live ON files(path) WHERE is_deleted = FALSE"
             )
             await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_files_deleted ON files(is_deleted)"
+                "CREATE INDEX IF NOT EXISTS idx_files_path_prefix_live "
+                "ON files(path text_pattern_ops) WHERE is_deleted = FALSE"
             )
+            # Solo nodos activos: get_active_nodes y el barrido de nodos caídos.
+            # El estado va literal en esas consultas para que el planner pueda
+            # usar el índice parcial
             await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_nodes_state ON nodes(state)"
+                "CREATE INDEX IF NOT EXISTS idx_nodes_active_hb ON nodes(last_heartbeat) "
+                f"WHERE state = '{NodeState.ACTIVE.value}'"
             )
+            # Réplicas de un nodo al sincronizar su heartbeat
             await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_nodes_heartbeat ON nodes(last_heartbeat)"
+                "CREATE INDEX IF NOT EXISTS idx_replicas_node ON replicas(node_id)"
             )
+            # Índices reemplazados por los parciales (y el GIN sobre chunks_json,
+            # que ya no se consulta)
+            for index_name in (
+                "idx_files_chunks_gin",
+                "idx_files_path",
+                "idx_files_deleted",
+                "idx_files_active_path",
+                "idx_nodes_state",
+                "idx_nodes_heartbeat",
+                "idx_nodes_state_heartbeat",
+            ):
+                await conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+            # Un único lease por path (acquire_lease hace upsert sobre él); antes
+            # de crear el índice se descartan expirados y duplicados heredados
+            await conn.execute("DELETE FROM leases WHERE expires_at <= now()")
             await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_leases_path ON leases(path)"
+                """
+                DELETE FROM leases a USING leases b
+                WHERE a.path = b.path
+                  AND (a.expires_at, a.lease_id) < (b.expires_at, b.lease_id)
+                """
+            )
+            await conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_leases_path_unique ON leases(path)"
             )
+            await conn.execute("DROP INDEX IF EXISTS idx_leases_path")
             await conn.execute(
                 "CREATE INDEX IF NOT EXISTS idx_leases_expires ON leases(expires_at)"
             )
 
+    async def _migrate_chunks_json_if_needed(self, conn: asyncpg.Connection) -> None:
+        """
+        Pasa los chunks guardados en files.chunks_json (esquema anterior) a las
+        tablas chunks/replicas. Como en el backend SQLite, la columna se conserva:
+        una fila queda migrada cuando su chunks_json es '[]'. Si los chunks o
+        réplicas copiados no coinciden con los de chunks_json (entradas en
+        conflicto), la transacción se revierte y el arranque falla sin vaciar
+        nada. Un advisory lock evita que varios workers migren a la vez.
+        """
+        column_default = await conn.fetchrow(
+            """
+            SELECT column_default FROM information_schema.columns
+            WHERE table_schema = current_schema()
+              AND table_name = 'files' AND column_name = 'chunks_json'
+            """
+        )
+        if column_default is None:
+            return  # Base creada con el esquema normalizado
+
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('dfs_chunks_migration'))")
+            if column_default["column_default"] is None:
+                # Las altas nuevas no escriben la columna (NOT NULL en el esquema anterior)
+                await conn.execute(
+                    "ALTER TABLE files ALTER COLUMN chunks_json SET DEFAULT '[]'::jsonb"
+                )
+            # Otro worker pudo migrar mientras se esperaba el lock
+            if not await conn.fetchval(_SQL_LEGACY_PENDING):
+                return
+
+            expected = await conn.fetchrow(_SQL_LEGACY_COUNTS)
+            logger.info(
+                "Migración: normalizando %s chunks y %s réplicas de chunks_json",
+                expected["chunks"],
+                expected["replicas"],
+            )
+            chunks = await conn.fetchval(_SQL_MIGRATE_CHUNKS)
+            replicas = await conn.fetchval(_SQL_MIGRATE_REPLICAS)
+            if chunks != expected["chunks"] or replicas != expected["replicas"]:
+                raise DFSMetadataError(
+                    "Migración de chunks_json incompleta: "
+                    f"{chunks}/{expected['chunks']} chunks, "
+                    f"{replicas}/{expected['replicas']} réplicas copiadas; "
+                    "no se modificó la base"
+                )
+            await conn.execute(
+                "UPDATE files SET chunks_json = '[]'::jsonb WHERE chunks_json <> '[]'::jsonb"
+            )
+
+    def add_stats_listener(self, callback: Callable[[], None]) -> None:
+        """Registra un callback que se invoca con cada NOTIFY de _STATS_CHANNEL"""
+        self._stats_listeners.append(callback)
+
+    async def _start_stats_listener(self) -> None:
+        """
+        Abre la conexión que hace LISTEN de _STATS_CHANNEL. Si no se puede (p. ej.
+        PgBouncer en modo transaction no soporta LISTEN), las caches de stats
+        siguen funcionando solo con su TTL.
+        """
+        try:
+            self._listen_conn = await asyncpg.connect(
+                self.connection_string,
+                server_settings={"application_name": "dfs-metadata-listen"},
+            )
+            await self._listen_conn.add_listener(_STATS_CHANNEL, self._on_stats_changed)
+        except Exception as e:
+            logger.warning(f"LISTEN {_STATS_CHANNEL} no disponible, stats solo con TTL: {e}")
+            if self._listen_conn is not None:
+                await self._listen_conn.close()
+                self._listen_conn = None
+
+    def _on_stats_changed(self, conn, pid, channel, payload) -> None:
+        """Callback de asyncpg para cada NOTIFY recibido"""
+        for callback in self._stats_listeners:
+            callback()
+
+    async def _notify_stats_changed(self, conn: asyncpg.Connection) -> None:
+        """
+        Avisa a todos los workers (incluido este) que los agregados de stats
+        cambiaron. Es best effort: si falla, las caches expiran por TTL.
+        """
+        try:
+            await conn.execute(_SQL_NOTIFY_STATS)
+        except Exception as e:
+            logger.debug(f"NOTIFY {_STATS_CHANNEL} falló: {e}")
+
     async def close(self) -> None:
         """Cierra el pool de conexiones"""
-        if self.pool:
+        self._stop_event.set()
+        for task in self._sweep_tasks:
+            if not task.done():
+                await task
+        self._sweep_tasks = []
+        if self._listen_conn is not None:
+            await self._listen_conn.close()
+            self._listen_conn = None
+        if self._pool:
             await self.pool.close()
             self._pool = None
             logger.info("Conexión de metadata storage cerrada")
 
+    async def _periodic(self, interval: float, job) -> None:
+        """Task en background que ejecuta `job` cada `interval` segundos hasta close()"""
+        while True:
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"Error en barrido periódico {job.__name__}: {e}")
+
+    async def _mark_stale_nodes(self) -> None:
+        """
+        Marca INACTIVE los nodos sin heartbeat en node_timeout. Corre cada
+        node_timeout/4 segundos; registro y heartbeats no hacen este UPDATE.
+        """
+        threshold = datetime.now(timezone.utc) - timedelta(seconds=config.node_timeout)
+        async with self.pool.acquire() as conn:
+            marked = await conn.fetchval(_SQL_MARK_STALE_NODES, threshold)
+            if marked:
+                await self._notify_stats_changed(conn)
+        if marked:
+            logger.info("Nodos marcados inactivos: %s", marked)
+
     async def create_file_metadata(
         self, path: str, size: int, chunks: List[ChunkTarget],
         compressed: bool = False, original_size: Optional[int] = None
     ) -> FileMetadata:
         """Crea metadata de archivo"""
-        async with self.lock:
-            file_id = uuid4()
-            now = datetime.now(timezone.utc)
+        file_id = uuid4()
+        now = datetime.now(timezone.utc)
 
-            chunk_entries: List[ChunkEntry] = []
-            for i, chunk_target in enumerate(chunks):
-                chunk_entry = ChunkEntry(
-                    chunk_id=chunk_target.chunk_id,
-                    seq_index=i,
-                    size=chunk_target.size,
-                    replicas=[],
-                )
-                chunk_entries.append(chunk_entry)
-
-            file_metadata = FileMetadata(
-                file_id=file_id,
-                path=path,
-                size=size,
-                created_at=now,
-                modified_at=now,
-                chunks=chunk_entries,
-                compressed=compressed,
-                original_size=original_size,
+        # Los ChunkTarget ya vienen validados: se construye sin revalidar
+        chunk_entries: List[ChunkEntry] = [
+            ChunkEntry.model_construct(
+                chunk_id=target.chunk_id,
+                seq_index=i,
+                size=target.size,
+                checksum=None,
+                replicas=[],  # Se llenarán en commit
             )
+            for i, target in enumerate(chunks)
+        ]
+
+        file_metadata = FileMetadata(
+            file_id=file_id,
+            path=path,
+            size=size,
+            created_at=now,
+            modified_at=now,
+            chunks=chunk_entries,
+            compressed=compressed,
+            original_size=original_size,
+        )
 
-            chunks_json = json.dumps([c.model_dump(mode="json") for c in chunk_entries])
-
-            try:
-                async with self.pool.acquire() as conn:
-                    await conn.execute(
-                        """
-                        INSERT INTO files (file_id, path, size, created_at, modified_at, chunks_json, compressed, original_size)
-                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-                        """,
-                        file_id,
-                        path,
-                        size,
-                        now,
-                        now,
-                        chunks_json,
-                        compressed,
-                        original_size,
-                    )
+        try:
+            async with self.pool.acquire() as conn:
+                # Archivo y chunks en un solo statement (atómico)
+                await conn.execute(
+                    _SQL_INSERT_FILE,
+                    file_id,
+                    path,
+                    size,
+                    now,
+                    compressed,
+                    original_size,
+                    list(range(len(chunk_entries))),
+                    [c.chunk_id for c in chunk_entries],
+                    [c.size for c in chunk_entries],
+                )
+                await self._notify_stats_changed(conn)
 
-                logger.info(f"Metadata creada: {path} (ID: {file_id})")
-                return file_metadata
+            logger.info(f"Metadata creada: {path} (ID: {file_id})")
+            return file_metadata
 
-            except asyncpg.UniqueViolationError:
-                raise DFSMetadataError(f"Archivo ya existe: {path}")
-            except Exception as e:
-                raise DFSMetadataError(f"Error creando metadata: {e}")
+        except asyncpg.UniqueViolationError:
+            raise DFSMetadataError(f"Archivo ya existe: {path}")
+        except Exception as e:
+            raise DFSMetadataError(f"Error creando metadata: {e}")
 
     async def create_chunk_plan(
         self, chunk_size: int, target_nodes: List[str]
@@ -215,104 +847,155 @@ class PostgresMetadataStorage(MetadataStorageBase):
 
     async def commit_file(self, file_id: UUID, chunks: List[ChunkCommitInfo]) -> bool:
         """Confirma la subida de un archivo"""
-        async with self.lock:
-            try:
-                async with self.pool.acquire() as conn:
-                    row = await conn.fetchrow(
-                        "SELECT chunks_json FROM files WHERE file_id = $1", file_id
-                    )
-
-                    if not row:
-                        logger.error(f"Archivo no encontrado para commit: {file_id}")
-                        return False
-
-                    chunk_entries = [
-                        ChunkEntry(**c) for c in json.loads(row["chunks_json"])
-                    ]
-                    chunk_map = {str(c.chunk_id): c for c in chunk_entries}
-
-                    # Obtener información de nodos para construir URLs correctas
-                    node_info_map = {}
-                    for commit_info in chunks:
-                        for node_id in commit_info.nodes:
-                            if node_id not in node_info_map:
-                                node_row = await conn.fetchrow(
-                                    "SELECT host, port, zerotier_ip FROM nodes WHERE node_id = $1",
-                                    node_id
-                                )
-                                if node_row:
-                                    # Usar zerotier_ip si está disponible, sino host
-                                    host = node_row["zerotier_ip"] or node_row["host"]
-                                    port = node_row["port"]
-                                    # Filtrar IPs inválidas
-                                    if host and host != "0.0.0.0" and host != "unknown":
-                                        node_info_map[node_id] = f"http://{host}:{port}"
-                                    else:
-                                        logger.warning(f"Nodo {node_id} tiene IP inválida: {host}, ignorando")
-
-                    for commit_info in chunks:
-                        chunk_id_str = str(commit_info.chunk_id)
-                        if chunk_id_str in chunk_map:
-                            chunk = chunk_map[chunk_id_str]
-                            chunk.checksum = commit_info.checksum
-
-                            chunk.replicas = []
-                            for node_id in commit_info.nodes:
-                                # Solo crear réplica si el nodo tiene URL válida
-                                if node_id in node_info_map:
-                                    replica = ReplicaInfo(
-                                        node_id=node_id,
-                                        url=node_info_map[node_id],
-                                        state=ChunkState.COMMITTED,
-                                        last_heartbeat=datetime.now(timezone.utc),
-                                        checksum_verified=True,
-                                    )
-                                    chunk.replicas.append(replica)
-                                else:
-                                    logger.warning(f"No se encontró URL válida para nodo {node_id}, réplica ignorada")
-
-                    chunks_json = json.dumps(
-                        [c.model_dump(mode="json") for c in chunk_entries]
-                    )
-                    now = datetime.now(timezone.utc)
+        try:
+            # Un único timestamp para todas las réplicas y el modified_at
+            now = datetime.now(timezone.utc)
+            async with self.pool.acquire() as conn:
+                # URLs de todos los nodos del commit en una sola consulta
+                node_ids = list({n for c in chunks for n in c.nodes})
+                node_info_map = {}
+                node_rows = await conn.fetch(
+                    "SELECT node_id, host, port, zerotier_ip FROM nodes WHERE node_id = ANY($1::text[])",
+                    node_ids,
+                )
+                for node_row in node_rows:
+                    # Usar zerotier_ip si está disponible, sino host
+                    host = node_row["zerotier_ip"] or node_row["host"]
+                    # Filtrar IPs inválidas
+                    if host and host != "0.0.0.0" and host != "unknown":
+                        node_info_map[node_row["node_id"]] = f"http://{host}:{node_row['port']}"
+                    else:
+                        logger.warning(f"Nodo {node_row['node_id']} tiene IP inválida: {host}, ignorando")
+
+                # Checksum y nodos por chunk_id; si un chunk aparece dos veces
+                # gana el último
+                patches: Dict[UUID, ChunkCommitInfo] = {c.chunk_id: c for c in chunks}
+                replica_chunks: List[UUID] = []
+                replica_nodes: List[str] = []
+                replica_urls: List[str] = []
+                for chunk_id, commit_info in patches.items():
+                    # dict.fromkeys: sin nodos repetidos, conservando el orden
+                    for node_id in dict.fromkeys(commit_info.nodes):
+                        # Solo crear réplica si el nodo tiene URL válida
+                        if node_id in node_info_map:
+                            replica_chunks.append(chunk_id)
+                            replica_nodes.append(node_id)
+                            replica_urls.append(node_info_map[node_id])
+                        else:
+                            logger.warning(f"No se encontró URL válida para nodo {node_id}, réplica ignorada")
+
+                # Checksums y réplicas en un único statement atómico: Postgres
+                # serializa los commits concurrentes del mismo archivo con el
+                # lock de fila de files
+                committed = await conn.fetchval(
+                    _SQL_COMMIT_FILE,
+                    file_id,
+                    now,
+                    list(patches),
+                    [c.checksum for c in patches.values()],
+                    replica_chunks,
+                    replica_nodes,
+                    replica_urls,
+                )
 
-                    await conn.execute(
-                        "UPDATE files SET chunks_json = $1, modified_at = $2 WHERE file_id = $3",
-                        chunks_json,
-                        now,
-                        file_id,
-                    )
+                if committed is None:
+                    logger.error(f"Archivo no encontrado para commit: {file_id}")
+                    return False
 
-                logger.info(
-                    f"Commit exitoso para file_id={file_id}, {len(chunks)} chunks"
-                )
-                return True
+            logger.info(
+                f"Commit exitoso para file_id={file_id}, {len(chunks)} chunks"
+            )
+            return True
 
-            except Exception as e:
-                logger.error(f"Error en commit: {e}")
-                return False
+        except Exception as e:
+            logger.error(f"Error en commit: {e}")
+            return False
 
-    async def get_file_by_path(self, path: str) -> Optional[FileMetadata]:
+    async def get_file_by_path(
+        self, path: str, load_chunks: bool = True
+    ) -> Optional[FileMetadata]:
         """Obtiene metadata de archivo por path"""
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT * FROM files WHERE path = $1 AND is_deleted = FALSE", path
-            )
+            if not load_chunks:
+                # Sin chunks no se hace el JOIN con chunks/replicas
+                row = await conn.fetchrow(_SQL_GET_FILE_SUMMARY_BY_PATH, path)
+                return self._row_to_file_metadata(row) if row else None
 
-            if not row:
-                return None
+            # Una fila por réplica (o por chunk sin réplicas)
+            rows = await conn.fetch(_SQL_GET_FILE_BY_PATH, path)
 
-            return self._row_to_file_metadata(row)
+        files = self._files_from_rows(rows)
+        return files[0] if files else None
 
     async def list_files(
         self, prefix: Optional[str] = None, limit: int = 100, offset: int = 0
     ) -> List[FileMetadata]:
-        """Lista los archivos"""
+        """
+        Lista los archivos. Las páginas grandes (p. ej. el escaneo del
+        replicador) se leen con un cursor de servidor de a _LIST_PREFETCH filas:
+        cada archivo se arma al vuelo y no se acumulan todos los Record junto a
+        los modelos ya construidos.
+        """
+        if prefix:
+            sql, args = _SQL_LIST_FILES_PREFIX, (f"{prefix}%", limit, offset)
+        else:
+            sql, args = _SQL_LIST_FILES, (limit, offset)
+
+        if limit <= _LIST_PREFETCH:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(sql, *args)
+            return self._files_from_rows(rows)
+
+        return [f async for f in self._stream_files(sql, args)]
+
+    async def iter_files(
+        self, prefix: Optional[str] = None, limit: int = 100
+    ) -> AsyncIterator[FileMetadata]:
+        """
+        Recorre los archivos con un cursor de servidor: cada archivo se arma y
+        se entrega al caller sin construir la lista completa, así la memoria no
+        crece con el número de archivos del escaneo
+        """
+        if prefix:
+            sql, args = _SQL_LIST_FILES_PREFIX, (f"{prefix}%", limit, 0)
+        else:
+            sql, args = _SQL_LIST_FILES, (limit, 0)
+
+        # Al cerrar este generador se cierra también el interno, que devuelve
+        # la conexión al pool sin esperar al recolector
+        async with aclosing(self._stream_files(sql, args)) as files:
+            async for file_metadata in files:
+                yield file_metadata
+
+    async def _stream_files(self, sql: str, args: tuple) -> AsyncIterator[FileMetadata]:
+        """
+        Lee con un cursor una consulta de archivos con JOIN a chunks/replicas
+        (filas agrupadas por archivo) y entrega cada archivo completo
+        """
+        async with self.pool.acquire() as conn:
+            # Los cursores de asyncpg requieren una transacción
+            async with conn.transaction(readonly=True):
+                current: Optional[FileMetadata] = None
+                chunk: Optional[ChunkEntry] = None
+                async for row in conn.cursor(sql, *args, prefetch=_LIST_PREFETCH):
+                    if current is None or row[0] != current.file_id:
+                        if current is not None:
+                            yield current
+                        current = self._row_to_file_metadata(row)
+                        chunk = None
+                    chunk = _append_chunk_row(current.chunks, chunk, row)
+                if current is not None:
+                    yield current
+
+    async def list_files_summary(
+        self, prefix: Optional[str] = None, limit: int = 100, offset: int = 0
+    ) -> List[FileMetadata]:
+        """Lista los archivos sin chunks: solo columnas de files, sin JOIN"""
         async with self.pool.acquire() as conn:
             if prefix:
                 rows = await conn.fetch(
-                    """
-                    SELECT * FROM files 
+                    f"""
+                    SELECT {_FILE_COLUMNS} FROM files
                     WHERE is_deleted = FALSE AND path LIKE $1
                     ORDER BY path LIMIT $2 OFFSET $3
                     """,
@@ -322,9 +1005,9 @@ class PostgresMetadataStorage(MetadataStorageBase):
                 )
             else:
                 rows = await conn.fetch(
-                    """
-                    SELECT * FROM files 
-                    WHERE is_deleted = FALSE 
+                    f"""
+                    SELECT {_FILE_COLUMNS} FROM files
+                    WHERE is_deleted = FALSE
                     ORDER BY path LIMIT $1 OFFSET $2
                     """,
                     limit,
@@ -337,57 +1020,46 @@ class PostgresMetadataStorage(MetadataStorageBase):
         """Elimina un archivo"""
         logger.info(f"delete_file called - path: {path}, permanent: {permanent}")
         
-        async with self.lock:
-            try:
-                logger.info(f"Acquired lock for delete operation: {path}")
-                async with self.pool.acquire() as conn:
-                    logger.info(f"Database connection acquired for: {path}")
-                    
-                    if permanent:
-                        # Eliminación permanente
-                        logger.info(f"Executing permanent DELETE for: {path}")
-                        result = await conn.execute(
-                            "DELETE FROM files WHERE path = $1", path
-                        )
-                    else:
-                        # Soft delete
-                        logger.info(f"Executing soft delete UPDATE for: {path}")
-                        now = datetime.now(timezone.utc)
-                        result = await conn.execute(
-                            """
-                            UPDATE files 
-                            SET is_deleted = TRUE, deleted_at = $1 
-                            WHERE path = $2 AND is_deleted = FALSE
-                            """,
-                            now,
-                            path,
-                        )
+        try:
+            async with self.pool.acquire() as conn:
+                logger.info(f"Database connection acquired for: {path}")
+                
+                if permanent:
+                    # Eliminación permanente
+                    logger.info(f"Executing permanent DELETE for: {path}")
+                    deleted_id = await conn.fetchval(
+                        "DELETE FROM files WHERE path = $1 RETURNING file_id", path
+                    )
+                else:
+                    # Soft delete
+                    logger.info(f"Executing soft delete UPDATE for: {path}")
+                    now = datetime.now(timezone.utc)
+                    deleted_id = await conn.fetchval(
+                        """
+                        UPDATE files 
+                        SET is_deleted = TRUE, deleted_at = $1 
+                        WHERE path = $2 AND is_deleted = FALSE
+                        RETURNING file_id
+                        """,
+                        now,
+                        path,
+                    )
 
-                    logger.info(f"Query executed. Result: {result}")
-                    
-                    # PostgreSQL devuelve algo como "UPDATE 1" o "DELETE 1"
-                    # Extraemos el número de filas afectadas
-                    rows_affected = 0
-                    if result:
-                        try:
-                            rows_affected = int(result.split()[-1])
-                            logger.info(f"Parsed rows_affected: {rows_affected}")
-                        except (ValueError, IndexError) as parse_error:
-                            logger.warning(f"No se pudo parsear resultado: {result}, error: {parse_error}")
-                    
-                    success = rows_affected > 0
-
-                    if success:
-                        action = "eliminado permanentemente" if permanent else "marcado como eliminado"
-                        logger.info(f"Archivo {action}: {path}")
-                    else:
-                        logger.warning(f"Archivo no encontrado o ya eliminado: {path}, rows_affected={rows_affected}")
+                # path es único: RETURNING devuelve el file_id afectado o nada
+                success = deleted_id is not None
 
-                    return success
+                if success:
+                    await self._notify_stats_changed(conn)
+                    action = "eliminado permanentemente" if permanent else "marcado como eliminado"
+                    logger.info(f"Archivo {action}: {path}")
+                else:
+                    logger.warning(f"Archivo no encontrado o ya eliminado: {path}")
 
-            except Exception as e:
-                logger.error(f"Error eliminando archivo {path}: {e}", exc_info=True)
-                return False
+                return success
+
+        except Exception as e:
+            logger.error(f"Error eliminando archivo {path}: {e}", exc_info=True)
+            return False
 
     async def register_node(
         self,
@@ -402,96 +1074,62 @@ class PostgresMetadataStorage(MetadataStorageBase):
         rack: Optional[str] = None,
     ) -> None:
         """Registra o actualiza un nodo"""
-        async with self.lock:
-            now = datetime.now(timezone.utc)
-
-            host = zerotier_ip or "unknown"
-            port = 8001
-            if listening_ports and isinstance(listening_ports, dict):
-                try:
-                    port = int(listening_ports.get("storage", port))
-                except Exception:
-                    pass
-
-            total_space = (
-                int((capacity_gb or 0) * (1024**3)) if capacity_gb is not None else 0
-            )
-            free_space = total_space
+        now = datetime.now(timezone.utc)
 
-            async with self.pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    "SELECT node_id FROM nodes WHERE node_id = $1", node_id
-                )
+        host = zerotier_ip or "unknown"
+        port = 8001
+        if listening_ports and isinstance(listening_ports, dict):
+            try:
+                port = int(listening_ports.get("storage", port))
+            except Exception:
+                pass
 
-                if row:
-                    await conn.execute(
-                        """
-                        UPDATE nodes SET
-                            zerotier_node_id = $1,
-                            zerotier_ip = $2,
-                            host = $3,
-                            port = $4,
-                            rack = $5,
-                            total_space = $6,
-                            free_space = $7,
-                            version = $8,
-                            boot_token = $9,
-                            lease_ttl = $10,
-                            last_heartbeat = $11,
-                            state = $12
-                        WHERE node_id = $13
-                        """,
-                        zerotier_node_id,
-                        zerotier_ip,
-                        host,
-                        port,
-                        rack,
-                        total_space,
-                        free_space,
-                        version,
-                        boot_token,
-                        int(lease_ttl)
-                        if lease_ttl is not None
-                        else getattr(config, "lease_ttl", 60),
-                        now,
-                        NodeState.ACTIVE.value,
-                        node_id,
-                    )
-                else:
-                    await conn.execute(
-                        """
-                        INSERT INTO nodes
-                        (node_id, zerotier_node_id, zerotier_ip, host, port, rack, 
-                         free_space, total_space, chunk_count, last_heartbeat, state, 
-                         lease_ttl, version, boot_token)
-                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)
-                        """,
-                        node_id,
-                        zerotier_node_id,
-                        zerotier_ip,
-                        host,
-                        port,
-                        rack,
-                        free_space,
-                        total_space,
-                        0,
-                        now,
-                        NodeState.ACTIVE.value,
-                        int(lease_ttl)
-                        if lease_ttl is not None
-                        else getattr(config, "lease_ttl", 60),
-                        version,
-                        boot_token,
-                    )
+        total_space = (
+            int((capacity_gb or 0) * (1024**3)) if capacity_gb is not None else 0
+        )
+        free_space = total_space
 
-                threshold = now - timedelta(seconds=config.node_timeout)
-                await conn.execute(
-                    "UPDATE nodes SET state = $1 WHERE last_heartbeat < $2",
-                    NodeState.INACTIVE.value,
-                    threshold,
-                )
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO nodes
+                (node_id, zerotier_node_id, zerotier_ip, host, port, rack,
+                 free_space, total_space, chunk_count, last_heartbeat, state,
+                 lease_ttl, version, boot_token)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, 0, $9, $10, $11, $12, $13)
+                ON CONFLICT (node_id) DO UPDATE SET
+                    zerotier_node_id = EXCLUDED.zerotier_node_id,
+                    zerotier_ip = EXCLUDED.zerotier_ip,
+                    host = EXCLUDED.host,
+                    port = EXCLUDED.port,
+                    rack = EXCLUDED.rack,
+                    total_space = EXCLUDED.total_space,
+                    free_space = EXCLUDED.free_space,
+                    version = EXCLUDED.version,
+                    boot_token = EXCLUDED.boot_token,
+                    lease_ttl = EXCLUDED.lease_ttl,
+                    last_heartbeat = EXCLUDED.last_heartbeat,
+                    state = EXCLUDED.state
+                """,
+                node_id,
+                zerotier_node_id,
+                zerotier_ip,
+                host,
+                port,
+                rack,
+                free_space,
+                total_space,
+                now,
+                NodeState.ACTIVE.value,
+                int(lease_ttl)
+                if lease_ttl is not None
+                else getattr(config, "lease_ttl", 60),
+                version,
+                boot_token,
+            )
+            await self._notify_stats_changed(conn)
 
-            logger.info("Node registrado/actualizado: %s (%s)", node_id, zerotier_ip)
+        logger.info("Node registrado/actualizado: %s (%s)", node_id, zerotier_ip)
 
     async def update_node_heartbeat(
         self,
@@ -502,195 +1140,206 @@ class PostgresMetadataStorage(MetadataStorageBase):
         zerotier_ip: Optional[str] = None,
         zerotier_node_id: Optional[str] = None,
         url: Optional[str] = None,
+        cpu_pct: Optional[float] = None,
+        net_tx_bps: Optional[float] = None,
     ) -> None:
         """Actualiza heartbeat de un nodo"""
-        async with self.lock:
+        async with self._heartbeat_sem:
             now = datetime.now(timezone.utc)
-            threshold = now - timedelta(seconds=config.node_timeout)
 
             logger.info(f"Heartbeat de {node_id}: reportando {len(chunk_ids)} chunks")
 
+            # Nodo y réplicas en una sola transacción: si una parte falla no
+            # queda confirmada la otra (chunk_count/last_heartbeat del nodo
+            # coinciden siempre con sus filas de replicas)
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    "SELECT node_id FROM nodes WHERE node_id = $1", node_id
-                )
+                async with conn.transaction():
+                    await self._upsert_heartbeat_node(
+                        conn, node_id, free_space, total_space, len(chunk_ids), now,
+                        zerotier_ip, zerotier_node_id, url, cpu_pct, net_tx_bps,
+                    )
+                    # IMPORTANTE: Sincronizar réplicas SIEMPRE, incluso con chunk_ids
+                    # vacío. Esto permite eliminar réplicas cuando un nodo reporta 0 chunks
+                    await self._sync_replicas_from_heartbeats(
+                        conn,
+                        {
+                            node_id: (
+                                set(chunk_ids),
+                                url or f"http://{zerotier_ip or '0.0.0.0'}:{8001}",
+                            )
+                        },
+                    )
 
-                if row:
-                    query_parts = [
-                        "UPDATE nodes SET",
-                        "free_space = $1,",
-                        "total_space = $2,",
-                        "chunk_count = $3,",
-                        "last_heartbeat = $4,",
-                        "state = $5",
-                    ]
-                    params = [
-                        free_space,
-                        total_space,
-                        len(chunk_ids),
-                        now,
-                        NodeState.ACTIVE.value,
-                    ]
-                    param_count = 6
-
-                    if zerotier_ip and zerotier_ip.strip() and zerotier_ip != "0.0.0.0":
-                        query_parts.insert(-1, f"zerotier_ip = ${param_count},")
-                        params.append(zerotier_ip)
-                        param_count += 1
-                        query_parts.insert(-1, f"host = ${param_count},")
-                        params.append(zerotier_ip)
-                        param_count += 1
-
-                    if zerotier_node_id and zerotier_node_id.strip():
-                        query_parts.insert(-1, f"zerotier_node_id = ${param_count},")
-                        params.append(zerotier_node_id)
-                        param_count += 1
-
-                    if url:
-                        try:
-                            port_from_url = int(url.split(":")[-1].split("/")[0])
-                            query_parts.insert(-1, f"port = ${param_count},")
-                            params.append(port_from_url)
-                            param_count += 1
-                        except (ValueError, IndexError):
-                            pass
-
-                    query_parts.append(f"WHERE node_id = ${param_count}")
-                    params.append(node_id)
-
-                    query = " ".join(query_parts)
-                    await conn.execute(query, *params)
+            logger.debug("Heartbeat actualizado: %s (ZT IP: %s)", node_id, zerotier_ip)
 
-                else:
-                    host = zerotier_ip if zerotier_ip else "0.0.0.0"
-                    port = 8001
+    async def _upsert_heartbeat_node(
+        self,
+        conn: asyncpg.Connection,
+        node_id: str,
+        free_space: int,
+        total_space: int,
+        chunk_count: int,
+        now: datetime,
+        zerotier_ip: Optional[str],
+        zerotier_node_id: Optional[str],
+        url: Optional[str],
+        cpu_pct: Optional[float],
+        net_tx_bps: Optional[float],
+    ) -> None:
+        """Escribe la fila del nodo de un heartbeat en la conexión/transacción del caller"""
+        port = _port_from_url(url)
+        valid_ip = (
+            zerotier_ip
+            if zerotier_ip and zerotier_ip.strip() and zerotier_ip != "0.0.0.0"
+            else None
+        )
 
-                    if url:
-                        try:
-                            port = int(url.split(":")[-1].split("/")[0])
-                        except (ValueError, IndexError):
-                            pass
+        await conn.execute(
+            _SQL_UPSERT_HEARTBEAT_NODE,
+            node_id,
+            zerotier_ip if zerotier_ip else "0.0.0.0",
+            port,
+            zerotier_ip,
+            zerotier_node_id,
+            free_space,
+            total_space,
+            chunk_count,
+            now,
+            NodeState.ACTIVE.value,
+            cpu_pct,
+            net_tx_bps,
+            valid_ip,
+            zerotier_node_id
+            if zerotier_node_id and zerotier_node_id.strip()
+            else None,
+        )
 
-                    await conn.execute(
-                        """
-                        INSERT INTO nodes 
-                        (node_id, host, port, zerotier_ip, zerotier_node_id, 
-                         free_space, total_space, chunk_count, last_heartbeat, state)
-                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                        """,
-                        node_id,
-                        host,
-                        port,
-                        zerotier_ip,
-                        zerotier_node_id,
-                        free_space,
-                        total_space,
-                        len(chunk_ids),
-                        now,
-                        NodeState.ACTIVE.value,
-                    )
+    async def bulk_update_node_heartbeats(
+        self, heartbeats: List[HeartbeatRequest]
+    ) -> None:
+        """
+        Aplica un lote de heartbeats en una sola transacción.
+        Los nodos se actualizan e insertan con un único statement sobre unnest
+        (un round trip) y las réplicas de todo el lote se sincronizan con otro
+        sobre la tabla replicas.
+        Si el lote falla se revierte y se reintenta heartbeat a heartbeat.
+        """
+        if not heartbeats:
+            return
+        # ON CONFLICT DO UPDATE no admite dos filas del mismo nodo en un
+        # statement: de cada nodo queda el último heartbeat del lote
+        heartbeats = list({hb.node_id: hb for hb in heartbeats}.values())
+
+        failed = False
+        async with self._heartbeat_sem:
+            now = datetime.now(timezone.utc)
 
-                await conn.execute(
-                    "UPDATE nodes SET state = $1 WHERE last_heartbeat < $2",
-                    NodeState.INACTIVE.value,
-                    threshold,
+            node_ids, free, total, chunk_counts = [], [], [], []
+            valid_ips, zt_node_ids, cpu, net_tx, ports = [], [], [], [], []
+            hosts, insert_ports = [], []
+            raw_ips, raw_zt_node_ids = [], []
+            reports: Dict[str, Tuple[Set[UUID], str]] = {}
+
+            for hb in heartbeats:
+                port = _port_from_url(hb.url)
+
+                node_ids.append(hb.node_id)
+                free.append(hb.free_space)
+                total.append(hb.total_space)
+                chunk_counts.append(len(hb.chunk_ids))
+                # En el UPDATE los None conservan el valor actual vía COALESCE
+                valid_ips.append(
+                    hb.zerotier_ip
+                    if hb.zerotier_ip and hb.zerotier_ip.strip() and hb.zerotier_ip != "0.0.0.0"
+                    else None
                 )
-
-                # IMPORTANTE: Sincronizar réplicas SIEMPRE, incluso con chunk_ids vacío
-                # Esto permite eliminar réplicas cuando un nodo reporta 0 chunks
-                await self._update_replicas_from_heartbeat(
-                    node_id,
-                    chunk_ids,
-                    url or f"http://{zerotier_ip or '0.0.0.0'}:{8001}",
+                zt_node_ids.append(
+                    hb.zerotier_node_id
+                    if hb.zerotier_node_id and hb.zerotier_node_id.strip()
+                    else None
+                )
+                cpu.append(hb.cpu_pct)
+                net_tx.append(hb.net_tx_bps)
+                ports.append(port)
+                # Valores para nodos nuevos (mismos defaults que update_node_heartbeat)
+                hosts.append(hb.zerotier_ip if hb.zerotier_ip else "0.0.0.0")
+                insert_ports.append(port if port is not None else 8001)
+                raw_ips.append(hb.zerotier_ip)
+                raw_zt_node_ids.append(hb.zerotier_node_id)
+
+                reports[hb.node_id] = (
+                    set(hb.chunk_ids),
+                    hb.url or f"http://{hb.zerotier_ip or '0.0.0.0'}:{8001}",
                 )
 
-            logger.debug(f"Heartbeat actualizado: {node_id} (ZT IP: {zerotier_ip})")
+            try:
+                async with self.pool.acquire() as conn:
+                    async with conn.transaction():
+                        # Existentes y nodos aún no registrados en un solo upsert
+                        await conn.execute(
+                            _SQL_BULK_UPSERT_NODES,
+                            node_ids, free, total, chunk_counts,
+                            valid_ips, zt_node_ids, cpu, net_tx, ports,
+                            hosts, insert_ports, raw_ips, raw_zt_node_ids,
+                            now,
+                            NodeState.ACTIVE.value,
+                        )
 
-    async def _update_replicas_from_heartbeat(
-        self, node_id: str, chunk_ids: List[UUID], node_url: str
+                        # Sincronizar réplicas SIEMPRE, incluso con chunk_ids vacío
+                        await self._sync_replicas_from_heartbeats(conn, reports)
+            except Exception as e:
+                logger.error(f"Error aplicando lote de {len(heartbeats)} heartbeats: {e}")
+                failed = True
+            else:
+                logger.debug("Lote de heartbeats aplicado: %d nodos", len(heartbeats))
+
+        if failed:
+            # Reintento uno a uno (fuera del semáforo): un heartbeat inválido no descarta el resto
+            await super().bulk_update_node_heartbeats(heartbeats)
+
+    async def _sync_replicas_from_heartbeats(
+        self, conn: asyncpg.Connection, reports: Dict[str, Tuple[Set[UUID], str]]
     ) -> None:
-        """Actualiza las réplicas de los chunks basándose en el heartbeat"""
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch(
-                "SELECT file_id, chunks_json FROM files WHERE is_deleted = FALSE"
-            )
+        """
+        Sincroniza la tabla replicas con los chunks reportados por uno o más
+        nodos (_SQL_SYNC_REPLICAS). `reports` mapea node_id -> (chunk_ids
+        reportados, url del nodo); se ejecuta en la conexión/transacción del caller.
+        """
+        pair_nodes: List[str] = []
+        pair_chunks: List[UUID] = []
+        for node_id, (chunk_ids, _) in reports.items():
+            pair_nodes.extend([node_id] * len(chunk_ids))
+            pair_chunks.extend(chunk_ids)
+
+        rows = await conn.fetch(
+            _SQL_SYNC_REPLICAS,
+            pair_nodes,
+            pair_chunks,
+            list(reports),
+            [node_url for _, node_url in reports.values()],
+        )
 
-            chunk_ids_str = {str(c) for c in chunk_ids}
-            updated_files = 0
-            replicas_added = 0
-            replicas_removed = 0
-
-            for row in rows:
-                file_id = row["file_id"]
-                chunks_data = json.loads(row["chunks_json"])
-                file_modified = False
-
-                for chunk in chunks_data:
-                    chunk_id = chunk.get("chunk_id")
-                    replicas = chunk.get("replicas", [])
-
-                    if chunk_id in chunk_ids_str:
-                        replica_exists = False
-                        for replica in replicas:
-                            if replica.get("node_id") == node_id:
-                                if replica.get("state") != "committed":
-                                    replica["state"] = "committed"
-                                    file_modified = True
-                                if replica.get("url") != node_url:
-                                    replica["url"] = node_url
-                                    file_modified = True
-                                replica_exists = True
-                                break
-
-                        if not replica_exists:
-                            replicas.append(
-                                {
-                                    "node_id": node_id,
-                                    "url": node_url,
-                                    "state": "committed",
-                                    "checksum_verified": False,
-                                }
-                            )
-                            chunk["replicas"] = replicas
-                            file_modified = True
-                            replicas_added += 1
+        replicas_synced = sum(r["synced"] for r in rows)
+        replicas_removed = sum(r["removed"] for r in rows)
+        if replicas_synced or replicas_removed:
+            logger.info(
+                f"Sincronización de réplicas desde {len(reports)} heartbeats: "
+                f"+{replicas_synced} réplicas agregadas/actualizadas, "
+                f"-{replicas_removed} réplicas eliminadas"
+            )
 
-                    else:
-                        original_count = len(replicas)
-                        replicas = [r for r in replicas if r.get("node_id") != node_id]
-
-                        if len(replicas) < original_count:
-                            chunk["replicas"] = replicas
-                            file_modified = True
-                            replicas_removed += 1
-
-                if file_modified:
-                    await conn.execute(
-                        "UPDATE files SET chunks_json = $1, modified_at = $2 WHERE file_id = $3",
-                        json.dumps(chunks_data),
-                        datetime.now(timezone.utc),
-                        file_id,
-                    )
-                    updated_files += 1
-
-            if updated_files > 0 or replicas_added > 0 or replicas_removed > 0:
-                logger.info(
-                    f"Sincronización de réplicas desde heartbeat de {node_id}: "
-                    f"{updated_files} archivos actualizados, "
-                    f"+{replicas_added} réplicas agregadas, "
-                    f"-{replicas_removed} réplicas eliminadas"
-                )
-            
-            if replicas_removed > 0:
+        for row in rows:
+            if row["removed"]:
                 logger.warning(
-                    f"Nodo {node_id} perdió {replicas_removed} réplicas "
-                    f"(reportó {len(chunk_ids)} chunks). Re-replicación activada."
+                    f"Nodo {row['node_id']} perdió {row['removed']} réplicas "
+                    f"(reportó {len(reports[row['node_id']][0])} chunks). "
+                    "Re-replicación activada."
                 )
 
     async def get_node(self, node_id: str) -> Optional[NodeInfo]:
         """Obtiene información de un nodo"""
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow("SELECT * FROM nodes WHERE node_id = $1", node_id)
+            row = await conn.fetchrow(_SQL_GET_NODE, node_id)
 
             if not row:
                 return None
@@ -700,7 +1349,7 @@ class PostgresMetadataStorage(MetadataStorageBase):
     async def list_nodes(self) -> List[NodeInfo]:
         """Lista todos los nodos"""
         async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT * FROM nodes ORDER BY last_heartbeat DESC")
+            rows = await conn.fetch(_SQL_LIST_NODES)
             return [self._row_to_node_info(row) for row in rows]
 
     async def get_active_nodes(self) -> List[NodeInfo]:
@@ -708,15 +1357,7 @@ class PostgresMetadataStorage(MetadataStorageBase):
         threshold = datetime.now(timezone.utc) - timedelta(seconds=config.node_timeout)
 
         async with self.pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT * FROM nodes 
-                WHERE state = $1 AND last_heartbeat > $2
-                ORDER BY free_space DESC
-                """,
-                NodeState.ACTIVE.value,
-                threshold,
-            )
+            rows = await conn.fetch(_SQL_GET_ACTIVE_NODES, threshold)
 
             return [self._row_to_node_info(row) for row in rows]
 
@@ -724,146 +1365,120 @@ class PostgresMetadataStorage(MetadataStorageBase):
         self, path: str, operation: str, timeout_seconds: int
     ) -> Optional[LeaseResponse]:
         """Adquiere un lease"""
-        async with self.lock:
-            await self._cleanup_expired_leases_internal()
-
-            now = datetime.now(timezone.utc)
-
-            async with self.pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    "SELECT lease_id FROM leases WHERE path = $1 AND expires_at > $2",
-                    path,
-                    now,
-                )
+        now = datetime.now(timezone.utc)
+        lease_id = uuid4()
+        expires_at = now + timedelta(seconds=timeout_seconds)
 
-                if row:
-                    return None
+        # Un único statement atómico: el índice único sobre path decide entre
+        # leases concurrentes y un lease expirado del mismo path se reemplaza
+        async with self.pool.acquire() as conn:
+            acquired = await conn.fetchval(
+                _SQL_INSERT_LEASE, lease_id, path, operation, expires_at, now
+            )
 
-                lease_id = uuid4()
-                expires_at = now + timedelta(seconds=timeout_seconds)
+        if acquired is None:
+            return None  # Ya existe un lease activo
 
-                await conn.execute(
-                    """
-                    INSERT INTO leases (lease_id, path, operation, expires_at)
-                    VALUES ($1, $2, $3, $4)
-                    """,
-                    lease_id,
-                    path,
-                    operation,
-                    expires_at,
-                )
-
-                logger.info(f"Lease adquirido: {path} (ID: {lease_id})")
-                return LeaseResponse(
-                    lease_id=lease_id, path=path, expires_at=expires_at
-                )
+        logger.info(f"Lease adquirido: {path} (ID: {lease_id})")
+        return LeaseResponse(lease_id=lease_id, path=path, expires_at=expires_at)
 
     async def release_lease(self, lease_id: UUID) -> bool:
         """Libera un lease"""
-        async with self.lock:
-            async with self.pool.acquire() as conn:
-                result = await conn.execute(
-                    "DELETE FROM leases WHERE lease_id = $1", lease_id
-                )
+        async with self.pool.acquire() as conn:
+            released = await conn.fetchval(
+                "DELETE FROM leases WHERE lease_id = $1 RETURNING lease_id", lease_id
+            )
 
-                success = result.split()[-1] != "0"
-                if success:
-                    logger.info(f"Lease liberado: {lease_id}")
+            success = released is not None
+            if success:
+                logger.info(f"Lease liberado: {lease_id}")
 
-                return success
+            return success
 
     async def cleanup_expired_leases(self) -> None:
-        """Limpia leases expirados (API pública con lock)"""
-        async with self.lock:
-            await self._cleanup_expired_leases_internal()
+        """Limpia leases expirados"""
+        await self._cleanup_expired_leases_internal()
 
     async def _cleanup_expired_leases_internal(self) -> None:
-        """Limpia leases expirados (versión interna sin lock)"""
+        """
+        Limpia leases expirados (un único DELETE). Corre cada lease_ttl
+        segundos; acquire_lease no purga, solo reemplaza el expirado de su path.
+        """
         now = datetime.now(timezone.utc)
         async with self.pool.acquire() as conn:
-            result = await conn.execute(
-                "DELETE FROM leases WHERE expires_at <= $1", now
-            )
+            count = await conn.fetchval(_SQL_DELETE_EXPIRED_LEASES, now)
 
-            count = result.split()[-1]
-            if count != "0":
-                logger.debug(f"Limpiados {count} leases expirados")
+            if count:
+                logger.debug("Limpiados %s leases expirados", count)
 
     async def get_system_stats(self) -> dict:
         """Obtiene estadísticas del sistema"""
-        async with self.pool.acquire() as conn:
-            files_row = await conn.fetchrow(
-                "SELECT COUNT(*) as count, SUM(size) as total_size FROM files WHERE is_deleted = FALSE"
-            )
-
-            total_size = files_row["total_size"] or 0
-            files = await self.list_files(limit=10000)
-            total_chunks = sum(len(file.chunks) for file in files)
-
-            nodes = await self.list_nodes()
-            active_nodes = [n for n in nodes if n.state == NodeState.ACTIVE]
+        # Los agregados de archivos y de nodos son independientes: se lanzan en
+        # dos conexiones del pool para solapar los round trips
+        files_row, nodes_row = await asyncio.gather(
+            self._fetch_file_stats(), self._fetch_node_stats()
+        )
+        return {**files_row, **nodes_row}
 
-            total_space = sum(n.total_space for n in active_nodes)
-            free_space = sum(n.free_space for n in active_nodes)
-            used_space = total_space - free_space
+    async def _fetch_file_stats(self):
+        """Agregados de archivos activos; el conteo de chunks sale de la tabla chunks"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow(_SQL_FILE_STATS)
 
-            return {
-                "total_files": files_row["count"],
-                "total_chunks": total_chunks,
-                "total_size": total_size,
-                "total_nodes": len(nodes),
-                "active_nodes": len(active_nodes),
-                "total_space": total_space,
-                "used_space": used_space,
-                "free_space": free_space,
-            }
+    async def _fetch_node_stats(self):
+        """Agregados de nodos; espacio solo de los nodos activos"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow(_SQL_NODE_STATS, NodeState.ACTIVE.value)
+
+    def _files_from_rows(self, rows) -> List[FileMetadata]:
+        """
+        Agrupa las filas de una consulta con JOIN a chunks/replicas (contiguas
+        por archivo y por chunk) en una lista de FileMetadata
+        """
+        files: List[FileMetadata] = []
+        current: Optional[FileMetadata] = None
+        chunk: Optional[ChunkEntry] = None
+        for row in rows:
+            if current is None or row[0] != current.file_id:
+                current = self._row_to_file_metadata(row)
+                files.append(current)
+                chunk = None
+            chunk = _append_chunk_row(current.chunks, chunk, row)
+        return files
 
     def _row_to_file_metadata(self, row) -> FileMetadata:
-        """Convierte una fila de la BD a FileMetadata"""
-        chunks = [ChunkEntry(**c) for c in json.loads(row["chunks_json"])]
-
-        return FileMetadata(
-            file_id=row["file_id"],
-            path=row["path"],
-            size=row["size"],
-            created_at=row["created_at"],
-            modified_at=row["modified_at"],
-            chunks=chunks,
-            is_deleted=row["is_deleted"],
-            deleted_at=row["deleted_at"] if row["deleted_at"] else None,
-            compressed=row.get("compressed", False),
-            original_size=row.get("original_size"),
+        """
+        Convierte una fila de la BD a FileMetadata, con la lista de chunks vacía
+        (la llenan los JOIN con chunks/replicas). asyncpg ya entrega UUID,
+        datetime y bool, así que el modelo se construye sin validar.
+        """
+        # Acceso por posición (orden de _FILE_COLUMNS): índice directo en el
+        # Record en vez de buscar cada columna por nombre
+        return FileMetadata.model_construct(
+            file_id=row[0],
+            path=row[1],
+            size=row[2],
+            created_at=row[3],
+            modified_at=row[4],
+            chunks=[],
+            is_deleted=row[5],
+            deleted_at=row[6],
+            compressed=row[7],
+            original_size=row[8],
         )
 
     def _row_to_node_info(self, row) -> NodeInfo:
-        """Convierte una fila de la BD a NodeInfo"""
-        host = row.get("zerotier_ip") or row["host"]
-
-        return NodeInfo(
-            node_id=row["node_id"],
-            host=host,
-            port=row["port"],
-            rack=row["rack"],
-            free_space=row["free_space"],
-            total_space=row["total_space"],
-            chunk_count=row["chunk_count"],
-            last_heartbeat=row["last_heartbeat"],
-            state=NodeState(row["state"]),
+        """Convierte una fila de la BD a NodeInfo (columnas de _NODE_COLUMNS, por posición)"""
+        return NodeInfo.model_construct(
+            node_id=row[0],
+            host=row[9] or row[1],
+            port=row[2],
+            rack=row[3],
+            free_space=row[4],
+            total_space=row[5],
+            chunk_count=row[6],
+            last_heartbeat=row[7],
+            state=NodeState(row[8]),
+            cpu_pct=row[10] or 0.0,
+            net_tx_bps=row[11] or 0.0,
         )
-
-    def _node_id_to_url(self, node_id: str) -> str:
-        """Convierte node_id a URL"""
-        host, port = self._parse_node_id(node_id)
-        return f"http://{host}:{port}"
-
-    def _parse_node_id(self, node_id: str) -> Tuple[str, int]:
-        """Parsea node_id para extraer host y puerto"""
-        parts = node_id.split("-")
-        if len(parts) >= 3:
-            host = parts[1]
-            try:
-                port = int(parts[2])
-                return host, port
-            except ValueError:
-                pass
-        return "localhost", 8001
\ No newline at end of file
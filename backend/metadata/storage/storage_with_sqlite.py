@@ -1,12 +1,13 @@
 import asyncio
-import json
 import logging
 import sqlite3
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 from uuid import UUID, uuid4
 
+import orjson
+
 from core.config import config
 from core.exceptions import DFSMetadataError
 from shared.models import (
@@ -15,6 +16,7 @@ from shared.models import (
     ChunkTarget,
     ChunkCommitInfo,
     FileMetadata,
+    HeartbeatRequest,
     LeaseResponse,
     NodeInfo,
     NodeState,
@@ -24,6 +26,245 @@ from shared.protocols import MetadataStorageBase
 
 logger = logging.getLogger(__name__)
 
+# Los chunks y réplicas viven en las tablas chunks/replicas. La columna
+# files.chunks_json solo se lee al migrar filas antiguas.
+
+# Máximo de parámetros por "IN (...)" (SQLITE_MAX_VARIABLE_NUMBER antiguo = 999)
+_IN_BATCH = 500
+
+# Consultas de lectura frecuentes: mismo texto siempre, así el cache de
+# sentencias preparadas de sqlite3 las reutiliza
+# Solo las columnas que usan _row_to_file_metadata/_row_to_node_info, que las
+# desempaquetan en este orden: deja fuera chunks_json y los campos
+# de registro (boot_token, version...)
+_FILE_COLUMNS = """
+    file_id, path, size, created_at, modified_at, is_deleted, deleted_at,
+    compressed, original_size
+"""
+_NODE_COLUMNS = """
+    node_id, host, port, rack, free_space, total_space, chunk_count,
+    last_heartbeat, state, zerotier_ip, cpu_pct, net_tx_bps
+"""
+
+_SQL_FILE_BY_PATH = f"SELECT {_FILE_COLUMNS} FROM files WHERE path = ? AND is_deleted = 0"
+_SQL_NODE_BY_ID = f"SELECT {_NODE_COLUMNS} FROM nodes WHERE node_id = ?"
+_SQL_LIST_NODES = f"SELECT {_NODE_COLUMNS} FROM nodes ORDER BY last_heartbeat DESC"
+# Solo nodos activos: recorre el rango (state, last_heartbeat) de idx_nodes_state_heartbeat
+_SQL_MARK_STALE_NODES = "UPDATE nodes SET state = ? WHERE state = ? AND last_heartbeat < ?"
+_SQL_ACTIVE_NODES = f"""
+    SELECT {_NODE_COLUMNS} FROM nodes
+    WHERE state = ? AND last_heartbeat > ?
+    ORDER BY free_space DESC
+"""
+# Estadísticas del sistema en una sola fila, ya con las claves y el orden de
+# get_system_stats (espacio solo de los nodos activos, :active)
+_SQL_SYSTEM_STATS = """
+    SELECT
+        (SELECT COUNT(*) FROM files WHERE is_deleted = 0) AS total_files,
+        (SELECT COUNT(*) FROM chunks c
+         JOIN files f ON f.file_id = c.file_id
+         WHERE f.is_deleted = 0) AS total_chunks,
+        (SELECT COALESCE(SUM(size), 0) FROM files WHERE is_deleted = 0) AS total_size,
+        COUNT(*) AS total_nodes,
+        COALESCE(SUM(state = :active), 0) AS active_nodes,
+        COALESCE(SUM(CASE WHEN state = :active THEN total_space END), 0) AS total_space,
+        COALESCE(SUM(CASE WHEN state = :active THEN total_space - free_space END), 0)
+            AS used_space,
+        COALESCE(SUM(CASE WHEN state = :active THEN free_space END), 0) AS free_space
+    FROM nodes
+"""
+
+_SQL_INSERT_CHUNK = """
+    INSERT OR IGNORE INTO chunks (file_id, seq_index, chunk_id, size, checksum)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+_SQL_UPSERT_REPLICA = """
+    INSERT OR REPLACE INTO replicas
+    (chunk_id, node_id, url, state, last_heartbeat, checksum_verified)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+# Heartbeat como upsert: el INSERT usa los defaults de un nodo nuevo y el UPDATE
+# conserva vía COALESCE los campos opcionales que el heartbeat no trae
+_SQL_UPSERT_NODE_HEARTBEAT = """
+    INSERT INTO nodes
+    (node_id, host, port, zerotier_ip, zerotier_node_id, free_space, total_space,
+     chunk_count, last_heartbeat, state, cpu_pct, net_tx_bps)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (node_id) DO UPDATE SET
+        free_space = excluded.free_space,
+        total_space = excluded.total_space,
+        chunk_count = excluded.chunk_count,
+        last_heartbeat = excluded.last_heartbeat,
+        state = excluded.state,
+        zerotier_ip = COALESCE(?, nodes.zerotier_ip),
+        host = COALESCE(?, nodes.host),
+        zerotier_node_id = COALESCE(?, nodes.zerotier_node_id),
+        cpu_pct = COALESCE(?, nodes.cpu_pct),
+        net_tx_bps = COALESCE(?, nodes.net_tx_bps),
+        port = COALESCE(?, nodes.port)
+"""
+
+
+def _heartbeat_node_row(
+    node_id: str,
+    free_space: int,
+    total_space: int,
+    chunk_count: int,
+    now_us: int,
+    zerotier_ip: Optional[str],
+    zerotier_node_id: Optional[str],
+    url: Optional[str],
+    cpu_pct: Optional[float],
+    net_tx_bps: Optional[float],
+) -> tuple:
+    """Parámetros de _SQL_UPSERT_NODE_HEARTBEAT para un heartbeat"""
+    port = _port_from_url(url)
+    # Solo una IP de ZeroTier válida reemplaza host/zerotier_ip de un nodo existente
+    valid_ip = (
+        zerotier_ip
+        if zerotier_ip and zerotier_ip.strip() and zerotier_ip != "0.0.0.0"
+        else None
+    )
+    valid_zt_node_id = (
+        zerotier_node_id if zerotier_node_id and zerotier_node_id.strip() else None
+    )
+    return (
+        # INSERT
+        node_id,
+        zerotier_ip if zerotier_ip else "0.0.0.0",
+        port if port is not None else 8001,
+        zerotier_ip,
+        zerotier_node_id,
+        free_space,
+        total_space,
+        chunk_count,
+        now_us,
+        NodeState.ACTIVE.value,
+        cpu_pct or 0.0,
+        net_tx_bps or 0.0,
+        # ON CONFLICT DO UPDATE
+        valid_ip,
+        valid_ip,
+        valid_zt_node_id,
+        cpu_pct,
+        net_tx_bps,
+        port,
+    )
+
+
+# Timestamps guardados como INTEGER (microsegundos desde epoch, UTC): los
+# umbrales de heartbeat/leases son comparaciones enteras y leer no parsea ISO
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+
+_TIMESTAMP_COLUMNS = {
+    "files": ("created_at", "modified_at", "deleted_at"),
+    "nodes": ("last_heartbeat",),
+    "replicas": ("last_heartbeat",),
+    "leases": ("expires_at",),
+}
+
+
+def _to_us(dt: datetime) -> int:
+    """datetime -> microsegundos desde epoch (un datetime naive se asume UTC)"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // _US
+
+
+def _from_us(value: int) -> datetime:
+    """Microsegundos desde epoch -> datetime UTC"""
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def _iso_to_us(value) -> Optional[int]:
+    """Convierte un timestamp ISO 8601 de una base antigua; enteros y NULL quedan igual"""
+    if value is None or isinstance(value, int):
+        return value
+    return _to_us(datetime.fromisoformat(value))
+
+
+def _chunk_rows(file_id: str, chunks: List[ChunkEntry]) -> List[tuple]:
+    """Filas de la tabla chunks para los chunks de un archivo"""
+    return [
+        (file_id, c.seq_index, str(c.chunk_id), c.size, c.checksum)
+        for c in chunks
+    ]
+
+
+def _replica_rows(chunks: List[ChunkEntry]) -> List[tuple]:
+    """Filas de la tabla replicas para las réplicas de una lista de chunks"""
+    return [
+        (
+            str(c.chunk_id),
+            r.node_id,
+            r.url,
+            r.state.value,
+            _to_us(r.last_heartbeat) if r.last_heartbeat else None,
+            int(r.checksum_verified),
+        )
+        for c in chunks
+        for r in c.replicas
+    ]
+
+
+# Columnas de chunk/réplica en las consultas con JOIN (alias para no chocar
+# con files.size y nodes.last_heartbeat)
+_SQL_CHUNK_COLUMNS = """
+    c.chunk_id, c.seq_index, c.size AS chunk_size, c.checksum,
+    r.node_id, r.url, r.state, r.last_heartbeat AS replica_heartbeat,
+    r.checksum_verified
+"""
+
+
+def _chunk_entry(cols: tuple) -> ChunkEntry:
+    """ChunkEntry (sin réplicas) de las columnas de _SQL_CHUNK_COLUMNS"""
+    chunk_id, seq_index, size, checksum = cols[:4]
+    # Filas escritas por este storage: se construye sin validar
+    return ChunkEntry.model_construct(
+        chunk_id=UUID(chunk_id),
+        seq_index=seq_index,
+        size=size,
+        checksum=checksum,
+        replicas=[],
+    )
+
+
+def _replica_info(cols: tuple) -> ReplicaInfo:
+    """ReplicaInfo de las columnas de _SQL_CHUNK_COLUMNS"""
+    node_id, url, state, last_heartbeat, checksum_verified = cols[4:9]
+    return ReplicaInfo.model_construct(
+        node_id=node_id,
+        url=url,
+        state=ChunkState(state),
+        last_heartbeat=_from_us(last_heartbeat) if last_heartbeat else None,
+        checksum_verified=bool(checksum_verified),
+    )
+
+
+def _tuples(conn: sqlite3.Connection, sql: str, params=()) -> sqlite3.Cursor:
+    """
+    Ejecuta `sql` en un cursor que devuelve tuplas en lugar de sqlite3.Row: los
+    conversores de filas calientes desempaquetan por posición en vez de buscar
+    cada columna por nombre.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor.execute(sql, params)
+
+
+def _port_from_url(url: Optional[str]) -> Optional[int]:
+    """Extrae el puerto de una URL tipo http://host:port/...; None si no se puede"""
+    if not url:
+        return None
+    try:
+        return int(url.split(":")[-1].split("/")[0])
+    except (ValueError, IndexError):
+        return None
+
 
 class SQLiteMetadataStorage(MetadataStorageBase):
     """
@@ -40,7 +281,18 @@ class SQLiteMetadataStorage(MetadataStorageBase):
         self.db_path: str = resolved
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
         self.conn: Optional[sqlite3.Connection] = None
+        # Pool de conexiones de solo lectura, usadas desde hilos (asyncio.to_thread);
+        # en WAL no las bloquean las escrituras en curso de self.conn y varias
+        # lecturas avanzan en paralelo. La cola guarda las conexiones libres y es
+        # LIFO: con poca concurrencia se reutiliza la conexión usada más
+        # recientemente, cuya caché de páginas está caliente, en lugar de rotar
+        # por todas y repartir las lecturas entre cachés frías.
+        self.read_conns: List[sqlite3.Connection] = []
+        self._readers: Optional[asyncio.LifoQueue] = None
         self.lock = asyncio.Lock()
+        # Barrido periódico de nodos sin heartbeat (fuera de registro/heartbeats)
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._stop_event = asyncio.Event()
 
     @property
     def _conn(self) -> sqlite3.Connection:
@@ -51,28 +303,149 @@ class SQLiteMetadataStorage(MetadataStorageBase):
             )
         return self.conn
 
+    async def _read(self, fn, *args):
+        """
+        Ejecuta `fn(conn, *args)` en un hilo con una conexión libre del pool de
+        lectura, sin bloquear el event loop ni esperar al lock de escritura.
+
+        self.lock queda solo para escritores (_write: create/commit/delete,
+        nodos y leases): en WAL una lectura nunca espera a una escritura en curso.
+        """
+        if self._readers is None:
+            # Base en memoria: solo existe la conexión de escritura
+            return fn(self._conn, *args)
+
+        conn = await self._readers.get()
+        task = asyncio.ensure_future(asyncio.to_thread(fn, conn, *args))
+        # La conexión vuelve a la cola cuando termina el hilo, aunque el llamador
+        # se cancele antes: así nunca la usan dos hilos a la vez
+        task.add_done_callback(lambda t: self._release_reader(conn, t))
+        return await asyncio.shield(task)
+
+    def _release_reader(self, conn: sqlite3.Connection, task: asyncio.Future) -> None:
+        """Devuelve una conexión de lectura al pool"""
+        if not task.cancelled():
+            # Recupera la excepción aunque el llamador ya no espere el resultado
+            task.exception()
+        if self._readers is not None:
+            self._readers.put_nowait(conn)
+
+    async def _write(self, fn, *args):
+        """
+        Ejecuta `fn(conn, *args)` en un hilo con la conexión de escritura y
+        self.lock tomado. Las sentencias y el fsync del commit no bloquean el
+        event loop, que sigue atendiendo lecturas y heartbeats mientras tanto.
+
+        `fn` hace su propio commit (o rollback si falla); la construcción y
+        validación de modelos queda en el llamador, fuera del hilo.
+        """
+        if self._readers is None:
+            # Base en memoria: las lecturas usan esta misma conexión desde el
+            # event loop, así que la escritura también corre ahí
+            async with self.lock:
+                return fn(self._conn, *args)
+
+        await self.lock.acquire()
+        try:
+            task = asyncio.ensure_future(asyncio.to_thread(fn, self._conn, *args))
+        except BaseException:
+            self.lock.release()
+            raise
+        # El lock se libera cuando termina el hilo, aunque el llamador se
+        # cancele antes: la conexión nunca la usan dos hilos a la vez
+        task.add_done_callback(self._release_writer)
+        return await asyncio.shield(task)
+
+    def _release_writer(self, task: asyncio.Future) -> None:
+        """Libera el lock de escritura al terminar el hilo de _write"""
+        if not task.cancelled():
+            task.exception()
+        self.lock.release()
+
     async def initialize(self) -> None:
         """Inicializa la base de datos"""
+        if sqlite3.sqlite_version_info < (3, 35, 0):
+            # UPDATE/DELETE ... RETURNING (y los upserts) lo necesitan
+            raise DFSMetadataError(
+                f"Se requiere SQLite >= 3.35, disponible: {sqlite3.sqlite_version}"
+            )
+
         try:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn = sqlite3.connect(
+                self.db_path, check_same_thread=False, cached_statements=256
+            )
             self.conn.row_factory = sqlite3.Row
+            self._apply_pragmas(self.conn)
             await self._create_tables()
+
+            # Una base en memoria no se comparte entre conexiones
+            if self.db_path != ":memory:":
+                self._readers = asyncio.LifoQueue()
+                for _ in range(max(1, config.sqlite_read_connections)):
+                    read_conn = sqlite3.connect(
+                        self.db_path, check_same_thread=False, cached_statements=256
+                    )
+                    read_conn.row_factory = sqlite3.Row
+                    self._apply_pragmas(read_conn)
+                    read_conn.execute("PRAGMA query_only=ON")
+                    self.read_conns.append(read_conn)
+                    self._readers.put_nowait(read_conn)
+
+            self._stop_event.clear()
+            if config.run_background:
+                self._sweep_task = asyncio.create_task(self._stale_node_sweeper())
             logger.info(f"Metadata storage inicializado: {self.db_path}")
         except Exception as e:
             raise DFSMetadataError(f"Error inicializando storage: {e}")
 
+    def _apply_pragmas(self, conn: sqlite3.Connection) -> None:
+        """
+        Ajusta la conexión para cargas con muchos commits pequeños.
+        WAL permite lecturas concurrentes con una escritura en curso y, junto con
+        synchronous=NORMAL, reduce cada commit a un append en el -wal (el modo WAL
+        queda persistido en la cabecera del archivo).
+        """
+        pragmas = [
+            # Solo tiene efecto en una base nueva: debe ir antes de pasar a WAL,
+            # que es lo que escribe la cabecera del archivo
+            "PRAGMA page_size=8192",
+            "PRAGMA journal_mode=WAL",
+            "PRAGMA synchronous=NORMAL",
+            "PRAGMA temp_store=MEMORY",
+            # Techos, no reservas: los recorridos de list_files/get_active_nodes
+            # leen páginas del archivo mapeado en vez de hacer un read() por página
+            "PRAGMA cache_size=-131072",  # 128 MB
+            "PRAGMA mmap_size=1073741824",  # 1 GB
+            "PRAGMA busy_timeout=5000",
+            # Checkpoint automático cada ~1000 páginas del -wal; tras cada
+            # checkpoint el archivo -wal se trunca a 64 MB como máximo
+            "PRAGMA wal_autocheckpoint=1000",
+            "PRAGMA journal_size_limit=67108864",
+        ]
+
+        for pragma_sql in pragmas:
+            conn.execute(pragma_sql)
+
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        if journal_mode.lower() != "wal":
+            # p. ej. bases en memoria o sistemas de archivos sin soporte de WAL
+            logger.warning("SQLite no pudo activar WAL (journal_mode=%s)", journal_mode)
+
     async def _create_tables(self) -> None:
         """Crea las tablas necesarias (ahora con campos extendidos para nodos)."""
+        # Bases creadas con timestamps TEXT: se apartan antes de crear las tablas
+        self._detach_iso_timestamp_tables()
+
         tables = [
             """
             CREATE TABLE IF NOT EXISTS files (
                 file_id TEXT PRIMARY KEY,
                 path TEXT UNIQUE NOT NULL,
                 size INTEGER NOT NULL,
-                created_at TEXT NOT NULL,
-                modified_at TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                modified_at INTEGER NOT NULL,
                 is_deleted INTEGER DEFAULT 0,
-                deleted_at TEXT,
+                deleted_at INTEGER,
                 chunks_json TEXT NOT NULL,
                 compressed INTEGER DEFAULT 0,
                 original_size INTEGER
@@ -87,14 +460,37 @@ class SQLiteMetadataStorage(MetadataStorageBase):
                 free_space INTEGER NOT NULL,
                 total_space INTEGER NOT NULL,
                 chunk_count INTEGER DEFAULT 0,
-                last_heartbeat TEXT NOT NULL,
+                last_heartbeat INTEGER NOT NULL,
                 state TEXT NOT NULL,
                 -- Nuevas columnas para registro automático / ZeroTier
                 zerotier_node_id TEXT,
                 zerotier_ip TEXT,
                 lease_ttl INTEGER DEFAULT 60,
                 boot_token TEXT,
-                version TEXT
+                version TEXT,
+                cpu_pct REAL DEFAULT 0,
+                net_tx_bps REAL DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                file_id TEXT NOT NULL,
+                seq_index INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL UNIQUE,
+                size INTEGER NOT NULL,
+                checksum TEXT,
+                PRIMARY KEY (file_id, seq_index)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS replicas (
+                chunk_id TEXT NOT NULL,
+                node_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                state TEXT NOT NULL,
+                last_heartbeat INTEGER,
+                checksum_verified INTEGER DEFAULT 0,
+                PRIMARY KEY (chunk_id, node_id)
             )
             """,
             """
@@ -103,24 +499,41 @@ class SQLiteMetadataStorage(MetadataStorageBase):
                 path TEXT NOT NULL,
                 operation TEXT NOT NULL,
                 client_id TEXT,
-                expires_at TEXT NOT NULL
+                expires_at INTEGER NOT NULL
             )
             """,
         ]
 
+        # (is_deleted, path) sirve el filtro y el ORDER BY path de list_files;
+        # (state, last_heartbeat) el filtro de get_active_nodes. Las búsquedas
+        # por files.path, chunks.file_id y replicas.chunk_id usan los índices
+        # implícitos de UNIQUE/PRIMARY KEY; replicas(node_id) sirve la
+        # sincronización de heartbeats
         indexes = [
-            "CREATE INDEX IF NOT EXISTS idx_files_path ON files(path)",
-            "CREATE INDEX IF NOT EXISTS idx_files_deleted ON files(is_deleted)",
-            "CREATE INDEX IF NOT EXISTS idx_nodes_state ON nodes(state)",
-            "CREATE INDEX IF NOT EXISTS idx_nodes_heartbeat ON nodes(last_heartbeat)",
+            "CREATE INDEX IF NOT EXISTS idx_files_active_path ON files(is_deleted, path)",
+            "CREATE INDEX IF NOT EXISTS idx_replicas_node ON replicas(node_id)",
+            "CREATE INDEX IF NOT EXISTS idx_nodes_state_heartbeat ON nodes(state, last_heartbeat)",
             "CREATE INDEX IF NOT EXISTS idx_leases_path ON leases(path)",
             "CREATE INDEX IF NOT EXISTS idx_leases_expires ON leases(expires_at)",
         ]
 
+        # Índices reemplazados por los compuestos de arriba, o duplicados de los
+        # implícitos (cada uno era una escritura más por fila insertada)
+        dropped_indexes = [
+            "idx_files_deleted",
+            "idx_nodes_state",
+            "idx_nodes_heartbeat",
+            "idx_files_path",
+            "idx_chunks_file",
+        ]
+
         conn = self._conn
         for table_sql in tables:
             conn.execute(table_sql)
 
+        for index_name in dropped_indexes:
+            conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+
         for index_sql in indexes:
             conn.execute(index_sql)
 
@@ -128,7 +541,9 @@ class SQLiteMetadataStorage(MetadataStorageBase):
 
         # Ejecutar migración ligera: si la tabla nodes existía sin las columnas nuevas,
         # las agregamos con ALTER TABLE (SQLite permite ADD COLUMN).
+        self._migrate_iso_timestamps_if_needed()
         self._migrate_node_table_if_needed()
+        self._migrate_files_table_if_needed()
 
     def _migrate_node_table_if_needed(self) -> None:
         """
@@ -147,6 +562,8 @@ class SQLiteMetadataStorage(MetadataStorageBase):
             ("lease_ttl INTEGER DEFAULT 60", "lease_ttl"),
             ("boot_token TEXT", "boot_token"),
             ("version TEXT", "version"),
+            ("cpu_pct REAL DEFAULT 0", "cpu_pct"),
+            ("net_tx_bps REAL DEFAULT 0", "net_tx_bps"),
         ]
         for col_sql, col_name in needed:
             if col_name not in existing:
@@ -155,73 +572,236 @@ class SQLiteMetadataStorage(MetadataStorageBase):
         conn.commit()
 
 
+    def _detach_iso_timestamp_tables(self) -> None:
+        """
+        Renombra a <tabla>_iso las tablas cuyos timestamps se declararon TEXT
+        (ISO 8601) para que _create_tables las recree con columnas INTEGER. Sus
+        índices se descartan: se vuelven a crear sobre la tabla nueva.
+        """
+        conn = self._conn
+        for table, columns in _TIMESTAMP_COLUMNS.items():
+            types = {
+                row["name"]: row["type"].upper()
+                for row in conn.execute(f"PRAGMA table_info({table})")
+            }
+            if not any(types.get(col) == "TEXT" for col in columns):
+                continue
+
+            indexes = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                (table,),
+            ).fetchall()
+            for index in indexes:
+                conn.execute(f"DROP INDEX {index['name']}")
+            conn.execute(f"ALTER TABLE {table} RENAME TO {table}_iso")
+        conn.commit()
+
+    def _migrate_iso_timestamps_if_needed(self) -> None:
+        """
+        Copia las filas de las tablas <tabla>_iso a la tabla nueva convirtiendo los
+        timestamps a microsegundos. Copia y borrado van en una misma transacción,
+        así una migración interrumpida se retoma en el siguiente arranque.
+        """
+        conn = self._conn
+        for table, columns in _TIMESTAMP_COLUMNS.items():
+            legacy = f"{table}_iso"
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (legacy,),
+            ).fetchone()
+            if not exists:
+                continue
+
+            current = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            names = [
+                row["name"]
+                for row in conn.execute(f"PRAGMA table_info({legacy})")
+                if row["name"] in current
+            ]
+            ts_positions = [i for i, name in enumerate(names) if name in columns]
+
+            rows = []
+            for row in conn.execute(f"SELECT {', '.join(names)} FROM {legacy}"):
+                values = list(row)
+                for i in ts_positions:
+                    values[i] = _iso_to_us(values[i])
+                rows.append(values)
+
+            logger.info("Migración: %d filas de %s a timestamps INTEGER", len(rows), table)
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                rows,
+            )
+            conn.execute(f"DROP TABLE {legacy}")
+            conn.commit()
+
+    def _migrate_files_table_if_needed(self) -> None:
+        """
+        Pasa los chunks guardados dentro de files.chunks_json a las tablas
+        chunks/replicas. Una fila queda migrada cuando su chunks_json está vacío;
+        la migración es idempotente.
+        """
+        conn = self._conn
+        rows = conn.execute(
+            "SELECT file_id, chunks_json FROM files WHERE chunks_json != ''"
+        ).fetchall()
+        if rows:
+            logger.info("Migración: normalizando chunks de %d archivos", len(rows))
+            chunk_rows: List[tuple] = []
+            replica_rows: List[tuple] = []
+            for row in rows:
+                entries = [ChunkEntry(**c) for c in orjson.loads(row["chunks_json"])]
+                chunk_rows.extend(_chunk_rows(row["file_id"], entries))
+                replica_rows.extend(_replica_rows(entries))
+
+            conn.executemany(_SQL_INSERT_CHUNK, chunk_rows)
+            conn.executemany(_SQL_UPSERT_REPLICA, replica_rows)
+            conn.executemany(
+                "UPDATE files SET chunks_json = '' WHERE file_id = ?",
+                [(row["file_id"],) for row in rows],
+            )
+        conn.commit()
+
     async def close(self) -> None:
         """Cierra la conexión"""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
-            logger.info("Conexión de metadata storage cerrada")
+        self._stop_event.set()
+        if self._sweep_task and not self._sweep_task.done():
+            await self._sweep_task
+        self._sweep_task = None
+        self._readers = None
+        for read_conn in self.read_conns:
+            read_conn.close()
+        self.read_conns = []
+        # Espera a que termine una escritura en curso en su hilo
+        async with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+                logger.info("Conexión de metadata storage cerrada")
+
+    async def _stale_node_sweeper(self) -> None:
+        """
+        Task en background que marca INACTIVE los nodos sin heartbeat en
+        node_timeout, cada node_timeout/4 segundos. Registro y heartbeats no
+        hacen este UPDATE en cada llamada. En la misma pasada hace un checkpoint
+        PASSIVE del WAL.
+        """
+        interval = config.node_timeout / 4
+
+        while True:
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                threshold = datetime.now(timezone.utc) - timedelta(
+                    seconds=config.node_timeout
+                )
+                marked = await self._write(self._mark_stale_nodes, _to_us(threshold))
+                if marked > 0:
+                    logger.info("Nodos marcados inactivos: %s", marked)
+            except Exception as e:
+                logger.error(f"Error en barrido de nodos inactivos: {e}")
+
+            try:
+                await self._checkpoint_wal()
+            except Exception as e:
+                logger.error(f"Error en checkpoint del WAL: {e}")
+
+    def _mark_stale_nodes(self, conn: sqlite3.Connection, threshold: int) -> int:
+        cur = conn.execute(
+            _SQL_MARK_STALE_NODES,
+            (NodeState.INACTIVE.value, NodeState.ACTIVE.value, threshold),
+        )
+        conn.commit()
+        return cur.rowcount
+
+    async def _checkpoint_wal(self) -> None:
+        """
+        Checkpoint PASSIVE del WAL: con el goteo constante de heartbeats y los
+        lectores del pool siempre abiertos, el autocheckpoint puede no alcanzar
+        a reiniciar el -wal. PASSIVE no espera a los lectores; como toda
+        escritura, corre en un hilo para que el fsync no bloquee el event loop.
+        """
+        if self._readers is None:
+            return  # Base en memoria: no hay WAL
+
+        busy, wal_pages, checkpointed = await self._write(
+            lambda conn: conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        )
+        logger.debug(
+            "Checkpoint WAL: %s/%s páginas (busy=%s)", checkpointed, wal_pages, busy
+        )
 
     async def create_file_metadata(
         self, path: str, size: int, chunks: List[ChunkTarget], 
         compressed: bool = False, original_size: Optional[int] = None
     ) -> FileMetadata:
         """Crea metadata de archivo"""
-        async with self.lock:
-            file_id = uuid4()
-            now = datetime.now(timezone.utc)
-
-            # Convertir chunks a ChunkEntry sin réplicas aún
-            chunk_entries: List[ChunkEntry] = []
-            for i, chunk_target in enumerate(chunks):
-                chunk_entry = ChunkEntry(
-                    chunk_id=chunk_target.chunk_id,
-                    seq_index=i,
-                    size=chunk_target.size,
-                    replicas=[],  # Se llenarán en commit
-                )
-                chunk_entries.append(chunk_entry)
-
-            file_metadata = FileMetadata(
-                file_id=file_id,
-                path=path,
-                size=size,
-                created_at=now,
-                modified_at=now,
-                chunks=chunk_entries,
-                compressed=compressed,
-                original_size=original_size,
+        file_id = uuid4()
+        now = datetime.now(timezone.utc)
+
+        # Los ChunkTarget ya vienen validados: se construye sin revalidar
+        chunk_entries: List[ChunkEntry] = [
+            ChunkEntry.model_construct(
+                chunk_id=target.chunk_id,
+                seq_index=i,
+                size=target.size,
+                checksum=None,
+                replicas=[],  # Se llenarán en commit
             )
+            for i, target in enumerate(chunks)
+        ]
 
-            chunks_json = json.dumps([c.model_dump(mode="json") for c in chunk_entries])
+        # La validación del modelo queda en el event loop; solo el INSERT va al hilo
+        file_metadata = FileMetadata(
+            file_id=file_id,
+            path=path,
+            size=size,
+            created_at=now,
+            modified_at=now,
+            chunks=chunk_entries,
+            compressed=compressed,
+            original_size=original_size,
+        )
 
-            try:
-                conn = self._conn
-                conn.execute(
-                    """
-                    INSERT INTO files (file_id, path, size, created_at, modified_at, chunks_json, compressed, original_size)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        str(file_id),
-                        path,
-                        size,
-                        now.isoformat(),
-                        now.isoformat(),
-                        chunks_json,
-                        compressed,
-                        original_size,
-                    ),
-                )
-                conn.commit()
+        try:
+            await self._write(self._insert_file, file_metadata)
+        except sqlite3.IntegrityError:
+            raise DFSMetadataError(f"Archivo ya existe: {path}")
+        except Exception as e:
+            raise DFSMetadataError(f"Error creando metadata: {e}")
 
-                logger.info(f"Metadata creada: {path} (ID: {file_id})")
-                return file_metadata
+        logger.info(f"Metadata creada: {path} (ID: {file_id})")
+        return file_metadata
 
-            except sqlite3.IntegrityError:
-                raise DFSMetadataError(f"Archivo ya existe: {path}")
-            except Exception as e:
-                raise DFSMetadataError(f"Error creando metadata: {e}")
+    def _insert_file(
+        self, conn: sqlite3.Connection, file_metadata: FileMetadata
+    ) -> None:
+        file_id = str(file_metadata.file_id)
+        try:
+            conn.execute(
+                """
+                INSERT INTO files (file_id, path, size, created_at, modified_at, chunks_json, compressed, original_size)
+                VALUES (?, ?, ?, ?, ?, '', ?, ?)
+                """,
+                (
+                    file_id,
+                    file_metadata.path,
+                    file_metadata.size,
+                    _to_us(file_metadata.created_at),
+                    _to_us(file_metadata.modified_at),
+                    file_metadata.compressed,
+                    file_metadata.original_size,
+                ),
+            )
+            conn.executemany(_SQL_INSERT_CHUNK, _chunk_rows(file_id, file_metadata.chunks))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
     async def create_chunk_plan(
         self, chunk_size: int, target_nodes: List[str]
@@ -231,151 +811,303 @@ class SQLiteMetadataStorage(MetadataStorageBase):
 
     async def commit_file(self, file_id: UUID, chunks: List[ChunkCommitInfo]) -> bool:
         """Confirma la subida de un archivo"""
-        async with self.lock:
-            try:
-                conn = self._conn
-                # Obtener archivo
-                row = conn.execute(
-                    "SELECT chunks_json FROM files WHERE file_id = ?", (str(file_id),)
-                ).fetchone()
-
-                if not row:
-                    logger.error(f"Archivo no encontrado para commit: {file_id}")
-                    return False
-
-                # Cargar chunks existentes
-                chunk_entries = [
-                    ChunkEntry(**c) for c in json.loads(row["chunks_json"])
-                ]
-                chunk_map = {str(c.chunk_id): c for c in chunk_entries}
-
-                # Obtener información de nodos para construir URLs correctas
-                node_info_map = {}
-                for commit_info in chunks:
-                    for node_id in commit_info.nodes:
-                        if node_id not in node_info_map:
-                            node_row = conn.execute(
-                                "SELECT host, port, zerotier_ip FROM nodes WHERE node_id = ?",
-                                (node_id,)
-                            ).fetchone()
-                            if node_row:
-                                # Usar zerotier_ip si está disponible, sino host
-                                host = node_row["zerotier_ip"] or node_row["host"]
-                                port = node_row["port"]
-                                # Filtrar IPs inválidas
-                                if host and host != "0.0.0.0" and host != "unknown":
-                                    node_info_map[node_id] = f"http://{host}:{port}"
-                                else:
-                                    logger.warning(f"Nodo {node_id} tiene IP inválida: {host}, ignorando")
-
-                # Actualizar chunks con checksums y crear réplicas
-                for commit_info in chunks:
-                    chunk_id_str = str(commit_info.chunk_id)
-                    if chunk_id_str in chunk_map:
-                        chunk = chunk_map[chunk_id_str]
-                        chunk.checksum = commit_info.checksum
-
-                        # Crear réplicas basadas en los nodos reales
-                        chunk.replicas = []
-                        for node_id in commit_info.nodes:
-                            # Solo crear réplica si el nodo tiene URL válida
-                            if node_id in node_info_map:
-                                replica = ReplicaInfo(
-                                    node_id=node_id,
-                                    url=node_info_map[node_id],
-                                    state=ChunkState.COMMITTED,
-                                    last_heartbeat=datetime.now(timezone.utc),
-                                    checksum_verified=True,
-                                )
-                                chunk.replicas.append(replica)
-                            else:
-                                logger.warning(f"No se encontró URL válida para nodo {node_id}, réplica ignorada")
-
-                        logger.debug(
-                            f"Chunk {chunk_id_str}: {len(chunk.replicas)} réplicas"
-                        )
-                    else:
-                        logger.warning(
-                            f"Chunk {chunk_id_str} no encontrado en metadata"
-                        )
+        try:
+            committed = await self._write(self._commit_file, file_id, chunks)
+        except Exception as e:
+            logger.error(f"Error en commit: {e}")
+            return False
 
-                # Guardar
-                chunks_json = json.dumps(
-                    [c.model_dump(mode="json") for c in chunk_entries]
-                )
-                now = datetime.now(timezone.utc).isoformat()
+        if committed:
+            logger.info(f"Commit exitoso para file_id={file_id}, {len(chunks)} chunks")
+        return committed
 
-                conn.execute(
-                    "UPDATE files SET chunks_json = ?, modified_at = ? WHERE file_id = ?",
-                    (chunks_json, now, str(file_id)),
+    def _commit_file(
+        self, conn: sqlite3.Connection, file_id: UUID, chunks: List[ChunkCommitInfo]
+    ) -> bool:
+        try:
+            # Un único timestamp para todas las réplicas y el modified_at
+            now_us = _to_us(datetime.now(timezone.utc))
+            # Actualiza modified_at y comprueba que el archivo existe en un paso
+            updated = conn.execute(
+                "UPDATE files SET modified_at = ? WHERE file_id = ? RETURNING file_id",
+                (now_us, str(file_id)),
+            ).fetchall()
+
+            if not updated:
+                conn.rollback()
+                logger.error(f"Archivo no encontrado para commit: {file_id}")
+                return False
+
+            # Chunks conocidos del archivo
+            known_chunks = {
+                r["chunk_id"]
+                for r in conn.execute(
+                    "SELECT chunk_id FROM chunks WHERE file_id = ?", (str(file_id),)
                 )
-                conn.commit()
+            }
 
-                logger.info(
-                    f"Commit exitoso para file_id={file_id}, {len(chunks)} chunks"
+            # URLs de todos los nodos del commit en una sola consulta
+            node_ids = list({n for c in chunks for n in c.nodes})
+            node_info_map = {}
+            for start in range(0, len(node_ids), _IN_BATCH):
+                batch = node_ids[start:start + _IN_BATCH]
+                placeholders = ", ".join("?" * len(batch))
+                node_rows = conn.execute(
+                    "SELECT node_id, host, port, zerotier_ip FROM nodes "
+                    f"WHERE node_id IN ({placeholders})",
+                    batch,
                 )
-                return True
+                for node_row in node_rows:
+                    # Usar zerotier_ip si está disponible, sino host
+                    host = node_row["zerotier_ip"] or node_row["host"]
+                    # Filtrar IPs inválidas
+                    if host and host != "0.0.0.0" and host != "unknown":
+                        node_info_map[node_row["node_id"]] = f"http://{host}:{node_row['port']}"
+                    else:
+                        logger.warning(f"Nodo {node_row['node_id']} tiene IP inválida: {host}, ignorando")
+
+            # Checksums y réplicas de los chunks confirmados
+            checksum_rows = []
+            committed_chunks = []
+            replica_rows = []
+            for commit_info in chunks:
+                chunk_id_str = str(commit_info.chunk_id)
+                if chunk_id_str not in known_chunks:
+                    logger.warning(
+                        f"Chunk {chunk_id_str} no encontrado en metadata"
+                    )
+                    continue
+
+                checksum_rows.append((commit_info.checksum, chunk_id_str))
+                committed_chunks.append((chunk_id_str,))
+
+                # Crear réplicas basadas en los nodos reales
+                replica_count = 0
+                for node_id in commit_info.nodes:
+                    # Solo crear réplica si el nodo tiene URL válida
+                    if node_id in node_info_map:
+                        replica_rows.append(
+                            (
+                                chunk_id_str,
+                                node_id,
+                                node_info_map[node_id],
+                                ChunkState.COMMITTED.value,
+                                now_us,
+                                1,
+                            )
+                        )
+                        replica_count += 1
+                    else:
+                        logger.warning(f"No se encontró URL válida para nodo {node_id}, réplica ignorada")
 
-            except Exception as e:
-                logger.error(f"Error en commit: {e}")
-                return False
+                logger.debug("Chunk %s: %d réplicas", chunk_id_str, replica_count)
 
-    async def get_file_by_path(self, path: str) -> Optional[FileMetadata]:
+            # Guardar: las réplicas del commit reemplazan a las anteriores del chunk
+            conn.executemany(
+                "UPDATE chunks SET checksum = ? WHERE chunk_id = ?", checksum_rows
+            )
+            conn.executemany(
+                "DELETE FROM replicas WHERE chunk_id = ?", committed_chunks
+            )
+            conn.executemany(_SQL_UPSERT_REPLICA, replica_rows)
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+
+    async def get_file_by_path(
+        self, path: str, load_chunks: bool = True
+    ) -> Optional[FileMetadata]:
         """Obtiene metadata de archivo por path"""
-        async with self.lock:
-            row = self._conn.execute(
-                "SELECT * FROM files WHERE path = ? AND is_deleted = 0", (path,)
-            ).fetchone()
+        return await self._read(self._get_file_by_path, path, load_chunks)
+
+    def _get_file_by_path(
+        self, conn: sqlite3.Connection, path: str, load_chunks: bool = True
+    ) -> Optional[FileMetadata]:
+        row = _tuples(conn, _SQL_FILE_BY_PATH, (path,)).fetchone()
 
-            if not row:
-                return None
+        if not row:
+            return None
+        if not load_chunks:
+            return self._row_to_file_metadata(row, [])
 
-            return self._row_to_file_metadata(row)
+        file_id = row[0]
+        chunks = self._load_chunks(conn, [file_id])
+        return self._row_to_file_metadata(row, chunks.get(file_id, []))
 
     async def list_files(
         self, prefix: Optional[str] = None, limit: int = 100, offset: int = 0
     ) -> List[FileMetadata]:
         """Lista los archivos"""
-        async with self.lock:
-            query = "SELECT * FROM files WHERE is_deleted = 0"
-            params: List = []
+        return await self._read(self._list_files, prefix, limit, offset)
+
+    def _list_files(
+        self,
+        conn: sqlite3.Connection,
+        prefix: Optional[str],
+        limit: int,
+        offset: int,
+    ) -> List[FileMetadata]:
+        where = "is_deleted = 0"
+        params: List = []
+
+        if prefix:
+            where += " AND path LIKE ?"
+            params.append(f"{prefix}%")
+
+        params.extend([limit, offset])
+
+        # La página de archivos y sus chunks/réplicas salen de una sola consulta;
+        # el cursor se recorre sin fetchall() y cada fila se convierte al vuelo
+        cursor = _tuples(
+            conn,
+            f"""
+            SELECT f.file_id, f.path, f.size, f.created_at, f.modified_at,
+                   f.is_deleted, f.deleted_at, f.compressed, f.original_size,
+                   {_SQL_CHUNK_COLUMNS}
+            FROM (
+                SELECT {_FILE_COLUMNS} FROM files WHERE {where}
+                ORDER BY path LIMIT ? OFFSET ?
+            ) f
+            LEFT JOIN chunks c ON c.file_id = f.file_id
+            LEFT JOIN replicas r ON r.chunk_id = c.chunk_id
+            ORDER BY f.path, c.seq_index
+            """,
+            params,
+        )
+
+        files: List[FileMetadata] = []
+        chunks: List[ChunkEntry] = []
+        file_id: Optional[str] = None
+        chunk: Optional[ChunkEntry] = None
+        chunk_id: Optional[str] = None
+        for row in cursor:
+            if row[0] != file_id:
+                file_id = row[0]
+                chunks = []
+                files.append(self._row_to_file_metadata(row, chunks))
+
+            # Las 9 primeras columnas son del archivo, el resto del chunk/réplica
+            cols = row[9:]
+            if cols[0] is None:
+                continue
+            if cols[0] != chunk_id:
+                chunk_id = cols[0]
+                chunk = _chunk_entry(cols)
+                chunks.append(chunk)
+
+            if cols[4] is not None:
+                chunk.replicas.append(_replica_info(cols))
+
+        return files
+
+    async def list_files_summary(
+        self, prefix: Optional[str] = None, limit: int = 100, offset: int = 0
+    ) -> List[FileMetadata]:
+        """Lista los archivos sin chunks (sin JOIN con chunks/replicas)"""
+        return await self._read(self._list_files_summary, prefix, limit, offset)
+
+    def _list_files_summary(
+        self,
+        conn: sqlite3.Connection,
+        prefix: Optional[str],
+        limit: int,
+        offset: int,
+    ) -> List[FileMetadata]:
+        where = "is_deleted = 0"
+        params: List = []
+
+        if prefix:
+            where += " AND path LIKE ?"
+            params.append(f"{prefix}%")
+
+        params.extend([limit, offset])
+
+        cursor = _tuples(
+            conn,
+            f"SELECT {_FILE_COLUMNS} FROM files WHERE {where} ORDER BY path LIMIT ? OFFSET ?",
+            params,
+        )
+        return [self._row_to_file_metadata(row, []) for row in cursor]
+
+    def _load_chunks(
+        self, conn: sqlite3.Connection, file_ids: List[str]
+    ) -> Dict[str, List[ChunkEntry]]:
+        """
+        Carga los chunks (con sus réplicas) de varios archivos con un JOIN por
+        lote de ids, en orden de seq_index.
+        """
+        result: Dict[str, List[ChunkEntry]] = {}
+
+        for start in range(0, len(file_ids), _IN_BATCH):
+            batch = file_ids[start:start + _IN_BATCH]
+            placeholders = ", ".join("?" * len(batch))
+            rows = _tuples(
+                conn,
+                f"""
+                SELECT c.file_id, {_SQL_CHUNK_COLUMNS}
+                FROM chunks c
+                LEFT JOIN replicas r ON r.chunk_id = c.chunk_id
+                WHERE c.file_id IN ({placeholders})
+                ORDER BY c.file_id, c.seq_index
+                """,
+                batch,
+            )
 
-            if prefix:
-                query += " AND path LIKE ?"
-                params.append(f"{prefix}%")
+            current: Optional[ChunkEntry] = None
+            current_id: Optional[str] = None
+            for row in rows:
+                file_id, cols = row[0], row[1:]
+                if cols[0] != current_id:
+                    current_id = cols[0]
+                    current = _chunk_entry(cols)
+                    result.setdefault(file_id, []).append(current)
 
-            query += " ORDER BY path LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+                if cols[4] is not None:
+                    current.replicas.append(_replica_info(cols))
 
-            rows = self._conn.execute(query, params).fetchall()
-            return [self._row_to_file_metadata(row) for row in rows]
+        return result
 
     async def delete_file(self, path: str, permanent: bool = False) -> bool:
         """Elimina un archivo"""
-        async with self.lock:
-            try:
-                conn = self._conn
-                if permanent:
-                    result = conn.execute("DELETE FROM files WHERE path = ?", (path,))
-                else:
-                    now = datetime.now(timezone.utc).isoformat()
-                    result = conn.execute(
-                        "UPDATE files SET is_deleted = 1, deleted_at = ? WHERE path = ? AND is_deleted = 0",
-                        (now, path),
-                    )
+        try:
+            success = await self._write(self._delete_file, path, permanent)
+        except Exception as e:
+            logger.error(f"Error eliminando archivo {path}: {e}")
+            return False
 
-                conn.commit()
-                success = result.rowcount > 0
+        if success:
+            action = "eliminado" if permanent else "marcado como eliminado"
+            logger.info(f"Archivo {action}: {path}")
 
-                if success:
-                    action = "eliminado" if permanent else "marcado como eliminado"
-                    logger.info(f"Archivo {action}: {path}")
+        return success
 
-                return success
+    def _delete_file(self, conn: sqlite3.Connection, path: str, permanent: bool) -> bool:
+        try:
+            if permanent:
+                # Chunks y réplicas del archivo se eliminan junto con la fila
+                deleted = conn.execute(
+                    "DELETE FROM files WHERE path = ? RETURNING file_id", (path,)
+                ).fetchall()
+                file_ids = [(row["file_id"],) for row in deleted]
+                conn.executemany(
+                    "DELETE FROM replicas WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE file_id = ?)",
+                    file_ids,
+                )
+                conn.executemany("DELETE FROM chunks WHERE file_id = ?", file_ids)
+            else:
+                now = _to_us(datetime.now(timezone.utc))
+                deleted = conn.execute(
+                    "UPDATE files SET is_deleted = 1, deleted_at = ? WHERE path = ? AND is_deleted = 0 RETURNING file_id",
+                    (now, path),
+                ).fetchall()
 
-            except Exception as e:
-                logger.error(f"Error eliminando archivo {path}: {e}")
-                return False
+            conn.commit()
+            return bool(deleted)
+        except Exception:
+            conn.rollback()
+            raise
     
     async def register_node(
         self,
@@ -401,95 +1133,65 @@ class SQLiteMetadataStorage(MetadataStorageBase):
         - boot_token: token de bootstrap usado (si quieres guardarlo)
         - rack: etiqueta física/ lógica (opcional)
         """
-        async with self.lock:
-            now = datetime.now(timezone.utc)
-            conn = self._conn
-
-            # Determine host/port from provided data: prefer zerotier_ip and storage port
-            host = zerotier_ip or "unknown"
-            port = 8001
-            if listening_ports and isinstance(listening_ports, dict):
-                try:
-                    port = int(listening_ports.get("storage", port))
-                except Exception:
-                    port = port
-
-            # Normalize capacity fields
-            total_space = int((capacity_gb or 0) * (1024**3)) if capacity_gb is not None else 0
-            free_space = total_space  # al registro inicial asumimos libre = total o 0 según preferencia
-            # Intentamos detectar si ya existe
-            row = conn.execute("SELECT node_id FROM nodes WHERE node_id = ?", (node_id,)).fetchone()
-
-            if row:
-                # Update existing
-                conn.execute(
-                    """
-                    UPDATE nodes SET
-                        zerotier_node_id = ?,
-                        zerotier_ip = ?,
-                        host = ?,
-                        port = ?,
-                        rack = ?,
-                        total_space = ?,
-                        free_space = ?,
-                        version = ?,
-                        boot_token = ?,
-                        lease_ttl = ?,
-                        last_heartbeat = ?,
-                        state = ?
-                    WHERE node_id = ?
-                    """,
-                    (
-                        zerotier_node_id,
-                        zerotier_ip,
-                        host,
-                        port,
-                        rack,
-                        total_space,
-                        free_space,
-                        version,
-                        boot_token,
-                        int(lease_ttl) if lease_ttl is not None else getattr(config, "lease_ttl", 60),
-                        now.isoformat(),
-                        NodeState.ACTIVE.value,
-                        node_id,
-                    ),
-                )
-            else:
-                # Insert new
-                conn.execute(
-                    """
-                    INSERT INTO nodes
-                    (node_id, zerotier_node_id, zerotier_ip, host, port, rack, free_space, total_space, chunk_count, last_heartbeat, state, lease_ttl, version, boot_token)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        node_id,
-                        zerotier_node_id,
-                        zerotier_ip,
-                        host,
-                        port,
-                        rack,
-                        free_space,
-                        total_space,
-                        0,
-                        now.isoformat(),
-                        NodeState.ACTIVE.value,
-                        int(lease_ttl) if lease_ttl is not None else getattr(config, "lease_ttl", 60),
-                        version,
-                        boot_token,
-                    ),
-                )
+        now = datetime.now(timezone.utc)
 
-            # After register, optionally mark stale nodes as INACTIVE by heartbeat threshold (existing logic)
-            threshold = now - timedelta(seconds=config.node_timeout)
-            conn.execute(
-                "UPDATE nodes SET state = ? WHERE last_heartbeat < ?",
-                (NodeState.INACTIVE.value, threshold.isoformat()),
-            )
+        # Determine host/port from provided data: prefer zerotier_ip and storage port
+        host = zerotier_ip or "unknown"
+        port = 8001
+        if listening_ports and isinstance(listening_ports, dict):
+            try:
+                port = int(listening_ports.get("storage", port))
+            except Exception:
+                port = port
+
+        # Normalize capacity fields
+        total_space = int((capacity_gb or 0) * (1024**3)) if capacity_gb is not None else 0
+        free_space = total_space  # al registro inicial asumimos libre = total o 0 según preferencia
+        await self._write(
+            self._upsert_node,
+            (
+                node_id,
+                zerotier_node_id,
+                zerotier_ip,
+                host,
+                port,
+                rack,
+                free_space,
+                total_space,
+                _to_us(now),
+                NodeState.ACTIVE.value,
+                int(lease_ttl) if lease_ttl is not None else getattr(config, "lease_ttl", 60),
+                version,
+                boot_token,
+            ),
+        )
 
-            conn.commit()
-            logger.info("Node registrado/actualizado: %s (%s)", node_id, zerotier_ip)
+        logger.info("Node registrado/actualizado: %s (%s)", node_id, zerotier_ip)
+
+    def _upsert_node(self, conn: sqlite3.Connection, params: tuple) -> None:
+        # Alta o actualización en una sola sentencia, sin sondear si existe
+        conn.execute(
+            """
+            INSERT INTO nodes
+            (node_id, zerotier_node_id, zerotier_ip, host, port, rack, free_space, total_space, chunk_count, last_heartbeat, state, lease_ttl, version, boot_token)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?, ?)
+            ON CONFLICT (node_id) DO UPDATE SET
+                zerotier_node_id = excluded.zerotier_node_id,
+                zerotier_ip = excluded.zerotier_ip,
+                host = excluded.host,
+                port = excluded.port,
+                rack = excluded.rack,
+                total_space = excluded.total_space,
+                free_space = excluded.free_space,
+                version = excluded.version,
+                boot_token = excluded.boot_token,
+                lease_ttl = excluded.lease_ttl,
+                last_heartbeat = excluded.last_heartbeat,
+                state = excluded.state
+            """,
+            params,
+        )
+        conn.commit()
 
 
     async def update_node_heartbeat(
@@ -501,207 +1203,215 @@ class SQLiteMetadataStorage(MetadataStorageBase):
         zerotier_ip: Optional[str] = None,
         zerotier_node_id: Optional[str] = None,
         url: Optional[str] = None,
+        cpu_pct: Optional[float] = None,
+        net_tx_bps: Optional[float] = None,
     ) -> None:
         """Actualiza heartbeat de un nodo con información adicional de ZeroTier"""
-        async with self.lock:
-            now = datetime.now(timezone.utc)
-            threshold = now - timedelta(seconds=config.node_timeout)
+        logger.info(f"Heartbeat de {node_id}: reportando {len(chunk_ids)} chunks")
+        if chunk_ids and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Chunks reportados: %s%s",
+                [str(c) for c in chunk_ids[:5]],
+                "..." if len(chunk_ids) > 5 else "",
+            )
+
+        node_row = _heartbeat_node_row(
+            node_id,
+            free_space,
+            total_space,
+            len(chunk_ids),
+            _to_us(datetime.now(timezone.utc)),
+            zerotier_ip,
+            zerotier_node_id,
+            url,
+            cpu_pct,
+            net_tx_bps,
+        )
+        # Réplicas basadas en los chunks reportados
+        reports: Dict[str, Tuple[Set[str], str]] = {}
+        if chunk_ids:
+            reports[node_id] = (
+                {str(c) for c in chunk_ids},
+                url or f"http://{zerotier_ip or '0.0.0.0'}:{8001}",
+            )
 
-            logger.info(f"Heartbeat de {node_id}: reportando {len(chunk_ids)} chunks")
-            if len(chunk_ids) > 0:
-                logger.debug(f"Chunks reportados: {[str(c) for c in chunk_ids[:5]]}{'...' if len(chunk_ids) > 5 else ''}")
+        await self._write(self._apply_heartbeats, [node_row], reports)
+        logger.debug("Heartbeat actualizado: %s (ZT IP: %s)", node_id, zerotier_ip)
 
-            conn = self._conn
-            # Verifica si el nodo existe
-            row = conn.execute(
-                "SELECT node_id FROM nodes WHERE node_id = ?", (node_id,)
-            ).fetchone()
+    async def bulk_update_node_heartbeats(
+        self, heartbeats: List[HeartbeatRequest]
+    ) -> None:
+        """
+        Aplica un lote de heartbeats en una sola transacción (un commit por volcado).
+        Los nodos se insertan/actualizan con un único executemany del upsert y las
+        réplicas de todos los nodos del lote se sincronizan antes del commit.
+        Si el lote falla se revierte y se reintenta heartbeat a heartbeat.
+        """
+        if not heartbeats:
+            return
+
+        now_us = _to_us(datetime.now(timezone.utc))
+        node_rows = []
+        reports: Dict[str, Tuple[Set[str], str]] = {}
+
+        for hb in heartbeats:
+            node_rows.append(
+                _heartbeat_node_row(
+                    hb.node_id,
+                    hb.free_space,
+                    hb.total_space,
+                    len(hb.chunk_ids),
+                    now_us,
+                    hb.zerotier_ip,
+                    hb.zerotier_node_id,
+                    hb.url,
+                    hb.cpu_pct,
+                    hb.net_tx_bps,
+                )
+            )
 
-            if row:
-                # Preparar campos para actualización
-                update_fields = [
-                    "free_space = ?",
-                    "total_space = ?",
-                    "chunk_count = ?",
-                    "last_heartbeat = ?",
-                    "state = ?"
-                ]
-                update_values = [
-                    free_space,
-                    total_space,
-                    len(chunk_ids),
-                    now.isoformat(),
-                    NodeState.ACTIVE.value,
-                ]
-                
-                # Agregar campos opcionales si están presentes
-                # SIEMPRE actualizar host si hay zerotier_ip válida
-                if zerotier_ip and zerotier_ip.strip() and zerotier_ip != "0.0.0.0":
-                    update_fields.append("zerotier_ip = ?")
-                    update_values.append(zerotier_ip)
-                    update_fields.append("host = ?")
-                    update_values.append(zerotier_ip)
-                    logger.info(f"Actualizando host de {node_id} a {zerotier_ip}")
-                else:
-                    logger.debug(f"Heartbeat sin ZeroTier IP válida para {node_id}")
-                
-                if zerotier_node_id and zerotier_node_id.strip():
-                    update_fields.append("zerotier_node_id = ?")
-                    update_values.append(zerotier_node_id)
-                
-                if url:
-                    # Extraer puerto de la URL si está presente
-                    try:
-                        port_from_url = int(url.split(":")[-1].split("/")[0])
-                        update_fields.append("port = ?")
-                        update_values.append(port_from_url)
-                    except (ValueError, IndexError):
-                        pass
-                
-                update_values.append(node_id)
-                
-                query = f"UPDATE nodes SET {', '.join(update_fields)} WHERE node_id = ?"
-                conn.execute(query, tuple(update_values))
-                
-            else:
-                # Inserta un nuevo nodo
-                host = zerotier_ip if zerotier_ip else "0.0.0.0"
-                port = 8001  # Puerto por defecto
-                
-                # Intentar extraer puerto de la URL
-                if url:
-                    try:
-                        port = int(url.split(":")[-1].split("/")[0])
-                    except (ValueError, IndexError):
-                        pass
-
-                conn.execute(
-                    """
-                    INSERT INTO nodes 
-                    (node_id, host, port, zerotier_ip, zerotier_node_id, free_space, total_space, chunk_count, last_heartbeat, state)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        node_id,
-                        host,
-                        port,
-                        zerotier_ip,
-                        zerotier_node_id,
-                        free_space,
-                        total_space,
-                        len(chunk_ids),
-                        now.isoformat(),
-                        NodeState.ACTIVE.value,
-                    ),
+            if hb.chunk_ids:
+                reports[hb.node_id] = (
+                    {str(c) for c in hb.chunk_ids},
+                    hb.url or f"http://{hb.zerotier_ip or '0.0.0.0'}:{8001}",
                 )
 
-            # Marca los nodos inactivos
-            conn.execute(
-                "UPDATE nodes SET state = ? WHERE last_heartbeat < ?",
-                (NodeState.INACTIVE.value, threshold.isoformat()),
-            )
+        try:
+            await self._write(self._apply_heartbeats, node_rows, reports)
+        except Exception as e:
+            logger.error(f"Error aplicando lote de {len(heartbeats)} heartbeats: {e}")
+            # Reintento uno a uno: un heartbeat inválido no descarta el resto
+            await super().bulk_update_node_heartbeats(heartbeats)
+            return
+
+        logger.debug("Lote de heartbeats aplicado: %d nodos", len(heartbeats))
+
+    def _apply_heartbeats(
+        self,
+        conn: sqlite3.Connection,
+        node_rows: List[tuple],
+        reports: Dict[str, Tuple[Set[str], str]],
+    ) -> None:
+        """
+        Upsert de los nodos (filas de _heartbeat_node_row) y sincronización de
+        sus réplicas en una sola transacción, con un único commit.
+        """
+        try:
+            # Toma el lock de escritura de SQLite al inicio: con una transacción
+            # diferida, el paso de lectura a escritura puede fallar con
+            # SQLITE_BUSY sin esperar busy_timeout si otro proceso escribe
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(_SQL_UPSERT_NODE_HEARTBEAT, node_rows)
 
-            # Actualizar réplicas basadas en los chunks reportados
-            if chunk_ids:
-                await self._update_replicas_from_heartbeat(node_id, chunk_ids, url or f"http://{zerotier_ip or '0.0.0.0'}:{8001}")
+            if reports:
+                self._sync_replicas_from_heartbeats(conn, reports)
 
             conn.commit()
-            logger.debug(f"Heartbeat actualizado: {node_id} (ZT IP: {zerotier_ip})")
-    
-    async def _update_replicas_from_heartbeat(self, node_id: str, chunk_ids: List[UUID], node_url: str) -> None:
+        except Exception:
+            # Sin rollback la transacción quedaría abierta y el siguiente
+            # commit de otro escritor confirmaría el heartbeat a medias
+            conn.rollback()
+            raise
+
+    def _sync_replicas_from_heartbeats(
+        self, conn: sqlite3.Connection, reports: Dict[str, Tuple[Set[str], str]]
+    ) -> None:
         """
-        Actualiza las réplicas de los chunks basándose en lo reportado por el heartbeat.
-        Este método es la "fuente de verdad" - sincroniza el estado real del nodo:
-        - Marca como committed los chunks que el nodo SÍ tiene
-        - ELIMINA las réplicas de chunks que el nodo YA NO tiene
+        Sincroniza la tabla replicas con lo reportado por uno o más heartbeats.
+        `reports` mapea node_id -> (chunk_ids reportados, url del nodo). Por nodo:
+        - Marca como committed (y actualiza la URL) las réplicas de los chunks que SÍ tiene
+        - ELIMINA las réplicas de chunks que YA NO tiene
+        Solo considera chunks de archivos no eliminados. Debe llamarse con el lock
+        tomado y dentro de la transacción del caller.
         """
-        conn = self._conn
-        
-        # Obtener todos los archivos que no están eliminados
-        rows = conn.execute(
-            "SELECT file_id, chunks_json FROM files WHERE is_deleted = 0"
-        ).fetchall()
-        
-        chunk_ids_str = {str(c) for c in chunk_ids}
-        updated_files = 0
-        replicas_added = 0
-        replicas_removed = 0
-        
-        for row in rows:
-            file_id = row["file_id"]
-            chunks_data = json.loads(row["chunks_json"])
-            file_modified = False
-            
-            for chunk in chunks_data:
-                chunk_id = chunk.get("chunk_id")
-                replicas = chunk.get("replicas", [])
-                
-                # Si este nodo reporta tener este chunk
-                if chunk_id in chunk_ids_str:
-                    # Buscar si ya existe una réplica para este nodo
-                    replica_exists = False
-                    for replica in replicas:
-                        if replica.get("node_id") == node_id:
-                            # Actualizar réplica existente
-                            if replica.get("state") != "committed":
-                                replica["state"] = "committed"
-                                file_modified = True
-                            if replica.get("url") != node_url:
-                                replica["url"] = node_url
-                                file_modified = True
-                            replica_exists = True
-                            break
-                    
-                    # Si no existe, agregarla
-                    if not replica_exists:
-                        replicas.append({
-                            "node_id": node_id,
-                            "url": node_url,
-                            "state": "committed",
-                            "checksum_verified": False
-                        })
-                        chunk["replicas"] = replicas
-                        file_modified = True
-                        replicas_added += 1
-                        logger.debug(f"Agregada réplica de chunk {chunk_id} en nodo {node_id}")
-                
-                else:
-                    # El nodo NO reporta tener este chunk
-                    # Eliminar la réplica si existía (el nodo ya no tiene el chunk)
-                    original_count = len(replicas)
-                    replicas = [r for r in replicas if r.get("node_id") != node_id]
-                    
-                    if len(replicas) < original_count:
-                        chunk["replicas"] = replicas
-                        file_modified = True
-                        replicas_removed += 1
-                        logger.warning(
-                            f"ELIMINADA réplica de chunk {chunk_id} de nodo {node_id} "
-                            f"(no reportada en heartbeat - posible pérdida de datos)"
-                        )
-            
-            # Actualizar el archivo si se modificó
-            if file_modified:
-                conn.execute(
-                    "UPDATE files SET chunks_json = ?, modified_at = ? WHERE file_id = ?",
-                    (json.dumps(chunks_data), datetime.now(timezone.utc).isoformat(), file_id)
-                )
-                updated_files += 1
-        
-        if updated_files > 0 or replicas_added > 0 or replicas_removed > 0:
+        # Todo el lote se carga de una vez en tablas temporales (executemany) y
+        # se sincroniza con un único upsert y un único DELETE, sin sentencias
+        # por nodo
+        conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS reporting_nodes "
+            "(node_id TEXT PRIMARY KEY, url TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS reported_replicas "
+            "(node_id TEXT NOT NULL, chunk_id TEXT NOT NULL, PRIMARY KEY (node_id, chunk_id))"
+        )
+        conn.execute("DELETE FROM reporting_nodes")
+        conn.execute("DELETE FROM reported_replicas")
+        conn.executemany(
+            "INSERT INTO reporting_nodes (node_id, url) VALUES (?, ?)",
+            [(node_id, node_url) for node_id, (_, node_url) in reports.items()],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO reported_replicas (node_id, chunk_id) VALUES (?, ?)",
+            [
+                (node_id, chunk_id)
+                for node_id, (chunk_ids_str, _) in reports.items()
+                for chunk_id in chunk_ids_str
+            ],
+        )
+
+        # Solo se escriben las réplicas nuevas o cuyo estado/URL cambió
+        cur = conn.execute(
+            """
+            INSERT INTO replicas (chunk_id, node_id, url, state, last_heartbeat, checksum_verified)
+            SELECT c.chunk_id, n.node_id, n.url, ?, NULL, 0
+            FROM reported_replicas rr
+            JOIN reporting_nodes n ON n.node_id = rr.node_id
+            JOIN chunks c ON c.chunk_id = rr.chunk_id
+            JOIN files f ON f.file_id = c.file_id
+            WHERE f.is_deleted = 0
+            ON CONFLICT (chunk_id, node_id) DO UPDATE SET
+                state = excluded.state,
+                url = excluded.url
+            WHERE replicas.state != excluded.state OR replicas.url != excluded.url
+            """,
+            (ChunkState.COMMITTED.value,),
+        )
+        replicas_synced = max(cur.rowcount, 0)
+
+        # Recorre solo las réplicas de los nodos del lote (idx_replicas_node) y
+        # comprueba cada chunk por clave; un IN sobre todos los chunks vivos
+        # escanearía la tabla chunks completa en cada heartbeat
+        removed_by_node: Dict[str, int] = {}
+        for (node_id,) in conn.execute(
+            """
+            DELETE FROM replicas
+            WHERE node_id IN (SELECT node_id FROM reporting_nodes)
+              AND NOT EXISTS (
+                  SELECT 1 FROM reported_replicas rr
+                  WHERE rr.node_id = replicas.node_id AND rr.chunk_id = replicas.chunk_id
+              )
+              AND EXISTS (
+                  SELECT 1 FROM chunks c
+                  JOIN files f ON f.file_id = c.file_id
+                  WHERE c.chunk_id = replicas.chunk_id AND f.is_deleted = 0
+              )
+            RETURNING node_id
+            """
+        ).fetchall():
+            removed_by_node[node_id] = removed_by_node.get(node_id, 0) + 1
+
+        for node_id, removed in removed_by_node.items():
+            logger.warning(
+                f"ELIMINADAS {removed} réplicas de nodo {node_id} "
+                f"(no reportadas en heartbeat - posible pérdida de datos)"
+            )
+        replicas_removed = sum(removed_by_node.values())
+
+        if replicas_synced > 0 or replicas_removed > 0:
             logger.info(
-                f"Sincronización de réplicas desde heartbeat de {node_id}: "
-                f"{updated_files} archivos actualizados, "
-                f"+{replicas_added} réplicas agregadas, "
+                f"Sincronización de réplicas desde {len(reports)} heartbeats: "
+                f"{replicas_synced} réplicas agregadas/actualizadas, "
                 f"-{replicas_removed} réplicas eliminadas"
             )
 
     async def get_node(self, node_id: str) -> Optional[NodeInfo]:
         """Obtiene información de un nodo"""
-        # Lectura simple sin lock
-        row = self._conn.execute(
-            "SELECT * FROM nodes WHERE node_id = ?", (node_id,)
-        ).fetchone()
+        return await self._read(self._get_node, node_id)
+
+    def _get_node(self, conn: sqlite3.Connection, node_id: str) -> Optional[NodeInfo]:
+        row = _tuples(conn, _SQL_NODE_BY_ID, (node_id,)).fetchone()
 
         if not row:
             return None
@@ -710,30 +1420,29 @@ class SQLiteMetadataStorage(MetadataStorageBase):
 
     async def list_nodes(self) -> List[NodeInfo]:
         """Lista todos los nodos"""
-        # Lectura simple sin lock (SQLite soporta lecturas concurrentes)
-        rows = self._conn.execute(
-            "SELECT * FROM nodes ORDER BY last_heartbeat DESC"
-        ).fetchall()
+        return await self._read(self._list_nodes)
+
+    def _list_nodes(self, conn: sqlite3.Connection) -> List[NodeInfo]:
+        rows = _tuples(conn, _SQL_LIST_NODES).fetchall()
 
         return [self._row_to_node_info(row) for row in rows]
 
     async def get_active_nodes(self) -> List[NodeInfo]:
         """Obtiene nodos activos"""
-        # Lectura simple sin lock
-        threshold = (
+        threshold = _to_us(
             datetime.now(timezone.utc) - timedelta(seconds=config.node_timeout)
-        ).isoformat()
+        )
 
-        rows = self._conn.execute(
-            """
-            SELECT * FROM nodes 
-            WHERE state = ? AND last_heartbeat > ?
-            ORDER BY free_space DESC
-            """,
-            (NodeState.ACTIVE.value, threshold),
+        return await self._read(self._get_active_nodes, threshold)
+
+    def _get_active_nodes(
+        self, conn: sqlite3.Connection, threshold: int
+    ) -> List[NodeInfo]:
+        rows = _tuples(
+            conn, _SQL_ACTIVE_NODES, (NodeState.ACTIVE.value, threshold)
         ).fetchall()
-        
-        logger.info(f"Active nodes found: {rows}")
+
+        logger.debug("Active nodes found: %d", len(rows))
 
         return [self._row_to_node_info(row) for row in rows]
 
@@ -741,146 +1450,138 @@ class SQLiteMetadataStorage(MetadataStorageBase):
         self, path: str, operation: str, timeout_seconds: int
     ) -> Optional[LeaseResponse]:
         """Adquiere un lease"""
-        async with self.lock:
-            await self.cleanup_expired_leases()
-
-            now = datetime.now(timezone.utc)
-
-            # Verifica si ya existe un lease activo
-            row = self._conn.execute(
-                "SELECT lease_id FROM leases WHERE path = ? AND expires_at > ?",
-                (path, now.isoformat()),
-            ).fetchone()
+        now = datetime.now(timezone.utc)
+        lease_id = uuid4()
+        expires_at = now + timedelta(seconds=timeout_seconds)
 
-            if row:
-                return None  # Ya existe un lease activo
+        acquired = await self._write(
+            self._insert_lease,
+            (str(lease_id), path, operation, _to_us(expires_at), path, _to_us(now)),
+        )
+        if not acquired:
+            return None  # Ya existe un lease activo
 
-            # Crea un nuevo lease
-            lease_id = uuid4()
-            expires_at = now + timedelta(seconds=timeout_seconds)
+        logger.info(f"Lease adquirido: {path} (ID: {lease_id})")
+        return LeaseResponse(lease_id=lease_id, path=path, expires_at=expires_at)
 
-            self._conn.execute(
-                """
-                INSERT INTO leases (lease_id, path, operation, expires_at)
-                VALUES (?, ?, ?, ?)
-                """,
-                (str(lease_id), path, operation, expires_at.isoformat()),
+    def _insert_lease(self, conn: sqlite3.Connection, params: tuple) -> bool:
+        # Limpieza de expirados e inserción condicional con un único commit
+        self._cleanup_expired_leases(conn, params[-1])
+        result = conn.execute(
+            """
+            INSERT INTO leases (lease_id, path, operation, expires_at)
+            SELECT ?, ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM leases WHERE path = ? AND expires_at > ?
             )
-            self._conn.commit()
-
-            logger.info(f"Lease adquirido: {path} (ID: {lease_id})")
-            return LeaseResponse(lease_id=lease_id, path=path, expires_at=expires_at)
+            """,
+            params,
+        )
+        conn.commit()
+        return result.rowcount > 0
 
     async def release_lease(self, lease_id: UUID) -> bool:
         """Libera un lease"""
-        async with self.lock:
-            result = self._conn.execute(
-                "DELETE FROM leases WHERE lease_id = ?", (str(lease_id),)
-            )
-            self._conn.commit()
+        success = await self._write(self._delete_lease, str(lease_id))
+        if success:
+            logger.info(f"Lease liberado: {lease_id}")
 
-            success = result.rowcount > 0
-            if success:
-                logger.info(f"Lease liberado: {lease_id}")
+        return success
 
-            return success
+    def _delete_lease(self, conn: sqlite3.Connection, lease_id: str) -> bool:
+        released = conn.execute(
+            "DELETE FROM leases WHERE lease_id = ? RETURNING lease_id", (lease_id,)
+        ).fetchall()
+        conn.commit()
+        return bool(released)
 
     async def cleanup_expired_leases(self) -> None:
         """Limpia leases expirados"""
-        async with self.lock:
-            now = datetime.now(timezone.utc).isoformat()
-            result = self._conn.execute(
-                "DELETE FROM leases WHERE expires_at <= ?", (now,)
-            )
+        await self._write(self._purge_expired_leases, _to_us(datetime.now(timezone.utc)))
+
+    def _purge_expired_leases(self, conn: sqlite3.Connection, now: int) -> None:
+        self._cleanup_expired_leases(conn, now)
+        conn.commit()
 
-            if result.rowcount > 0:
-                logger.debug(f"Limpiados {result.rowcount} leases expirados")
+    def _cleanup_expired_leases(self, conn: sqlite3.Connection, now: int) -> None:
+        """Borra los leases expirados; el llamador ya tiene self.lock y hace el commit"""
+        result = conn.execute(
+            "DELETE FROM leases WHERE expires_at <= ?", (now,)
+        )
 
-    def _row_to_file_metadata(self, row) -> FileMetadata:
-        """Convierte una fila de la BD a FileMetadata"""
-        chunks = [ChunkEntry(**c) for c in json.loads(row["chunks_json"])]
+        if result.rowcount > 0:
+            logger.debug("Limpiados %s leases expirados", result.rowcount)
 
-        return FileMetadata(
-            file_id=UUID(row["file_id"]),
-            path=row["path"],
-            size=row["size"],
-            created_at=datetime.fromisoformat(row["created_at"]),
-            modified_at=datetime.fromisoformat(row["modified_at"]),
+    def _row_to_file_metadata(self, row: tuple, chunks: List[ChunkEntry]) -> FileMetadata:
+        """
+        Convierte una fila de files (columnas de _FILE_COLUMNS, más sus chunks ya
+        cargados) a FileMetadata. Los valores ya tienen su tipo final, así que se
+        omite la validación.
+        """
+        (
+            file_id,
+            path,
+            size,
+            created_at,
+            modified_at,
+            is_deleted,
+            deleted_at,
+            compressed,
+            original_size,
+        ) = row[:9]
+
+        return FileMetadata.model_construct(
+            file_id=UUID(file_id),
+            path=path,
+            size=size,
+            created_at=_from_us(created_at),
+            modified_at=_from_us(modified_at),
             chunks=chunks,
-            is_deleted=bool(row["is_deleted"]),
-            deleted_at=datetime.fromisoformat(row["deleted_at"])
-            if row["deleted_at"]
-            else None,
-            compressed=bool(row.get("compressed", 0)),
-            original_size=row.get("original_size"),
+            is_deleted=bool(is_deleted),
+            deleted_at=_from_us(deleted_at) if deleted_at else None,
+            compressed=bool(compressed),
+            original_size=original_size,
         )
 
-    def _row_to_node_info(self, row) -> NodeInfo:
-        """Convierte una fila de la BD a NodeInfo"""
-        # Preferir zerotier_ip sobre host si está disponible
-        row = dict(row)
-        host = row.get("zerotier_ip") or row["host"]
-        
-        return NodeInfo(
-            node_id=row["node_id"],
-            host=host,  # Usar ZeroTier IP si está disponible
-            port=row["port"],
-            rack=row["rack"],
-            free_space=row["free_space"],
-            total_space=row["total_space"],
-            chunk_count=row["chunk_count"],
-            last_heartbeat=datetime.fromisoformat(row["last_heartbeat"]),
-            state=NodeState(row["state"]),
+    def _row_to_node_info(self, row: tuple) -> NodeInfo:
+        """Convierte una fila de nodes (columnas de _NODE_COLUMNS) a NodeInfo"""
+        (
+            node_id,
+            host,
+            port,
+            rack,
+            free_space,
+            total_space,
+            chunk_count,
+            last_heartbeat,
+            state,
+            zerotier_ip,
+            cpu_pct,
+            net_tx_bps,
+        ) = row
+
+        return NodeInfo.model_construct(
+            node_id=node_id,
+            host=zerotier_ip or host,  # Preferir la IP de ZeroTier si está disponible
+            port=port,
+            rack=rack,
+            free_space=free_space,
+            total_space=total_space,
+            chunk_count=chunk_count,
+            last_heartbeat=_from_us(last_heartbeat),
+            state=NodeState(state),
+            cpu_pct=cpu_pct or 0.0,
+            net_tx_bps=net_tx_bps or 0.0,
         )
 
-    def _node_id_to_url(self, node_id: str) -> str:
-        """Convierte node_id a URL"""
-        host, port = self._parse_node_id(node_id)
-        return f"http://{host}:{port}"
-
-    def _parse_node_id(self, node_id: str) -> Tuple[str, int]:
-        """Parsea node_id para extraer host y puerto"""
-        parts = node_id.split("-")
-        if len(parts) >= 3:
-            host = parts[1]
-            try:
-                port = int(parts[2])
-                return host, port
-            except ValueError:
-                pass
-        return "localhost", 8001
-
     async def get_system_stats(self) -> dict:
         """Obtiene estadísticas del sistema"""
-        async with self.lock:
-            # Estadísticas de archivos
-            files_row = self._conn.execute(
-                "SELECT COUNT(*) as count, SUM(size) as total_size FROM files WHERE is_deleted = 0"
-            ).fetchone()
+        return await self._read(self._system_stats)
 
-            # Estadísticas de chunks
-            total_chunks = 0
-            total_size = files_row["total_size"] or 0
-
-            files = await self.list_files(limit=10000)
-            for file in files:
-                total_chunks += len(file.chunks)
-
-            # Estadísticas de nodos
-            nodes = await self.list_nodes()
-            active_nodes = [n for n in nodes if n.state == NodeState.ACTIVE]
-
-            total_space = sum(n.total_space for n in active_nodes)
-            free_space = sum(n.free_space for n in active_nodes)
-            used_space = total_space - free_space
-
-            return {
-                "total_files": files_row["count"],
-                "total_chunks": total_chunks,
-                "total_size": total_size,
-                "total_nodes": len(nodes),
-                "active_nodes": len(active_nodes),
-                "total_space": total_space,
-                "used_space": used_space,
-                "free_space": free_space,
-            }
+    def _system_stats(self, conn: sqlite3.Connection) -> dict:
+        # Todo se agrega en SQL y la fila ya tiene la forma del resultado: no se
+        # decodifica ningún archivo, no se instancian nodos ni se opera en Python
+        row = conn.execute(
+            _SQL_SYSTEM_STATS, {"active": NodeState.ACTIVE.value}
+        ).fetchone()
+        return dict(row)
@@ -4,6 +4,7 @@ Sistema de monitoreo y métricas para DFS
 
 from .metrics import (
     metrics_endpoint,
+    make_metrics_app,
     MetricsMiddleware,
     update_system_metrics,
     update_datanode_metrics,
@@ -29,6 +30,7 @@ from .health import (
 
 __all__ = [
     "metrics_endpoint",
+    "make_metrics_app",
     "MetricsMiddleware",
     "update_system_metrics",
     "update_datanode_metrics",
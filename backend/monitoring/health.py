@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional
@@ -31,9 +32,11 @@ class HealthChecker:
             HealthResponse con el estado del sistema
         """
         try:
-            checks = await self._perform_health_checks()
+            # Checks y detalles del sistema son independientes: se solapan
+            checks, details = await asyncio.gather(
+                self._perform_health_checks(), self._get_system_details()
+            )
             overall_status = self._determine_overall_status(checks)
-            details = await self._get_system_details()
 
             health_response = HealthResponse(
                 status=overall_status,
@@ -63,24 +66,23 @@ class HealthChecker:
 
     async def _perform_health_checks(self) -> Dict[str, Any]:
         """Realiza checks de salud individuales"""
-        checks = {}
-
-        # Check de storage
-        checks["storage"] = await self._check_storage_health()
-
-        # Check de replicación
-        checks["replication"] = await self._check_replication_health()
-
-        # Check de leases
-        checks["leases"] = await self._check_leases_health()
-
-        # Check de nodos
-        checks["nodes"] = await self._check_nodes_health()
-
-        # Check de conectividad
-        checks["connectivity"] = await self._check_connectivity()
-
-        return checks
+        # Cada check captura sus propios errores y no depende de los demás:
+        # se lanzan a la vez en lugar de encadenar sus consultas al storage
+        storage, replication, leases, nodes, connectivity = await asyncio.gather(
+            self._check_storage_health(),
+            self._check_replication_health(),
+            self._check_leases_health(),
+            self._check_nodes_health(),
+            self._check_connectivity(),
+        )
+
+        return {
+            "storage": storage,
+            "replication": replication,
+            "leases": leases,
+            "nodes": nodes,
+            "connectivity": connectivity,
+        }
 
     async def _check_storage_health(self) -> Dict[str, Any]:
         """Verifica la salud del storage"""
@@ -88,9 +90,11 @@ class HealthChecker:
             return {"status": "unknown", "reason": "Storage no configurado"}
 
         try:
-            # Verifica que podemos acceder al storage
-            nodes = await self.storage.get_active_nodes()
-            files = await self.storage.list_files(limit=1)
+            # Verifica que podemos acceder al storage (lecturas independientes)
+            nodes, files = await asyncio.gather(
+                self.storage.get_active_nodes(),
+                self.storage.list_files_summary(limit=1),
+            )
 
             return {
                 "status": "healthy",
@@ -150,23 +154,18 @@ class HealthChecker:
             return {"status": "unknown", "reason": "Storage no configurado"}
 
         try:
-            all_nodes = await self.storage.list_nodes()
-            active_nodes = await self.storage.get_active_nodes()
-
-            # Verificar capacidad
-            total_capacity = sum(node.total_space for node in active_nodes)
-            free_capacity = sum(node.free_space for node in active_nodes)
-            used_capacity = total_capacity - free_capacity
-
-            node_health = "healthy"
-            if len(active_nodes) < config.replication_factor:
-                node_health = "degraded"
-            elif len(active_nodes) == 0:
-                node_health = "unhealthy"
+            # Las dos lecturas son independientes: se solapan
+            all_nodes, active_nodes = await asyncio.gather(
+                self.storage.list_nodes(), self.storage.get_active_nodes()
+            )
 
-            # Verificar nodos individuales
+            # Capacidad y detalle de nodos en una sola pasada
+            total_capacity = 0
+            free_capacity = 0
             node_details = []
             for node in active_nodes:
+                total_capacity += node.total_space
+                free_capacity += node.free_space
                 node_details.append(
                     {
                         "node_id": node.node_id,
@@ -175,6 +174,13 @@ class HealthChecker:
                         "last_heartbeat": node.last_heartbeat.isoformat(),
                     }
                 )
+            used_capacity = total_capacity - free_capacity
+
+            node_health = "healthy"
+            if len(active_nodes) < config.replication_factor:
+                node_health = "degraded"
+            elif len(active_nodes) == 0:
+                node_health = "unhealthy"
 
             return {
                 "status": node_health,
@@ -2,6 +2,7 @@
 Sistema de métricas y monitoreo - Versión completa
 """
 
+import os
 import time
 from typing import Dict, Any
 
@@ -10,6 +11,8 @@ from prometheus_client import (
     Gauge,
     Histogram,
     generate_latest,
+    make_asgi_app,
+    multiprocess,
     CONTENT_TYPE_LATEST,
     CollectorRegistry,
 )
@@ -147,8 +150,13 @@ replication_lag = Gauge(
     registry=registry,
 )
 
-# Métricas de leases
-active_leases = Gauge("dfs_active_leases", "Number of active leases", registry=registry)
+# Métricas de leases (el LeaseManager la actualiza en cada alta/baja: valor instantáneo)
+active_leases = Gauge(
+    "dfs_active_leases",
+    "Number of active leases",
+    registry=registry,
+    multiprocess_mode="livesum",  # Suma de los workers vivos en modo multiproceso
+)
 
 
 def metrics_endpoint():
@@ -156,6 +164,36 @@ def metrics_endpoint():
     return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
 
 
+class MetricsApp:
+    """
+    Envoltorio de la app ASGI de prometheus_client. Starlette trata como handler
+    de request a las funciones pasadas a Route; una instancia de clase se
+    registra tal cual como app ASGI.
+    """
+
+    __slots__ = ("app",)
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+
+def make_metrics_app() -> MetricsApp:
+    """
+    App ASGI de exposición Prometheus para registrar como Route("/metrics").
+    El scrape se sirve sin pasar por un handler de FastAPI. Con
+    PROMETHEUS_MULTIPROC_DIR definido (varios workers de gunicorn) las métricas
+    de todos los procesos se agregan con MultiProcessCollector.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess_registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(multiprocess_registry)
+        return MetricsApp(make_asgi_app(registry=multiprocess_registry))
+    return MetricsApp(make_asgi_app(registry=registry))
+
+
 class MetricsMiddleware:
     """Middleware para capturar métricas de requests HTTP"""
 
@@ -170,8 +208,8 @@ class MetricsMiddleware:
         method = scope["method"]
         path = self._normalize_path(scope["path"])
 
-        # Ignorar el endpoint de métricas
-        if path == "/metrics":
+        # Ignorar el endpoint de métricas (sin atrapar otras rutas como /metricsfoo)
+        if path == "/metrics" or path.startswith("/metrics/"):
             await self.app(scope, receive, send)
             return
 
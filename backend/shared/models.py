@@ -81,6 +81,8 @@ class NodeInfo(BaseModel):
     chunk_count: int = 0
     last_heartbeat: datetime = Field(default_factory=datetime.utcnow)
     state: NodeState = NodeState.ACTIVE
+    cpu_pct: float = 0.0  # Carga de CPU reportada en el último heartbeat (0-100)
+    net_tx_bps: float = 0.0  # Tráfico de red saliente reportado (bytes/s)
 
 
 class UploadInitRequest(BaseModel):
@@ -137,7 +139,8 @@ class CommitRequest(BaseModel):
 class HeartbeatRequest(BaseModel):
     """Request de heartbeat de un DataNode"""
 
-    model_config = ConfigDict(from_attributes=True)
+    # Inmutable: la instancia validada se guarda tal cual en el buffer de heartbeats
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
     node_id: str
     free_space: int
@@ -146,6 +149,8 @@ class HeartbeatRequest(BaseModel):
     url: Optional[str] = None  # URL pública del DataNode
     zerotier_ip: Optional[str] = None  # IP de ZeroTier
     zerotier_node_id: Optional[str] = None  # ID del nodo en ZeroTier
+    cpu_pct: Optional[float] = None  # Carga de CPU del nodo (0-100)
+    net_tx_bps: Optional[float] = None  # Tráfico de red saliente (bytes/s)
 
 
 class LeaseRequest(BaseModel):
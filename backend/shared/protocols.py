@@ -2,22 +2,33 @@
 Protocolos y interfaces para el sistema DFS
 """
 
+import logging
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import AsyncIterator, Callable, List, Optional
 from uuid import UUID
 
 from shared.models import (
     FileMetadata,
+    HeartbeatRequest,
     NodeInfo,
     ChunkTarget,
     ChunkCommitInfo,
     LeaseResponse,
 )
 
+logger = logging.getLogger(__name__)
+
 
 class MetadataStorageBase(ABC):
     """Clase base abstracta para implementaciones de metadata storage"""
-    
+
+    def add_stats_listener(self, callback: Callable[[], None]) -> None:
+        """
+        Registra un callback a invocar cuando cualquier proceso cambia los
+        agregados de get_system_stats (archivos, nodos). Por defecto no hace
+        nada: sin notificaciones entre procesos las caches dependen de su TTL.
+        """
+
     @abstractmethod
     async def initialize(self) -> None:
         """Inicializa la base de datos"""
@@ -49,8 +60,13 @@ class MetadataStorageBase(ABC):
         pass
     
     @abstractmethod
-    async def get_file_by_path(self, path: str) -> Optional[FileMetadata]:
-        """Obtiene metadata de archivo por path"""
+    async def get_file_by_path(
+        self, path: str, load_chunks: bool = True
+    ) -> Optional[FileMetadata]:
+        """
+        Obtiene metadata de archivo por path.
+        Con load_chunks=False la lista de chunks queda vacía y no se cargan.
+        """
         pass
     
     @abstractmethod
@@ -59,6 +75,26 @@ class MetadataStorageBase(ABC):
     ) -> List[FileMetadata]:
         """Lista los archivos"""
         pass
+
+    async def list_files_summary(
+        self, prefix: Optional[str] = None, limit: int = 100, offset: int = 0
+    ) -> List[FileMetadata]:
+        """
+        Lista los archivos sin sus chunks (solo las columnas del archivo).
+        Implementación por defecto: list_files con los chunks descartados.
+        """
+        files = await self.list_files(prefix=prefix, limit=limit, offset=offset)
+        return [f.model_copy(update={"chunks": []}) for f in files]
+
+    async def iter_files(
+        self, prefix: Optional[str] = None, limit: int = 100
+    ) -> AsyncIterator[FileMetadata]:
+        """
+        Recorre los archivos (con chunks) de a uno, para escaneos completos que
+        solo necesitan una pasada. Implementación por defecto: sobre list_files.
+        """
+        for f in await self.list_files(prefix=prefix, limit=limit):
+            yield f
     
     @abstractmethod
     async def delete_file(self, path: str, permanent: bool = False) -> bool:
@@ -91,10 +127,35 @@ class MetadataStorageBase(ABC):
         zerotier_ip: Optional[str] = None,
         zerotier_node_id: Optional[str] = None,
         url: Optional[str] = None,
+        cpu_pct: Optional[float] = None,
+        net_tx_bps: Optional[float] = None,
     ) -> None:
         """Actualiza heartbeat de un nodo"""
         pass
     
+    async def bulk_update_node_heartbeats(
+        self, heartbeats: List[HeartbeatRequest]
+    ) -> None:
+        """
+        Aplica un lote de heartbeats acumulados.
+        Implementación por defecto: uno a uno; un fallo no descarta el resto del lote.
+        """
+        for hb in heartbeats:
+            try:
+                await self.update_node_heartbeat(
+                    node_id=hb.node_id,
+                    free_space=hb.free_space,
+                    total_space=hb.total_space,
+                    chunk_ids=hb.chunk_ids,
+                    zerotier_ip=hb.zerotier_ip,
+                    zerotier_node_id=hb.zerotier_node_id,
+                    url=hb.url,
+                    cpu_pct=hb.cpu_pct,
+                    net_tx_bps=hb.net_tx_bps,
+                )
+            except Exception as e:
+                logger.error(f"Error aplicando heartbeat de {hb.node_id}: {e}")
+
     @abstractmethod
     async def get_node(self, node_id: str) -> Optional[NodeInfo]:
         """Obtiene información de un nodo"""
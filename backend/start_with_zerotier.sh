@@ -131,12 +131,9 @@ fi
 
 log ""
 log "================================================"
-log "  Iniciando servidor Uvicorn en puerto $PORT"
+log "  Iniciando Gunicorn (workers Uvicorn) en puerto $PORT"
 log "================================================"
 log ""
 
-# Iniciar el servidor
-exec uvicorn metadata.server:app \
-    --host 0.0.0.0 \
-    --port $PORT \
-    --log-level info
\ No newline at end of file
+# Iniciar el servidor (gunicorn.conf.py lee PORT y WEB_CONCURRENCY)
+exec gunicorn metadata.server:app -c gunicorn.conf.py
\ No newline at end of file
@@ -0,0 +1,340 @@
+"""
+Tests de migración del storage de metadata: una base con el esquema anterior
+(chunks dentro de files.chunks_json) se abre con el backend actual y sus
+archivos, chunks y réplicas deben seguir disponibles.
+
+Los tests de SQLite usan un archivo temporal con el esquema original (timestamps
+TEXT en ISO 8601). Los de PostgreSQL solo corren si DFS_TEST_POSTGRES_URL apunta
+a una base de pruebas (cada test usa un schema propio y lo borra al terminar).
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+
+from core.exceptions import DFSMetadataError
+from shared.models import ChunkState
+
+POSTGRES_TEST_URL = os.getenv("DFS_TEST_POSTGRES_URL")
+
+requires_postgres = pytest.mark.skipif(
+    not POSTGRES_TEST_URL, reason="DFS_TEST_POSTGRES_URL no configurada"
+)
+
+# Tablas tal como las creaba la versión anterior del backend SQLite
+_LEGACY_SQLITE_TABLES = [
+    """
+    CREATE TABLE files (
+        file_id TEXT PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL,
+        size INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        modified_at TEXT NOT NULL,
+        is_deleted INTEGER DEFAULT 0,
+        deleted_at TEXT,
+        chunks_json TEXT NOT NULL,
+        compressed INTEGER DEFAULT 0,
+        original_size INTEGER
+    )
+    """,
+    """
+    CREATE TABLE nodes (
+        node_id TEXT PRIMARY KEY,
+        host TEXT NOT NULL,
+        port INTEGER NOT NULL,
+        rack TEXT,
+        free_space INTEGER NOT NULL,
+        total_space INTEGER NOT NULL,
+        chunk_count INTEGER DEFAULT 0,
+        last_heartbeat TEXT NOT NULL,
+        state TEXT NOT NULL,
+        zerotier_node_id TEXT,
+        zerotier_ip TEXT,
+        lease_ttl INTEGER DEFAULT 60,
+        boot_token TEXT,
+        version TEXT
+    )
+    """,
+    """
+    CREATE TABLE leases (
+        lease_id TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        operation TEXT NOT NULL,
+        client_id TEXT,
+        expires_at TEXT NOT NULL
+    )
+    """,
+]
+
+# Tabla files tal como la creaba la versión anterior del backend PostgreSQL
+_LEGACY_PG_FILES = """
+    CREATE TABLE files (
+        file_id UUID PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL,
+        size BIGINT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL,
+        modified_at TIMESTAMPTZ NOT NULL,
+        is_deleted BOOLEAN DEFAULT FALSE,
+        deleted_at TIMESTAMPTZ,
+        chunks_json JSONB NOT NULL,
+        compressed BOOLEAN DEFAULT FALSE,
+        original_size BIGINT
+    )
+"""
+
+
+def legacy_chunks(count: int, nodes=("node-a", "node-b")) -> list:
+    """Lista de chunks con el formato de chunks_json (ChunkEntry.model_dump(mode="json"))"""
+    return [
+        {
+            "chunk_id": str(uuid4()),
+            "seq_index": i,
+            "size": 1024,
+            "checksum": f"checksum-{i}",
+            "replicas": [
+                {
+                    "node_id": node_id,
+                    "url": f"http://{node_id}:8001",
+                    "state": ChunkState.COMMITTED.value,
+                    "last_heartbeat": "2024-01-01T00:00:00+00:00",
+                    "checksum_verified": True,
+                }
+                for node_id in nodes
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def assert_same_chunks(file_metadata, chunks: list) -> None:
+    """Compara los chunks cargados por el storage con los de chunks_json"""
+    assert [str(c.chunk_id) for c in file_metadata.chunks] == [c["chunk_id"] for c in chunks]
+    for loaded, legacy in zip(file_metadata.chunks, chunks):
+        assert loaded.seq_index == legacy["seq_index"]
+        assert loaded.size == legacy["size"]
+        assert loaded.checksum == legacy["checksum"]
+        assert sorted(r.node_id for r in loaded.replicas) == sorted(
+            r["node_id"] for r in legacy["replicas"]
+        )
+        assert all(r.state == ChunkState.COMMITTED for r in loaded.replicas)
+
+
+@pytest.fixture
+def legacy_sqlite_db(tmp_path):
+    """Archivo SQLite con el esquema anterior; devuelve (path, conn)"""
+    db_path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    for table_sql in _LEGACY_SQLITE_TABLES:
+        conn.execute(table_sql)
+    conn.commit()
+    yield db_path, conn
+    conn.close()
+
+
+def insert_legacy_sqlite_file(conn, path: str, chunks: list, created_at: datetime) -> None:
+    conn.execute(
+        """
+        INSERT INTO files (file_id, path, size, created_at, modified_at, chunks_json)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (
+            str(uuid4()),
+            path,
+            sum(c["size"] for c in chunks),
+            created_at.isoformat(),
+            created_at.isoformat(),
+            json.dumps(chunks),
+        ),
+    )
+    conn.commit()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_migrates_baseline_schema(legacy_sqlite_db):
+    """Test: archivos, chunks, réplicas, nodos y leases sobreviven a la migración"""
+    from metadata.storage.storage_with_sqlite import SQLiteMetadataStorage
+
+    db_path, conn = legacy_sqlite_db
+    created_at = datetime(2024, 1, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    heartbeat = datetime.now(timezone.utc)
+    lease_expires = heartbeat + timedelta(hours=1)
+
+    chunks = legacy_chunks(3)
+    insert_legacy_sqlite_file(conn, "/legacy/a.bin", chunks, created_at)
+    insert_legacy_sqlite_file(conn, "/legacy/empty.bin", [], created_at)
+    conn.execute(
+        """
+        INSERT INTO nodes (node_id, host, port, free_space, total_space,
+                           chunk_count, last_heartbeat, state)
+        VALUES ('node-a', '10.0.0.1', 8001, 100, 200, 3, ?, 'active')
+        """,
+        (heartbeat.isoformat(),),
+    )
+    conn.execute(
+        "INSERT INTO leases (lease_id, path, operation, expires_at) VALUES (?, ?, 'write', ?)",
+        (str(uuid4()), "/legacy/locked.bin", lease_expires.isoformat()),
+    )
+    conn.commit()
+
+    storage = SQLiteMetadataStorage(db_path)
+    await storage.initialize()
+    try:
+        file_metadata = await storage.get_file_by_path("/legacy/a.bin")
+        assert file_metadata is not None
+        assert file_metadata.created_at == created_at
+        assert_same_chunks(file_metadata, chunks)
+        replica = file_metadata.chunks[0].replicas[0]
+        assert replica.last_heartbeat == datetime(2024, 1, 1, tzinfo=timezone.utc)
+        assert replica.checksum_verified
+
+        empty = await storage.get_file_by_path("/legacy/empty.bin")
+        assert empty is not None and empty.chunks == []
+
+        node = await storage.get_node("node-a")
+        assert node is not None
+        assert node.last_heartbeat == heartbeat
+        assert node.cpu_pct == 0.0
+
+        # El lease migrado sigue vigente y bloquea el path
+        assert await storage.acquire_lease("/legacy/locked.bin", "write", 30) is None
+    finally:
+        await storage.close()
+
+    assert {row[0] for row in conn.execute("SELECT chunks_json FROM files")} == {""}
+    assert conn.execute("SELECT count(*) FROM chunks").fetchone()[0] == 3
+    assert conn.execute("SELECT count(*) FROM replicas").fetchone()[0] == 6
+    assert {row[0] for row in conn.execute("SELECT typeof(created_at) FROM files")} == {"integer"}
+
+
+@pytest.mark.asyncio
+async def test_sqlite_migration_is_idempotent(legacy_sqlite_db):
+    """Test: reabrir una base ya migrada no duplica chunks ni réplicas"""
+    from metadata.storage.storage_with_sqlite import SQLiteMetadataStorage
+
+    db_path, conn = legacy_sqlite_db
+    chunks = legacy_chunks(2)
+    insert_legacy_sqlite_file(conn, "/legacy/a.bin", chunks, datetime.now(timezone.utc))
+
+    for _ in range(2):
+        storage = SQLiteMetadataStorage(db_path)
+        await storage.initialize()
+        try:
+            file_metadata = await storage.get_file_by_path("/legacy/a.bin")
+            assert_same_chunks(file_metadata, chunks)
+        finally:
+            await storage.close()
+
+    assert conn.execute("SELECT count(*) FROM chunks").fetchone()[0] == 2
+    assert conn.execute("SELECT count(*) FROM replicas").fetchone()[0] == 4
+
+
+@pytest.mark.asyncio
+async def test_sqlite_concurrent_reads_and_writes_after_migration(legacy_sqlite_db):
+    """Test: lecturas del pool y escrituras en hilo concurrentes sobre la base migrada"""
+    from metadata.storage.storage_with_sqlite import SQLiteMetadataStorage
+
+    db_path, conn = legacy_sqlite_db
+    chunks = legacy_chunks(4)
+    insert_legacy_sqlite_file(conn, "/legacy/a.bin", chunks, datetime.now(timezone.utc))
+
+    storage = SQLiteMetadataStorage(db_path)
+    await storage.initialize()
+    try:
+        reads = [storage.get_file_by_path("/legacy/a.bin") for _ in range(20)]
+        writes = [storage.create_file_metadata(f"/new/{i}.bin", 0, []) for i in range(10)]
+        results = await asyncio.gather(*reads, *writes)
+
+        for file_metadata in results[:20]:
+            assert_same_chunks(file_metadata, chunks)
+        for i in range(10):
+            assert await storage.get_file_by_path(f"/new/{i}.bin") is not None
+    finally:
+        await storage.close()
+
+
+@pytest.fixture
+async def legacy_pg_schema():
+    """Schema vacío con la tabla files del esquema anterior; devuelve (conn, url)"""
+    asyncpg = pytest.importorskip("asyncpg")
+    schema = f"dfs_test_{uuid4().hex[:12]}"
+    conn = await asyncpg.connect(POSTGRES_TEST_URL)
+    await conn.execute(f"CREATE SCHEMA {schema}")
+    await conn.execute(f"SET search_path TO {schema}")
+    await conn.execute(_LEGACY_PG_FILES)
+
+    # asyncpg pasa los parámetros desconocidos del DSN como server_settings
+    separator = "&" if "?" in POSTGRES_TEST_URL else "?"
+    yield conn, f"{POSTGRES_TEST_URL}{separator}search_path={schema}"
+
+    await conn.execute(f"DROP SCHEMA {schema} CASCADE")
+    await conn.close()
+
+
+async def insert_legacy_pg_file(conn, path: str, chunks: list) -> None:
+    now = datetime.now(timezone.utc)
+    await conn.execute(
+        """
+        INSERT INTO files (file_id, path, size, created_at, modified_at, chunks_json)
+        VALUES ($1, $2, $3, $4, $4, $5::jsonb)
+        """,
+        uuid4(),
+        path,
+        sum(c["size"] for c in chunks),
+        now,
+        json.dumps(chunks),
+    )
+
+
+@requires_postgres
+@pytest.mark.asyncio
+async def test_postgres_migrates_legacy_chunks_json(legacy_pg_schema):
+    """Test: los chunks de chunks_json pasan a chunks/replicas y la columna se conserva"""
+    from metadata.storage.storage_with_postgress import PostgresMetadataStorage
+
+    conn, url = legacy_pg_schema
+    chunks = legacy_chunks(3)
+    await insert_legacy_pg_file(conn, "/legacy/a.bin", chunks)
+
+    storage = PostgresMetadataStorage(url)
+    await storage.initialize()
+    try:
+        file_metadata = await storage.get_file_by_path("/legacy/a.bin")
+        assert file_metadata is not None
+        assert_same_chunks(file_metadata, chunks)
+
+        # Las altas nuevas funcionan con la columna heredada (NOT NULL)
+        await storage.create_file_metadata("/legacy/new.bin", 0, [])
+    finally:
+        await storage.close()
+
+    remaining = await conn.fetch("SELECT chunks_json::text AS chunks FROM files")
+    assert {row["chunks"] for row in remaining} == {"[]"}
+
+
+@requires_postgres
+@pytest.mark.asyncio
+async def test_postgres_migration_aborts_on_conflicting_chunks(legacy_pg_schema):
+    """Test: un chunk_id repetido aborta la migración sin vaciar chunks_json"""
+    from metadata.storage.storage_with_postgress import PostgresMetadataStorage
+
+    conn, url = legacy_pg_schema
+    chunks = legacy_chunks(2)
+    await insert_legacy_pg_file(conn, "/legacy/a.bin", chunks)
+    await insert_legacy_pg_file(conn, "/legacy/b.bin", chunks[:1])
+
+    storage = PostgresMetadataStorage(url)
+    with pytest.raises(DFSMetadataError):
+        await storage.initialize()
+    await storage.close()
+
+    assert await conn.fetchval("SELECT count(*) FROM chunks") == 0
+    stored = await conn.fetchval(
+        "SELECT chunks_json FROM files WHERE path = '/legacy/a.bin'"
+    )
+    assert [c["chunk_id"] for c in json.loads(stored)] == [c["chunk_id"] for c in chunks]